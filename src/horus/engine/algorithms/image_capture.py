@@ -8,6 +8,7 @@ __license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.ht
 import cv2
 import numpy as np
 import time
+import platform
 
 from horus.util import profile
 
@@ -123,6 +124,38 @@ class ImageCapture(object):
         self._flush_stream_pattern = pattern
         self._flush_stream_mode = mode
 
+    def flush_profile_key(self):
+        # flush values are measured per camera device and resolution
+        return u'{0} {1}x{2}'.format(profile.settings['camera_id'],
+                                    self.driver.camera._width, self.driver.camera._height)
+
+    def default_flush_values(self):
+        # Per OS defaults (texture, laser, pattern, mode)
+        return profile.settings['flush_' + platform.system().lower()]
+
+    def read_flush_profile(self):
+        # Per OS defaults, overridden by values measured by flush calibration
+        # for current camera and resolution
+        system = platform.system().lower()
+        texture, laser, pattern, mode = self.default_flush_values()
+        self.set_flush_values(texture, laser, pattern, mode)
+        texture, laser, pattern, mode = profile.settings['flush_stream_' + system]
+        self.set_flush_stream_values(texture, laser, pattern, mode)
+
+        measured = profile.settings['flush_calibrated'].get(self.flush_profile_key())
+        if measured is not None:
+            scene, settings = measured
+            self.set_flush_values(scene, scene, scene, settings)
+            # stream texture and mode change keep preview defaults
+            self.set_flush_stream_values(texture, scene, scene, mode)
+            logger.info("Flush calibrated: scene {0} settings {1}".format(scene, settings))
+
+    def save_flush_profile(self, scene, settings):
+        measured = dict(profile.settings['flush_calibrated'])
+        measured[self.flush_profile_key()] = [int(scene), int(settings)]
+        profile.settings['flush_calibrated'] = measured
+        self.read_flush_profile()
+
     def set_remove_background(self, value):
         self._remove_background = value
 
@@ -288,8 +321,8 @@ class ImageCapture(object):
         image = self.capture_image(flush=flush)
         return image
 
-    def capture_image(self, flush=0):
-        image = self.driver.camera.capture_image(flush=flush)
+    def capture_image(self, flush=0, reduce=1):
+        image = self.driver.camera.capture_image(flush=flush, reduce=reduce)
         return image
 
     def remove_background_subtract(self,images):
@@ -14,8 +14,6 @@ from horus import Singleton
 from horus.engine.calibration.calibration_data import CalibrationData
 from horus.engine.algorithms.point_cloud_roi import PointCloudROI
 
-from horus.gui.util.augmented_view import augmented_platform_mask
-
 from horus.util import profile
 
 @Singleton
@@ -33,6 +31,14 @@ class LaserSegmentation(object):
         self.window_enable = False
         self.window_value = 0
         self.refinement_method = 'SGF'
+        self.pyramid_scale = 1
+        self.multi_peak_enable = False
+        self.confidence_value = 0
+        self.peak_count = 3
+        self.peak_neighbours = 51
+
+        self._hsv_base_lut = None
+        self._hsv_lut = None
 
     def read_profile(self, mode):
         self.laser_color_detector = profile.settings['laser_color_detector_'+mode]
@@ -43,6 +49,9 @@ class LaserSegmentation(object):
         self.window_enable = profile.settings['window_enable_'+mode]
         self.window_value = profile.settings['window_value_'+mode]
         self.refinement_method = profile.settings['refinement_'+mode]
+        self.set_pyramid(profile.settings['pyramid_'+mode])
+        self.multi_peak_enable = profile.settings['multi_peak_enable_'+mode]
+        self.set_confidence_value(profile.settings['confidence_value_'+mode])
 
     def set_laser_color_detector(self, value):
         self.laser_color_detector = value
@@ -68,13 +77,56 @@ class LaserSegmentation(object):
     def set_refinement_method(self, value):
         self.refinement_method = value
 
+    def set_pyramid(self, value):
+        # 'None', '2x', '4x'
+        if value == '2x':
+            self.pyramid_scale = 2
+        elif value == '4x':
+            self.pyramid_scale = 4
+        else:
+            self.pyramid_scale = 1
+
+    def set_multi_peak_enable(self, value):
+        self.multi_peak_enable = value
+
+    def set_confidence_value(self, value):
+        self.confidence_value = value / 100.
+
     def compute_2d_points(self, image):
         if image is not None:
-            image = self.compute_line_segmentation(image)
+            (u, v, confidence), image = self.compute_2d_points_confidence(image)
+            return (u, v), image
+
+    def compute_2d_points_confidence(self, image):
+        # returns (u, v, confidence), image
+        #   confidence [0..1] of the selected peak for each v row
+        #   (1 if multi peak detection is disabled)
+        if image is not None:
+            if self.pyramid_scale > 1:
+                (rows, cols, band, c), image = self.compute_line_segmentation_pyramid(image)
+                s = np.zeros(image.shape[0])
+                s[rows] = band.sum(axis=1)
+                m = np.zeros(image.shape[0])
+                m[rows] = (cols * band).sum(axis=1)
+                if c is not None:
+                    confidence = np.zeros(image.shape[0])
+                    confidence[rows] = c
+                else:
+                    confidence = None
+            else:
+                image, confidence = self._compute_line_segmentation(image)
+                s = image.sum(axis=1)
+                m = (self.calibration_data.weight_matrix * image).sum(axis=1)
+            # Drop ambiguous rows
+            if confidence is not None:
+                s[confidence < self.confidence_value] = 0
             # Peak detection: center of mass
-            s = image.sum(axis=1)
             v = np.where(s > 0)[0]
-            u = (self.calibration_data.weight_matrix * image).sum(axis=1)[v] / s[v]
+            u = m[v] / s[v]
+            if confidence is not None:
+                confidence = confidence[v]
+            else:
+                confidence = np.ones(len(v))
             if self.refinement_method == 'SGF':
                 # Segmented gaussian filter
                 u = self._sgf(u, s)
@@ -83,7 +135,7 @@ class LaserSegmentation(object):
                 u = self._ransac(u, v)
             # Saturate u
             u = np.clip(u, 0, self.calibration_data.width - 1)
-            return (u, v), image
+            return (u, v, confidence), image
 
     def compute_hough_lines(self, image):
         if image is not None:
@@ -98,21 +150,87 @@ class LaserSegmentation(object):
 
     def compute_line_segmentation(self, image):
         if image is not None:
-            # Apply ROI mask
+            return self._compute_line_segmentation(image)[0]
+
+    def _compute_line_segmentation(self, image):
+        # Apply ROI mask
+        image = self.point_cloud_roi.mask_image(image)
+        image = self._obtain_laser_image(image)
+        image = self._threshold_image(image)
+        return self._peak_mask(image)
+
+    def compute_line_segmentation_pyramid(self, image):
+        # Coarse-to-fine segmentation:
+        #   locate the stripe on a downsampled image, then segment
+        #   only a thin band around it at full resolution
+        #   returns (rows, cols, band, confidence), image
+        #     band - segmented laser intensity at image[rows, cols]
+        #     confidence - per row, None if multi peak detection is disabled
+        if image is not None:
+            f = self.pyramid_scale
+            height, width = image.shape[:2]
             image = self.point_cloud_roi.mask_image(image)
-            image = self._obtain_laser_image(image)
-            image = self._threshold_image(image)
-            image = self._window_mask(image)
-            return image
+
+            # Coarse pass: every f-th row, max pooled columns to keep thin stripes
+            w = width - width % f
+            small = image[::f, 0:w:f].copy()
+            for i in xrange(1, f):
+                np.maximum(small, image[::f, i:w:f], out=small)
+            small = self._obtain_laser_image(small)
+            if self.threshold_enable:
+                small = cv2.threshold(small, self.threshold_value, 255, cv2.THRESH_TOZERO)[1]
+            found = small.max(axis=1) > 0
+            if self.multi_peak_enable:
+                peak, confidence = self._select_peaks(small, self.window_value // f)
+            else:
+                peak, confidence = small.argmax(axis=1), None
+            peak = peak * f + f // 2
+
+            # Interpolate the peak between the coarse rows around each full resolution row
+            lo = np.arange(height) // f
+            hi = np.minimum(lo + 1, len(peak) - 1)
+            rows = np.where(found[lo] | found[hi])[0]
+            lo, hi = lo[rows], hi[rows]
+            peak = np.where(found[lo], peak[lo], peak[hi]) + np.where(found[hi], peak[hi], peak[lo])
+            peak = peak // 2
+            if confidence is not None:
+                # interpolate between coarse rows, take found one if other is empty
+                c_lo = np.where(found[lo], confidence[lo], confidence[hi])
+                c_hi = np.where(found[hi], confidence[hi], confidence[lo])
+                t = (rows % f) / float(f)
+                confidence = c_lo * (1 - t) + c_hi * t
+
+            # Fine pass inside the band around the coarse peak
+            if self.window_enable:
+                half = self.window_value + f
+            else:
+                half = 3 * f
+            if self.blur_enable:
+                half += self.blur_value // 2
+            size = min(2 * half + 1, width)
+            start = np.clip(peak - half, 0, width - size)
+            cols = start[:, np.newaxis] + np.arange(size)
+            if len(rows) > 0:
+                band = self._threshold_band(image, rows, cols)
+                band = self._peak_mask(band)[0]
+            else:
+                band = np.zeros(cols.shape, np.uint8)
+
+            # Segmented image for display
+            image = np.zeros((height, width), np.uint8)
+            image[rows[:, np.newaxis], cols] = band
+            return (rows, cols, band, confidence), image
 
     def compute_line_segmentation_bg(self, image, avoid_platform = False):
-        mask = image.copy()
-        mask = self._obtain_laser_image(mask)
+        mask = self._obtain_laser_image(image)
         mask = self._threshold_image(mask)
         mask = self._window_mask(mask)
 
         ret, mask = cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY)
         if avoid_platform:
+            # imported on use: augmented_view imports horus.gui.engine,
+            # which imports this module
+            from horus.gui.util.augmented_view import augmented_platform_mask
             mask = cv2.bitwise_and(mask, augmented_platform_mask(mask))
         image = cv2.subtract(image, self.threshold_value, mask=mask)
 
@@ -121,41 +239,52 @@ class LaserSegmentation(object):
     def _obtain_laser_image(self, image):
         ret = None
         if self.laser_color_detector == 'R (RGB)':
-            ret = cv2.split(image)[0]
+            ret = cv2.extractChannel(image, 0)
 
         elif self.laser_color_detector == 'G (RGB)':
-            ret = cv2.split(image)[1]
+            ret = cv2.extractChannel(image, 1)
 
         elif self.laser_color_detector == 'B (RGB)':
-            ret = cv2.split(image)[2]
+            ret = cv2.extractChannel(image, 2)
 
         elif self.laser_color_detector == 'R (HSV)':
-            ret = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-            # lower mask (0-10)
+            # 'V' of red hue pixels (0-10, 160-180) above threshold
             # TODO Use separate threshold value or 0 for 'V'
-            lower_red = np.array([0,50,self.threshold_value])
-            upper_red = np.array([10,255,255])
-            mask0 = cv2.inRange(ret, lower_red, upper_red)
-
-            # upper mask (170-180)
-            lower_red = np.array([160,50,self.threshold_value])
-            upper_red = np.array([180,255,255])
-            mask1 = cv2.inRange(ret, lower_red, upper_red)
-
-            # join masks
-            mask = mask0+mask1
-
-            ret = cv2.split(ret)[2]
-            ret[np.where(mask==0)] = 0
+            lut = self._red_hsv_lut(self.threshold_value)
+            idx = image[:, :, 0].astype(np.int32) << 16
+            idx |= image[:, :, 1].astype(np.int32) << 8
+            idx |= image[:, :, 2]
+            ret = lut.take(idx)
 
         elif self.laser_color_detector == 'Cr (YCrCb)':
-            ret = cv2.split(cv2.cvtColor(image, cv2.COLOR_RGB2YCR_CB))[1]
+            ret = cv2.extractChannel(cv2.cvtColor(image, cv2.COLOR_RGB2YCR_CB), 1)
 
         elif self.laser_color_detector == 'U (YUV)':
-            ret = cv2.split(cv2.cvtColor(image, cv2.COLOR_RGB2YUV))[1]
+            ret = cv2.extractChannel(cv2.cvtColor(image, cv2.COLOR_RGB2YUV), 1)
 
         return ret
 
+    def _red_hsv_lut(self, threshold):
+        # Flat RGB -> laser intensity LUT for 'R (HSV)' detector
+        # indexed by (r << 16) | (g << 8) | b
+        if self._hsv_lut is None or self._hsv_lut[0] != threshold:
+            if self._hsv_base_lut is None:
+                self._hsv_base_lut = self._compute_red_hsv_lut()
+            lut = self._hsv_base_lut
+            self._hsv_lut = (threshold, np.where(lut >= threshold, lut, 0).astype(np.uint8))
+        return self._hsv_lut[1]
+
+    def _compute_red_hsv_lut(self):
+        lut = np.empty((256, 256, 256), np.uint8)
+        image = np.empty((256, 256, 3), np.uint8)
+        image[:, :, 1] = np.arange(256)[:, np.newaxis]
+        image[:, :, 2] = np.arange(256)[np.newaxis, :]
+        for r in xrange(256):
+            image[:, :, 0] = r
+            h, s, v = cv2.split(cv2.cvtColor(image, cv2.COLOR_RGB2HSV))
+            lut[r] = np.where(((h <= 10) | (h >= 160)) & (s >= 50), v, 0)
+        return lut.ravel()
+
     def _threshold_image(self, image):
         if self.threshold_enable:
             if image is not None:
@@ -167,17 +296,93 @@ class LaserSegmentation(object):
                     image, self.threshold_value, 255, cv2.THRESH_TOZERO)[1]
         return image
 
-    def _window_mask(self, image):
-        if self.window_enable:
+    def _threshold_band(self, image, rows, cols):
+        # Laser image and threshold sampled at image[rows, cols]
+        # Band rows are not aligned, so the box blur is done
+        # in image coordinates: one sampled band per kernel row
+        if not (self.threshold_enable and self.blur_enable):
+            return self._threshold_image(
+                self._obtain_laser_image(image[rows[:, np.newaxis], cols]))
+
+        height = image.shape[0]
+        k = self.blur_value // 2
+        band = np.zeros(cols.shape, np.float32)
+        for i in xrange(-k, k + 1):
+            # Reflect 101 border like cv2.blur
+            r = np.abs(rows + i)
+            r = np.where(r >= height, 2 * (height - 1) - r, r)
+            b = self._obtain_laser_image(image[r[:, np.newaxis], cols])
+            b = cv2.threshold(b, self.threshold_value, 255, cv2.THRESH_TOZERO)[1]
+            band += cv2.blur(np.float32(b), (self.blur_value, 1))
+        band = np.uint8(np.around(band / self.blur_value))
+        return cv2.threshold(band, self.threshold_value, 255, cv2.THRESH_TOZERO)[1]
+
+    def _peak_mask(self, image):
+        # returns masked image, confidence
+        if self.multi_peak_enable:
+            peak, confidence = self._select_peaks(image, self.window_value)
+            # Always keep only the selected peak
+            return self._window_mask(image, peak), confidence
+        return self._window_mask(image), None
+
+    def _select_peaks(self, image, radius):
+        # Multi peak detection:
+        #   top-k intensity peaks of each row scored by intensity, width
+        #   and distance to the strongest peaks of the neighbouring rows
+        #   returns selected peak column and confidence [0..1] per row
+        height, width = image.shape
+        radius = max(radius, 1)
+        k = min(self.peak_count, width)
+        rows = np.arange(height)[:, np.newaxis]
+
+        # Row local maxima (left edge of plateaus) at least radius apart
+        local_max = cv2.dilate(image, np.ones((1, 2 * radius + 1), np.uint8))
+        candidates = np.where(image == local_max, image, 0)
+        candidates[:, 1:][image[:, 1:] == image[:, :-1]] = 0
+        cols = np.argpartition(candidates, width - k, axis=1)[:, width - k:]
+        values = np.float32(candidates[rows, cols])
+        valid = values.max(axis=1) > 0
+        if not valid.any():
+            return np.zeros(height, int), np.zeros(height)
+
+        # Equivalent width: intensity area around the peak / peak value
+        area = np.cumsum(image, axis=1, dtype=np.int32)
+        left = cols - radius - 1
+        widths = area[rows, np.minimum(cols + radius, width - 1)] - \
+            np.where(left >= 0, area[rows, np.maximum(left, 0)], 0)
+        widths = widths / np.maximum(values, 1)
+        strongest = values.argmax(axis=1)
+        expected = max(np.median(widths[valid, strongest[valid]]), 1)
+        width_score = np.exp(-((widths - expected) / expected) ** 2)
+
+        # Distance to the median strongest peak of the neighbouring rows,
+        # one pixel offset is column quantization (coarse pyramid pass)
+        reference = np.float32(cols[rows[:, 0], strongest])
+        reference[valid] = scipy.ndimage.median_filter(
+            reference[valid], size=self.peak_neighbours)
+        distance = np.maximum(np.abs(cols - reference[:, np.newaxis]) - 1, 0) / (2. * radius)
+        geometry_score = np.exp(-distance ** 2)
+
+        # Select by all scores. Confidence depends on ambiguity only: it drops
+        # with other strong peaks in the row and distance to neighbour rows,
+        # not with absolute stripe brightness
+        quality = values / 255. * width_score
+        best = (quality * geometry_score).argmax(axis=1)
+        best_quality = quality[rows[:, 0], best]
+        quality[rows[:, 0], best] = 0
+        other = quality.max(axis=1)
+        confidence = geometry_score[rows[:, 0], best] * \
+            best_quality / np.maximum(best_quality + other, 1e-6)
+        return cols[rows[:, 0], best], confidence
+
+    def _window_mask(self, image, peak=None):
+        if self.window_enable or peak is not None:
             if image is not None:
-                peak = image.argmax(axis=1)
-                _min = peak - self.window_value
-                _max = peak + self.window_value + 1
-                mask = np.zeros_like(image)
-                for i in xrange(self.calibration_data.height):
-                    mask[i, _min[i]:_max[i]] = 255
+                if peak is None:
+                    peak = image.argmax(axis=1)
+                mask = np.abs(np.arange(image.shape[1]) - peak[:, np.newaxis]) <= self.window_value
                 # Apply mask
-                image = cv2.bitwise_and(image, mask)
+                image = image * mask.astype(np.uint8)
         return image
 
     # Segmented gaussian filter
@@ -12,6 +12,24 @@ import cv2
 from horus import Singleton
 from horus.engine.calibration.calibration_data import CalibrationData
 
+# Raw laser detections kept with scan to regenerate point cloud after
+# recalibration: image point, platform angle (rad), laser, slice and color
+DETECTIONS_DTYPE = np.dtype([('u', np.float32), ('v', np.float32), ('theta', np.float32),
+                             ('laser', np.int8), ('slice', np.int32), ('color', np.uint8, (3,))])
+
+
+def make_detections(points_2d, theta, index, slice_no, texture):
+    # detections of single laser image
+    u, v = points_2d
+    detections = np.empty(len(u), dtype=DETECTIONS_DTYPE)
+    detections['u'] = u
+    detections['v'] = v
+    detections['theta'] = theta
+    detections['laser'] = index
+    detections['slice'] = slice_no
+    detections['color'] = np.asarray(texture).T
+    return detections
+
 
 @Singleton
 class PointCloudGeneration(object):
@@ -110,3 +128,74 @@ class PointCloudGeneration(object):
         x = np.insert( x, 2, [1.], axis=0) # [u,v,1]
         return d / np.dot(n, x).reshape(1,-1) * x # [X,Y,Z]
 
+
+    def compute_detections_point_cloud(self, detections, calibration_data=None):
+        # Nx3 model coords of stored detections. All lasers and slices at once
+        if calibration_data is None:
+            calibration_data = self.calibration_data
+        if len(detections) == 0:
+            return np.empty((0, 3), dtype=np.float32)
+
+        # normalized camera rays
+        pts = np.column_stack((detections['u'], detections['v'])).astype(np.float32).reshape(-1, 1, 2)
+        x = cv2.undistortPoints(pts, calibration_data.camera_matrix,
+                                calibration_data.distortion_vector).reshape(-1, 2)
+        x = np.column_stack((x, np.ones(len(x)))).astype(np.float64)
+
+        # laser plane intersection
+        laser = detections['laser'].astype(np.int64)
+        planes = calibration_data.laser_planes
+        n = np.zeros((len(planes), 3))
+        d = np.zeros(len(planes))
+        for i in np.unique(laser):
+            n[i] = planes[i].normal
+            d[i] = planes[i].distance
+        Xc = x * (d[laser] / np.sum(n[laser] * x, axis=1))[:, np.newaxis]
+
+        # platform coords: R.T * (Xc - t)
+        R = np.asarray(calibration_data.platform_rotation, np.float64)
+        t = np.asarray(calibration_data.platform_translation, np.float64).ravel()
+        Xwo = np.dot(Xc - t, R)
+
+        # rotate to model coords
+        theta = detections['theta'].astype(np.float64)
+        c, s = np.cos(-theta), np.sin(-theta)
+        Xw = np.empty((len(x), 3), dtype=np.float32)
+        Xw[:, 0] = c * Xwo[:, 0] - s * Xwo[:, 1]
+        Xw[:, 1] = s * Xwo[:, 0] + c * Xwo[:, 1]
+        Xw[:, 2] = Xwo[:, 2]
+        return Xw
+
+    def retriangulate_mesh(self, mesh, calibration_data=None, point_cloud_roi=None):
+        # Replace mesh points by ones regenerated from stored detections
+        if mesh.metadata is None or 'detections' not in mesh.metadata:
+            return False
+        if calibration_data is None:
+            calibration_data = self.calibration_data
+
+        detections = mesh.metadata['detections']
+        vertexes = self.compute_detections_point_cloud(detections, calibration_data)
+        if point_cloud_roi is not None:
+            idx = point_cloud_roi.point_cloud_indices(vertexes.T)
+            vertexes = vertexes[idx]
+            detections = detections[idx]
+
+        mesh.vertexes = vertexes
+        mesh.colors = detections['color']
+        mesh.normal = np.zeros((0, 3), np.float32)
+        mesh.vertexes_meta = np.empty(len(vertexes), dtype=mesh.vertexes_meta.dtype)
+        mesh.vertexes_meta['laser_id'] = detections['laser']
+        mesh.vertexes_meta['slice_no'] = detections['slice']
+        mesh.vertexes_meta['slice_l'] = detections['theta']
+        mesh.vertex_count = len(vertexes)
+        mesh.clear_vbo()
+
+        # keep calibration in sync with points
+        mesh.metadata['camera_matrix'] = calibration_data.camera_matrix
+        mesh.metadata['distortion_vector'] = calibration_data.distortion_vector
+        for plane in calibration_data.laser_planes:
+            mesh.metadata['distance_' + plane.name] = plane.distance
+            mesh.metadata['normal_' + plane.name] = plane.normal
+        mesh.metadata['rotation_matrix'] = calibration_data.platform_rotation
+        mesh.metadata['translation_vector'] = calibration_data.platform_translation
+        return True
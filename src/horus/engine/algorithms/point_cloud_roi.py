@@ -78,23 +78,26 @@ class PointCloudROI(object):
 
     def mask_point_cloud(self, point_cloud, texture):
         if point_cloud is not None and texture is not None and len(point_cloud) > 0:
-            rho = np.sqrt(np.square(point_cloud[0, :]) + np.square(point_cloud[1, :]))
-            z = point_cloud[2, :]
-
-            if self._use_roi:
-                idx = np.where((z >= 0) &
-                               (z <= self._height) &
-                               (rho >= -self._radious) &
-                               (rho <= self._radious))[0]
-            else:
-                # valid points should be above platform and in front of camera for all scanning cylinder area
-                # fast approximation of camera distance is platform Z offset
-                idx = np.where((z >= 0) &
-                               (rho >= -self.calibration_data.platform_translation[2]) &
-                               (rho <=  self.calibration_data.platform_translation[2]))[0]
-
+            idx = self.point_cloud_indices(point_cloud)
             return point_cloud[:, idx], texture[:, idx]
 
+    def point_cloud_indices(self, point_cloud):
+        # indices of point cloud points inside ROI
+        rho = np.sqrt(np.square(point_cloud[0, :]) + np.square(point_cloud[1, :]))
+        z = point_cloud[2, :]
+
+        if self._use_roi:
+            return np.where((z >= 0) &
+                            (z <= self._height) &
+                            (rho >= -self._radious) &
+                            (rho <= self._radious))[0]
+        else:
+            # valid points should be above platform and in front of camera for all scanning cylinder area
+            # fast approximation of camera distance is platform Z offset
+            return np.where((z >= 0) &
+                            (rho >= -self.calibration_data.platform_translation[2]) &
+                            (rho <=  self.calibration_data.platform_translation[2]))[0]
+
     def draw_cross(self, image):
         if image is not None and self._center_v != 0 and self._center_u != 0 and self._show_center:
             thickness = 2
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# This file is part of the Gryphon Scan Project
+
+__author__ = 'Mikhail N Klimushin aka Night Gryphon <ngryph@gmail.com>'
+__copyright__ = 'Copyright (C) 2019 Night Gryphon'
+__license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
+
+# Measure flush values for current camera and resolution.
+# For each change (laser on, exposure, brightness) reference images are taken
+# with large flush before and after change. Then change is repeated and
+# captured with increasing flush until captured image matches "after"
+# reference. Scene flush is used for texture, laser and pattern captures,
+# settings flush for capture mode change. Settings changes are measured in
+# texture mode to see lit scene, per OS mode flush is kept if not detected.
+
+import cv2
+import numpy as np
+
+from horus import Singleton
+from horus.engine.calibration.calibration import Calibration, CalibrationCancel
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ChangeNotDetected(Exception):
+
+    def __init__(self):
+        Exception.__init__(self, "Change Not Detected")
+
+
+@Singleton
+class FlushCalibration(Calibration):
+
+    # flush surely enough to apply any change
+    MAX_FLUSH = 10
+    # trials per flush value
+    REPEAT = 2
+    # gray level difference of changed pixel
+    THRESHOLD = 40
+    # min changed pixels to detect change
+    MIN_PIXELS = 50
+    # part of changed pixels which should match "after" image
+    MATCH = 0.9
+
+    def __init__(self):
+        self.scene_flush = None
+        self.settings_flush = None
+        Calibration.__init__(self)
+
+    def _start(self):
+        ret = False
+        response = None
+        if self.driver.is_connected:
+            stream = self.image_capture.stream
+            mode = self.image_capture._mode
+            self.image_capture.stream = False
+            try:
+                self.image_capture.set_mode_laser()
+                self.scene_flush = self.measure_laser()
+                if self._progress_callback is not None:
+                    self._progress_callback(50)
+                self.driver.board.lasers_off()
+                self.image_capture.set_mode_texture()
+                try:
+                    self.settings_flush = self.measure_settings()
+                except ChangeNotDetected:
+                    self.settings_flush = self.image_capture.default_flush_values()[3]
+                    logger.warning("Flush calibration: settings change not detected")
+                self.image_capture.save_flush_profile(self.scene_flush, self.settings_flush)
+                logger.info("Flush calibration: scene {0} settings {1}".format(
+                    self.scene_flush, self.settings_flush))
+                ret = True
+                response = (self.scene_flush, self.settings_flush)
+            except Exception as exception:
+                response = exception
+            finally:
+                self.driver.board.lasers_off()
+                # restore camera settings and capture mode
+                self.image_capture._mode.send_all_settings()
+                self.image_capture.set_mode(mode)
+                self.image_capture.stream = stream
+        self._is_calibrating = False
+        if self._progress_callback is not None:
+            self._progress_callback(100)
+        if self._after_callback is not None:
+            self._after_callback((ret, response))
+
+    def measure_laser(self):
+        for index in xrange(len(self.calibration_data.laser_planes)):
+            try:
+                return self.measure(self.driver.board.lasers_off,
+                                    lambda: self.driver.board.laser_on(index))
+            except ChangeNotDetected:
+                pass
+        raise ChangeNotDetected()
+
+    def measure_settings(self):
+        # max flush of detected camera settings changes
+        flush = []
+        for measure in (self.measure_exposure, self.measure_brightness):
+            try:
+                flush.append(measure())
+            except ChangeNotDetected:
+                pass
+        if len(flush) == 0:
+            raise ChangeNotDetected()
+        return max(flush)
+
+    def measure_exposure(self):
+        camera = self.driver.camera
+        exposure = self.image_capture._mode.exposure
+        changed = exposure * 2 if exposure < 32 else exposure / 2
+        return self.measure(lambda: camera.set_exposure(exposure),
+                            lambda: camera.set_exposure(changed))
+
+    def measure_brightness(self):
+        camera = self.driver.camera
+        brightness = self.image_capture._mode.brightness
+        changed = brightness + 64 if brightness < 128 else brightness - 64
+        return self.measure(lambda: camera.set_brightness(brightness),
+                            lambda: camera.set_brightness(changed))
+
+    def measure(self, reset, change):
+        # min flush which captures image after change
+        reset()
+        before = self._capture(self.MAX_FLUSH)
+        change()
+        after = self._capture(self.MAX_FLUSH)
+        mask = cv2.absdiff(before, after) > self.THRESHOLD
+        if np.count_nonzero(mask) < self.MIN_PIXELS:
+            raise ChangeNotDetected()
+        before = before[mask].astype(np.int16)
+        after = after[mask].astype(np.int16)
+
+        for flush in xrange(self.MAX_FLUSH):
+            matched = True
+            for i in xrange(self.REPEAT):
+                if not self._is_calibrating:
+                    raise CalibrationCancel()
+                reset()
+                self._capture(self.MAX_FLUSH)
+                change()
+                image = self._capture(flush)[mask].astype(np.int16)
+                # pixel matches nearest reference
+                closer = np.abs(image - after) < np.abs(image - before)
+                if np.mean(closer) < self.MATCH:
+                    matched = False
+                    break
+            if matched:
+                return flush
+        return self.MAX_FLUSH
+
+    def _capture(self, flush):
+        image = self.image_capture.capture_image(flush=flush)
+        if image is None:
+            raise ChangeNotDetected()
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
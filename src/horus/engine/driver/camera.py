@@ -87,11 +87,13 @@ class Camera(object):
     def set_unplug_callback(self, value):
         self.unplug_callback = value
 
-    def capture_image(self, flush=0):
+    def capture_image(self, flush=0, after=None, reduce=1):
         # flush buffered frames
         # 0 - no flush
         # -1 - auto flush
         # n - flush exactly n frames
+        # after - time frame exposure should start after
+        # reduce - allowed downscale for previews
         raise NotImplementedError
 
     def save_image(self, filename, image):
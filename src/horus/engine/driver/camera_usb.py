@@ -12,10 +12,12 @@ import math
 import time
 import glob
 import platform
+import threading
 import wx
 
 from horus.engine.driver.camera import Camera, WrongCamera, CameraNotConnected, InvalidVideo, \
     WrongDriver, InputOutputError
+from horus.engine.driver.frame_grabber import FrameGrabber
 
 from distutils.version import StrictVersion, LooseVersion
 
@@ -40,8 +42,20 @@ class Camera_usb(Camera):
         self.controls = None
         self._is_connected = False
         self._reading = False
-        self._updating = False
+        # held while reading frames or changing capture settings
+        self._lock = threading.RLock()
+        self._grabber = None
         self._last_image = None
+        self._orientation_key = None
+        self._orientation_ops = []
+        self._pixel_format = None
+        self._device_uid = None
+        # imdecode flags for reduced size decoding of previews
+        self._decode_flags = {1: cv2.IMREAD_COLOR}
+        if hasattr(cv2, 'IMREAD_REDUCED_COLOR_2'):
+            self._decode_flags[2] = cv2.IMREAD_REDUCED_COLOR_2
+            self._decode_flags[4] = cv2.IMREAD_REDUCED_COLOR_4
+            self._decode_flags[8] = cv2.IMREAD_REDUCED_COLOR_8
         self._video_list = None
         self._tries = 0  # Check if command fails
 
@@ -101,10 +115,12 @@ class Camera_usb(Camera):
                 for device in uvc.mac.Camera_List():
                     if device.src_id == self.camera_id:
                         self.controls = uvc.mac.Controls(device.uId)
+                        self._device_uid = device.uId
             except:
                 self.controls = None
                 wx.MessageDialog(None, 'For MacOS this camera controls not available. You can not set Brightness, Contrast, Saturation, Exposure for this camera', 'Warning', wx.OK | wx.ICON_INFORMATION).ShowModal()
 
+        self._stop_grabber()
         if self._capture is not None:
             self._capture.release()
 
@@ -117,7 +133,9 @@ class Camera_usb(Camera):
             #self._capture = cv2.VideoCapture(self.camera_id, cv2.CAP_FFMPEG)
             self._capture = cv2.VideoCapture(self.camera_id)
 
-        time.sleep(0.2)
+        probe = self._read_probe()
+        if probe is None:
+            time.sleep(0.2)
         if not self._capture.isOpened():
             time.sleep(1)
             if system == 'Windows':
@@ -135,6 +153,9 @@ class Camera_usb(Camera):
             if profile.settings['camera_capture_before_set']:
                 self._check_video()
 
+            # pixel format affects available resolutions and FPS
+            self.set_pixel_format(profile.settings['camera_pixel_format'], True)
+
             # set initial resolution to auto, FPS to 30
             # assume BEFORE any frames captured set resolution and FPS applicable for all backends (?)
             logger.info("  set initial resolution/FPS")
@@ -167,13 +188,26 @@ class Camera_usb(Camera):
             logger.info("  check read frame")
             self._check_video()
 
-            logger.info("  check adjust exposure/brightness")
-            self.DetectLimits()
-            self._check_camera()
+            if probe is not None and probe['backend'] == self._backend_name() and \
+               self._verify_probe(probe):
+                logger.info("  use cached exposure/brightness limits")
+                self._max_brightness = probe['max_brightness']
+                self._max_contrast = probe['max_contrast']
+                self._max_exposure = probe['max_exposure']
+                self._max_saturation = probe['max_saturation']
+            else:
+                logger.info("  check adjust exposure/brightness")
+                self.DetectLimits()
+                self._check_camera()
+                self._save_probe()
 
             #logger.info("  check win driver bug")
             #self._check_driver()
 
+            # read frames continuously from now on
+            self._grabber = FrameGrabber(self._capture.read, lock=self._lock)
+            self._grabber.start()
+
             logger.info(" Done")
         else:
             raise CameraNotConnected()
@@ -182,6 +216,7 @@ class Camera_usb(Camera):
         tries = 0
         if self._is_connected:
             logger.info("Disconnecting camera {0}".format(self.camera_id))
+            self._stop_grabber()
             if self._capture is not None:
                 if self._capture.isOpened():
                     self._is_connected = False
@@ -235,17 +270,33 @@ class Camera_usb(Camera):
             if mean > 200:
                 raise WrongDriver()
 
-    def capture_image(self, flush=0):
+    def _stop_grabber(self):
+        if self._grabber is not None:
+            self._grabber.stop()
+            self._grabber = None
+
+    def capture_image(self, flush=0, after=None, reduce=1):
         """Capture image from camera"""
         # flush buffered frames
         # 0 - no flush
         # -1 - auto flush
         # n - flush exactly n frames
+        # With frame grabber running, first frame exposed after time 'after'
+        # (call time by default) is returned. Buffered frames are never stale
+        # then, so flush n only skips n-1 frames of camera latency
+        # reduce - 1, 2, 4 or 8 downscale for previews. Applied only to raw
+        # MJPEG frames where it makes decoding faster
         if self._is_connected:
-            #tbegin = time.time()
-            if self._updating:
-                return self._last_image
-            else:
+            if self._grabber is not None and self._grabber.is_running():
+                if after is None:
+                    after = time.time()
+                frame = self._grabber.get_frame(after, max(flush - 1, 0))
+                if frame is None:
+                    self._fail()
+                    return None
+                return self._process_frame(frame[2], reduce)
+
+            with self._lock:
                 self._reading = True
                 # Note: Windows needs read() to perform
                 #       the flush instead of grab()
@@ -267,29 +318,56 @@ class Camera_usb(Camera):
                         ret, image = self._capture.read()
                         #e = time.time()
                         #print "     frame: {0} ms".format(int((e - b) * 1000))
-
-                #print "   driver capture: {0} ms, flush {1}".format(int((time.time() - tbegin) * 1000),flush)
-                #tbegin = time.time()
-
                 self._reading = False
-                if ret:
-                    if self._rotate:
-                        image = cv2.transpose(image)
-                    if self._hflip:
-                        image = cv2.flip(image, 1)
-                    if self._vflip:
-                        image = cv2.flip(image, 0)
-                    self._success()
-                    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                    self._last_image = image
-                    #print "   driver capture process: {0} ms".format(int((time.time() - tbegin) * 1000))
-                    return image
-                else:
-                    self._fail()
-                    return None
+
+            if ret:
+                return self._process_frame(image, reduce)
+            else:
+                self._fail()
+                return None
         else:
             return None
 
+    def _process_frame(self, image, reduce=1):
+        if image.ndim == 1 or (image.ndim == 2 and image.shape[0] == 1):
+            # Raw MJPEG buffer. Decoded only when requested, so flushed frames
+            # cost no decoding. imdecode releases GIL, so scan, preview and
+            # calibration threads decode in parallel
+            image = cv2.imdecode(image, self._decode_flags.get(reduce, cv2.IMREAD_COLOR))
+            if image is None:
+                self._fail()
+                return None
+        # orientation in one full frame pass, color conversion in another
+        for op in self._orientation():
+            image = op(image)
+        self._success()
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        self._last_image = image
+        return image
+
+    def _orientation(self):
+        # Rotate (transpose) then flips as minimal list of cv2 calls
+        key = (bool(self._rotate), bool(self._hflip), bool(self._vflip))
+        if self._orientation_key != key:
+            rotate, hflip, vflip = key
+            flip = {(True, False): 1, (False, True): 0, (True, True): -1}.get((hflip, vflip))
+            ops = []
+            if rotate and hflip != vflip and hasattr(cv2, 'rotate'):
+                # transpose + one flip is a quarter turn
+                if hflip:
+                    code = cv2.ROTATE_90_CLOCKWISE
+                else:
+                    code = cv2.ROTATE_90_COUNTERCLOCKWISE
+                ops.append(lambda image: cv2.rotate(image, code))
+            else:
+                if rotate:
+                    ops.append(cv2.transpose)
+                if flip is not None:
+                    ops.append(lambda image: cv2.flip(image, flip))
+            self._orientation_ops = ops
+            self._orientation_key = key
+        return self._orientation_ops
+
     # ------------- Probe limits ----------
     def DetectPropMax(self, min, max, prop_id):
         if prop_id is None:
@@ -316,6 +394,65 @@ class Camera_usb(Camera):
                 self._max_brightness, self._max_contrast,
                 self._max_exposure, self._max_saturation)
 
+    # ------------- Probe cache ----------
+    # Limits probed by DetectLimits and _check_camera are stored in profile
+    # per device, so reconnects of known camera skip probing
+
+    def device_identity(self):
+        if system == 'Linux':
+            # V4L2 device name and USB vendor/product id
+            path = '/sys/class/video4linux/video{0}/'.format(self.camera_id)
+            identity = []
+            for name in ['name', 'device/../idVendor', 'device/../idProduct']:
+                try:
+                    with open(path + name) as f:
+                        identity.append(f.read().strip())
+                except IOError:
+                    pass
+            if len(identity) > 0:
+                return u'{0} {1}'.format(self.camera_id, ' '.join(identity))
+        elif system == 'Darwin' and self._device_uid is not None:
+            return u'{0}'.format(self._device_uid)
+        return u'{0} {1}'.format(system, self.camera_id)
+
+    def _backend_name(self):
+        if LooseVersion(cv2.__version__) >= LooseVersion("3.4.4"):
+            return self._capture.getBackendName()
+        return u''
+
+    def _verify_probe(self, probe):
+        # Windows identity is only camera index: other camera can be
+        # plugged at it. Check cached exposure limit is limit of this device
+        if system != 'Windows':
+            return True
+        prop = self.CV_CAP_PROP_EXPOSURE
+        exposure = self._capture.get(prop)
+        valid = self._capture.set(prop, probe['max_exposure']) and \
+            not self._capture.set(prop, probe['max_exposure'] + 1)
+        self._capture.set(prop, exposure)
+        if not valid:
+            logger.info("  cached limits do not match camera")
+        return valid
+
+    def _read_probe(self):
+        return profile.settings['camera_probe_cache'].get(self.device_identity())
+
+    def _save_probe(self):
+        cache = dict(profile.settings['camera_probe_cache'])
+        cache[self.device_identity()] = {
+            'backend': self._backend_name(),
+            'max_brightness': self._max_brightness,
+            'max_contrast': self._max_contrast,
+            'max_exposure': self._max_exposure,
+            'max_saturation': self._max_saturation}
+        profile.settings['camera_probe_cache'] = cache
+
+    def clear_probe(self):
+        # probe camera again on next connect
+        cache = dict(profile.settings['camera_probe_cache'])
+        cache.pop(self.device_identity(), None)
+        profile.settings['camera_probe_cache'] = cache
+
     # ------------- Brightness control ------------
     def get_brightness(self):
         if self._is_connected:
@@ -331,18 +468,17 @@ class Camera_usb(Camera):
     def set_brightness(self, value):
         if self._is_connected:
             if self._brightness != value:
-                self._updating = True
-                self._brightness = value
-                if system == 'Darwin' and self.controls is not None:
-                    ctl = self.controls['UVCC_REQ_BRIGHTNESS_ABS']
-                    ctl.set_val(self._line(value, 0, self._max_brightness, ctl.min, ctl.max))
-                else:
-                    #value = int(value) / self._max_brightness
-                    value = value * self._max_brightness / 255.
-                    ret = self._capture.set(self.CV_CAP_PROP_BRIGHTNESS, value)
-                    if system == 'Linux' and ret:
-                        raise InputOutputError()
-                self._updating = False
+                with self._lock:
+                    self._brightness = value
+                    if system == 'Darwin' and self.controls is not None:
+                        ctl = self.controls['UVCC_REQ_BRIGHTNESS_ABS']
+                        ctl.set_val(self._line(value, 0, self._max_brightness, ctl.min, ctl.max))
+                    else:
+                        #value = int(value) / self._max_brightness
+                        value = value * self._max_brightness / 255.
+                        ret = self._capture.set(self.CV_CAP_PROP_BRIGHTNESS, value)
+                        if system == 'Linux' and ret:
+                            raise InputOutputError()
                 return True
         return False
 
@@ -350,17 +486,16 @@ class Camera_usb(Camera):
     def set_contrast(self, value):
         if self._is_connected:
             if self._contrast != value:
-                self._updating = True
-                self._contrast = value
-                if system == 'Darwin' and self.controls is not None:
-                    ctl = self.controls['UVCC_REQ_CONTRAST_ABS']
-                    ctl.set_val(self._line(value, 0, self._max_contrast, ctl.min, ctl.max))
-                else:
-                    value = value * self._max_contrast / 255.
-                    ret = self._capture.set(self.CV_CAP_PROP_CONTRAST, value)
-                    if system == 'Linux' and ret:
-                        raise InputOutputError()
-                self._updating = False
+                with self._lock:
+                    self._contrast = value
+                    if system == 'Darwin' and self.controls is not None:
+                        ctl = self.controls['UVCC_REQ_CONTRAST_ABS']
+                        ctl.set_val(self._line(value, 0, self._max_contrast, ctl.min, ctl.max))
+                    else:
+                        value = value * self._max_contrast / 255.
+                        ret = self._capture.set(self.CV_CAP_PROP_CONTRAST, value)
+                        if system == 'Linux' and ret:
+                            raise InputOutputError()
                 return True
         return False
 
@@ -368,19 +503,18 @@ class Camera_usb(Camera):
     def set_saturation(self, value):
         if self._is_connected:
             if self._saturation != value:
-                self._updating = True
-                self._saturation = value
-                if system == 'Darwin' and self.controls is not None:
-                    ctl = self.controls['UVCC_REQ_SATURATION_ABS']
-                    ctl.set_val(self._line(value, 0, self._max_saturation, ctl.min, ctl.max))
-                else:
-                    value = value * self._max_saturation / 255.
-                    ret = self._capture.set(self.CV_CAP_PROP_SATURATION, value)
-                    if system == 'Linux' and ret:
-                        raise InputOutputError()
-                    if system == 'Windows' and not ret:
-                        print "ERROR Set Exposure {0}".format(value)
-                    self._updating = False
+                with self._lock:
+                    self._saturation = value
+                    if system == 'Darwin' and self.controls is not None:
+                        ctl = self.controls['UVCC_REQ_SATURATION_ABS']
+                        ctl.set_val(self._line(value, 0, self._max_saturation, ctl.min, ctl.max))
+                    else:
+                        value = value * self._max_saturation / 255.
+                        ret = self._capture.set(self.CV_CAP_PROP_SATURATION, value)
+                        if system == 'Linux' and ret:
+                            raise InputOutputError()
+                        if system == 'Windows' and not ret:
+                            print "ERROR Set Exposure {0}".format(value)
                 return True
         return False
 
@@ -403,27 +537,26 @@ class Camera_usb(Camera):
     def set_exposure(self, value, force=False):
         if self._is_connected:
             if self._exposure != value or force:
-                self._updating = True
-                self._exposure = value
-                #value *= self._luminosity
-                if value < 1:
-                    value = 1
-                if system == 'Darwin' and self.controls is not None:
-                    ctl = self.controls['UVCC_REQ_EXPOSURE_ABS']
-                    value = int(value * self._rel_exposure)
-                    ctl.set_val(value)
-
-                    self.set_anti_flicker(1)
-                elif system == 'Windows':
-                    value = int(round(-math.log(value) / math.log(2)))
-                    #value = value / 64 * self._max_exposure
-                    self._capture.set(self.CV_CAP_PROP_EXPOSURE, value)
-                else:
-                    value = int(value) / self._max_exposure
-                    ret = self._capture.set(self.CV_CAP_PROP_EXPOSURE, value)
-                    if system == 'Linux' and ret:
-                        raise InputOutputError()
-                self._updating = False
+                with self._lock:
+                    self._exposure = value
+                    #value *= self._luminosity
+                    if value < 1:
+                        value = 1
+                    if system == 'Darwin' and self.controls is not None:
+                        ctl = self.controls['UVCC_REQ_EXPOSURE_ABS']
+                        value = int(value * self._rel_exposure)
+                        ctl.set_val(value)
+
+                        self.set_anti_flicker(1)
+                    elif system == 'Windows':
+                        value = int(round(-math.log(value) / math.log(2)))
+                        #value = value / 64 * self._max_exposure
+                        self._capture.set(self.CV_CAP_PROP_EXPOSURE, value)
+                    else:
+                        value = int(value) / self._max_exposure
+                        ret = self._capture.set(self.CV_CAP_PROP_EXPOSURE, value)
+                        if system == 'Linux' and ret:
+                            raise InputOutputError()
                 return True
         return False
 
@@ -456,9 +589,8 @@ class Camera_usb(Camera):
 
             if self._frame_rate != value:
                 self._frame_rate = value
-                self._updating = True
-                self._capture.set(self.CV_CAP_PROP_FPS, value)
-                self._updating = False
+                with self._lock:
+                    self._capture.set(self.CV_CAP_PROP_FPS, value)
 
     # ------------- Resolution control ------------
     def set_resolution_supported(self, init_phase=False):
@@ -494,11 +626,10 @@ class Camera_usb(Camera):
                 height = 10000
 
             if self._width != width or self._height != height:
-                self._updating = True
-                self._set_width(width)
-                self._set_height(height)
-                self._update_resolution()
-                self._updating = False
+                with self._lock:
+                    self._set_width(width)
+                    self._set_height(height)
+                    self._update_resolution()
 
     def _set_width(self, value):
         self._capture.set(self.CV_CAP_PROP_FRAME_WIDTH, value)
@@ -511,6 +642,33 @@ class Camera_usb(Camera):
         self._height = int(self._capture.get(self.CV_CAP_PROP_FRAME_HEIGHT))
         logger.info("Actual Resolution: {0}x{1}".format(self._width, self._height))
 
+    # ------------- Pixel format control ------------
+    def set_pixel_format(self, value, init_phase=False):
+        # u'Default' keeps format chosen by driver. In MJPG mode frames
+        # are read undecoded where backend allows it
+        if self._is_connected and self.set_resolution_supported(init_phase) and \
+           LooseVersion(cv2.__version__) > LooseVersion("3.0.0"):
+            if self._pixel_format != value:
+                logger.info("Set pixel format: {0}".format(value))
+                with self._lock:
+                    if value != u'Default':
+                        self._capture.set(cv2.CAP_PROP_FOURCC,
+                                          cv2.VideoWriter_fourcc(*str(value)))
+                    # V4L2 backend returns undecoded MJPEG buffer, other
+                    # backends decode frames themselves
+                    raw = self._get_fourcc() == 'MJPG' and \
+                        LooseVersion(cv2.__version__) >= LooseVersion("3.4.4") and \
+                        self._capture.getBackendName() == 'V4L2'
+                    self._capture.set(cv2.CAP_PROP_CONVERT_RGB, 0 if raw else 1)
+                    self._pixel_format = value
+                    if not init_phase:
+                        self._update_resolution()
+                logger.info("Actual pixel format: {0}".format(self._get_fourcc()))
+
+    def _get_fourcc(self):
+        fourcc = int(self._capture.get(cv2.CAP_PROP_FOURCC))
+        return ''.join([chr((fourcc >> (8 * i)) & 0xFF) for i in xrange(4)])
+
     # ------------- Focus control ------------
     def focus_supported(self):
         if system == 'Darwin':
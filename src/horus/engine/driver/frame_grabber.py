@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# This file is part of the Gryphon Scan Project
+
+__author__ = 'Mikhail N Klimushin aka Night Gryphon <ngryph@gmail.com>'
+__copyright__ = 'Copyright (C) 2019 Night Gryphon'
+__license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
+
+# Background camera reader.
+# Frames are read continuously into small ring of (sequence, timestamp, frame),
+# so driver buffers never hold stale frames and capture does not pay for
+# flushing. Timestamp is time when read returned. Exposure of frame is
+# assumed to start one frame period earlier.
+
+import time
+import threading
+from collections import deque
+
+
+class FrameGrabber(object):
+
+    def __init__(self, read, size=4, lock=None):
+        # read - callable returning (ret, frame) like cv2.VideoCapture.read
+        self._read = read
+        self._ring = deque(maxlen=size)
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        # held while reading frame. Hold it to change capture settings
+        self.lock = lock if lock is not None else threading.RLock()
+        self.sequence = 0
+        self.period = 1.0 / 30
+        self.fail_count = 0
+
+    def is_running(self):
+        return self._running
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        if self._running:
+            self._running = False
+            self._thread.join()
+            self._thread = None
+            with self._condition:
+                self._ring.clear()
+                self._condition.notify_all()
+
+    def _run(self):
+        while self._running:
+            with self.lock:
+                ret, frame = self._read()
+            timestamp = time.time()
+            with self._condition:
+                if ret:
+                    if len(self._ring) > 0:
+                        # smoothed frame period
+                        interval = timestamp - self._ring[-1][1]
+                        if 0 < interval < 1:
+                            self.period += (interval - self.period) * 0.1
+                    self.sequence += 1
+                    self._ring.append((self.sequence, timestamp, frame))
+                else:
+                    self.fail_count += 1
+                self._condition.notify_all()
+            if not ret:
+                time.sleep(0.01)
+
+    def latest(self):
+        # newest (sequence, timestamp, frame) or None
+        with self._condition:
+            if len(self._ring) > 0:
+                return self._ring[-1]
+        return None
+
+    def get_frame(self, after, skip=0, timeout=1.0):
+        # First frame which exposure started after time 'after', or
+        # 'skip' frames later. None on timeout.
+        deadline = time.time() + timeout
+        with self._condition:
+            sequence = None
+            while self._running:
+                if sequence is None:
+                    for s, t, frame in self._ring:
+                        if t - self.period >= after:
+                            sequence = s + skip
+                            break
+                if sequence is not None:
+                    for s, t, frame in self._ring:
+                        if s == sequence:
+                            return s, t, frame
+                    if len(self._ring) > 0 and self._ring[0][0] > sequence:
+                        # fell out of ring while waiting, take oldest one
+                        return self._ring[0]
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+        return None
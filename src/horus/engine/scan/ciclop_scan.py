@@ -18,7 +18,9 @@ from horus.engine.scan.scan import Scan, ScanError
 from horus.engine.scan.scan_capture import ScanCapture
 from horus.engine.scan.current_video import CurrentVideo
 from horus.engine.calibration.calibration_data import CalibrationData
+from horus.engine.algorithms.point_cloud_generation import make_detections
 from horus.util.gryphon_util import decode_color
+from horus.util.range_image import RangeImage
 
 from horus.util import profile
 
@@ -65,6 +67,11 @@ class CiclopScan(Scan):
         self.capturing = False
         self.semaphore = None
 
+        self.range_image_enable = False
+        self.range_image = None
+        self.detections_enable = False
+        self._detections = None
+
     def read_profile(self):
         self.set_texture_mode(profile.settings['texture_mode'])
 
@@ -85,6 +92,8 @@ class CiclopScan(Scan):
             self.semaphore = threading.Semaphore()
         else:
             self.semaphore = None
+        self.set_range_image_enable(profile.settings['scan_range_image'])
+        self.set_detections_enable(profile.settings['scan_save_detections'])
 
 
         self.ph_save_enable = profile.settings['ph_save_enable']
@@ -128,6 +137,18 @@ class CiclopScan(Scan):
     def set_motor_acceleration(self, value):
         self.motor_acceleration = value
 
+    def set_range_image_enable(self, value):
+        self.range_image_enable = value
+
+    def set_detections_enable(self, value):
+        self.detections_enable = value
+
+    def get_detections(self):
+        # raw 2D detections of last scan or None
+        if not self._detections:
+            return None
+        return np.concatenate(self._detections)
+
     def set_debug(self, value):
         self._debug = value
 
@@ -144,6 +165,17 @@ class CiclopScan(Scan):
         self.capturing = False
         self._begin = time.time()
 
+        self._detections = [] if self.detections_enable else None
+
+        self.range_image = None
+        if self.range_image_enable:
+            self.range_image = RangeImage(self.calibration_data.height, len(self.laser))
+            for i, plane in enumerate(self.calibration_data.laser_planes):
+                if self.laser[i]:
+                    self.range_image.set_laser_plane(i, plane.normal, plane.distance,
+                                                     self.calibration_data.platform_rotation,
+                                                     self.calibration_data.platform_translation)
+
         # Setup console
         logger.info("Start scan")
         if self._debug and system == 'Linux':
@@ -369,6 +401,15 @@ class CiclopScan(Scan):
                     capture.theta, points_2d, i)
                 #print("Processed: {0:f} - {1}".format(np.rad2deg(capture.theta),i))
 
+                if self._detections is not None:
+                    self._detections.append(
+                        make_detections(points_2d, capture.theta, i, capture.count, texture))
+
+                if self.range_image is not None and point_cloud is not None:
+                    idx = self.point_cloud_roi.point_cloud_indices(point_cloud)
+                    self.range_image.add_slice(i, capture.count, capture.theta,
+                                               v[idx], point_cloud[:, idx], texture[:, idx])
+
                 if self.point_cloud_callback:
                     self.point_cloud_callback(self._range, self._progress,
                                               (point_cloud, texture), (i, capture.count, capture.theta))
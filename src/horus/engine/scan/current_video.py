@@ -6,6 +6,7 @@ __copyright__ = 'Copyright (C) 2014-2016 Mundo Reader S.L.'
 __license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
 
 import cv2
+import time
 import numpy as np
 from itertools import cycle
 
@@ -18,38 +19,64 @@ class CurrentVideo(object):
     def __init__(self):
         self.mode = 'Texture'
 
-        self.images = {}
-        self.images['Texture'] = None
-        self.images['Laser'] = None
-        self.images['Gray'] = None
-        self.images['Line'] = None
+        # Source images of each mode. Image of current mode is composed
+        # on capture, not more often than min_interval seconds
+        self.sources = {}
+        self.sources['Texture'] = None
+        self.sources['Laser'] = None
+        self.sources['Gray'] = None
+        self.sources['Line'] = None
+
+        self.min_interval = 1.0 / 30
+        self._image = None
+        self._image_mode = None
+        self._image_source = None
+        self._image_time = 0
 
     def set_texture(self, image):
-        self.images['Texture'] = image
+        self.sources['Texture'] = (image,)
 
     def set_laser(self, images):
-        image = self._combine_images(images)
-        self.images['Laser'] = image
+        self.sources['Laser'] = (list(images),)
 
     def set_gray(self, images):
         if images is not None:
-            image = self._combine_images(images)
-            if image is not None:
-                image = cv2.merge((image, image, image))
-        self.images['Gray'] = image
+            images = list(images)
+        self.sources['Gray'] = (images,)
 
     def set_line(self, points, image):
         if image is None:
             return
+        self.sources['Line'] = (points, image)
+
+    def _compose(self, mode, source):
+        if source is None:
+            return None
+
+        if mode == 'Texture':
+            return source[0]
+
+        if mode == 'Laser':
+            return self._combine_images(source[0])
+
+        if mode == 'Gray':
+            image = None
+            if source[0] is not None:
+                image = self._combine_images(source[0])
+                if image is not None:
+                    image = cv2.merge((image, image, image))
+            return image
 
-        line_colors = cycle([[255,0,0],[0,255,255],[0,255,0],[255,0,255]])
-        lines = np.zeros_like(image)
-        for p in points:
-            c = next(line_colors)
-            if p:
-                lines[p[1].astype(int), np.around(p[0]).astype(int)] = c
+        if mode == 'Line':
+            points, image = source
+            line_colors = cycle([[255,0,0],[0,255,255],[0,255,0],[255,0,255]])
+            lines = np.zeros_like(image)
+            for p in points:
+                c = next(line_colors)
+                if p:
+                    lines[p[1].astype(int), np.around(p[0]).astype(int)] = c
 
-        self.images['Line'] = cv2.addWeighted(image,0.5,lines,1.,0.)
+            return cv2.addWeighted(image,0.5,lines,1.,0.)
 
     def _combine_images(self, images):
         im = [i for i in images if i is not None]
@@ -70,4 +97,15 @@ class CurrentVideo(object):
             return image
 
     def capture(self):
-        return self.images[self.mode]
+        mode = self.mode
+        source = self.sources[mode]
+        if mode == self._image_mode and \
+           (source is self._image_source or
+            time.time() - self._image_time < self.min_interval):
+            return self._image
+
+        self._image = self._compose(mode, source)
+        self._image_mode = mode
+        self._image_source = source
+        self._image_time = time.time()
+        return self._image
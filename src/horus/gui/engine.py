@@ -16,6 +16,7 @@ from horus.engine.calibration.autocheck import Autocheck
 from horus.engine.calibration.laser_triangulation import LaserTriangulation
 from horus.engine.calibration.platform_extrinsics import PlatformExtrinsics
 from horus.engine.calibration.combo_calibration import ComboCalibration
+from horus.engine.calibration.flush_calibration import FlushCalibration
 #from horus.engine.calibration.cloud_correction import CloudCorrection
 
 from horus.engine.algorithms.image_capture import ImageCapture
@@ -38,6 +39,7 @@ scanner_autocheck = Autocheck() # no params
 laser_triangulation = LaserTriangulation()
 platform_extrinsics = PlatformExtrinsics()
 combo_calibration = ComboCalibration()
+flush_calibration = FlushCalibration()
 image_capture = ImageCapture()
 image_detection = ImageDetection() # no params
 laser_segmentation = LaserSegmentation()
@@ -207,8 +207,8 @@ class MainWindow(wx.Frame):
         dlg.Destroy()
 
     def on_save_model(self, event):
-        if self.workbench['scanning'].scene_view._object is None or \
-           not self.workbench['scanning'].scene_view._object._is_point_cloud:
+        _object = self.workbench['scanning'].scene_view._object
+        if _object is None:
             return
         dlg = wx.FileDialog(self, _("Save 3D model"), os.path.split(
             profile.settings['last_file'])[0], style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
@@ -219,11 +219,19 @@ class MainWindow(wx.Frame):
         dlg.SetWildcard(wildcard_filter)
         if dlg.ShowModal() == wx.ID_OK:
             filename = dlg.GetPath()
-            if not filename.endswith('.ply'):
+            if os.path.splitext(filename)[1].lower() not in file_extensions:
                 if sys.is_linux():  # hack for linux, as for some reason the .ply is not appended.
                     filename += '.ply'
-            mesh_loader.save_mesh(filename, self.workbench['scanning'].scene_view._object)
-            self.append_last_file(filename)
+            if _object.is_point_cloud() and os.path.splitext(filename)[1].lower() == '.stl':
+                # STL keeps triangles only
+                msg = wx.MessageDialog(self, _("Point cloud can not be saved as STL. "
+                                               "Build mesh or save as PLY"),
+                                       _("Save 3D model"), wx.OK | wx.ICON_ERROR)
+                msg.ShowModal()
+                msg.Destroy()
+            else:
+                mesh_loader.save_mesh(filename, _object)
+                self.append_last_file(filename)
         dlg.Destroy()
 
     def on_clear_model(self, event):
@@ -633,19 +641,4 @@ class MainWindow(wx.Frame):
         driver.board.baud_rate = profile.settings['baud_rate']
         driver.board.motor_invert(profile.settings['invert_motor'])
 
-        flush_setting = 'flush_'
-        flush_stream_setting = 'flush_stream_'
-        if sys.is_linux():
-            flush_setting += 'linux'
-            flush_stream_setting += 'linux'
-        elif sys.is_darwin():
-            flush_setting += 'darwin'
-            flush_stream_setting += 'darwin'
-        elif sys.is_windows():
-            flush_setting += 'windows'
-            flush_stream_setting += 'windows'
-
-        texture, laser, pattern, chmode = profile.settings[flush_setting]
-        image_capture.set_flush_values(texture, laser, pattern, chmode)
-        texture, laser, pattern, chmode = profile.settings[flush_stream_setting]
-        image_capture.set_flush_stream_values(texture, laser, pattern, chmode)
+        image_capture.read_flush_profile()
@@ -78,12 +78,18 @@ class ImageView(wx.Panel):
             return
         (w, h, self.x_offset, self.y_offset) = self.get_best_size()
         if w > 0 and h > 0:
-            self.bitmap = wx.BitmapFromImage(self.image.Scale(w, h, self.quality))
+            if tuple(self.image.GetSize()) == (int(w), int(h)):
+                # already display sized
+                self.bitmap = wx.BitmapFromImage(self.image)
+            else:
+                self.bitmap = wx.BitmapFromImage(self.image.Scale(w, h, self.quality))
             self.Refresh()
 
-    def get_best_size(self):
+    def get_best_size(self, image_size=None):
         (wwidth, wheight) = self.current_size
-        (width, height) = self.image.GetSize()
+        if image_size is None:
+            image_size = self.image.GetSize()
+        (width, height) = image_size
 
         if height > 0 and wheight > 0:
             if float(width) / height > float(wwidth) / wheight:
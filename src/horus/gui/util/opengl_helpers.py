@@ -6,10 +6,12 @@ __copyright__ = 'Copyright (C) 2014-2016 Mundo Reader S.L.\
                  Copyright (C) 2013 David Braam from Cura Project'
 __license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
 
+import os
 import wx
 import numpy
 
 from horus.util.resources import get_path_for_image
+from horus.util.point_cloud_octree import PointOctree
 
 import OpenGL
 
@@ -23,7 +25,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from sys import platform as _platform
-if _platform != 'darwin':
+if _platform != 'darwin' and os.environ.get('PYOPENGL_PLATFORM') not in ('osmesa', 'egl'):
     glutInit()  # Hack; required before glut can be called. Not required for all OS.
 
 
@@ -48,7 +50,7 @@ def has_shader_support():
 
 class GLShader(GLReferenceCounter):
 
-    def __init__(self, vertex_program, fragment_program):
+    def __init__(self, vertex_program, fragment_program, attributes=None):
         super(GLShader, self).__init__()
         self._vertex_program = vertex_program
         self._fragment_program = fragment_program
@@ -64,6 +66,11 @@ class GLShader(GLReferenceCounter):
             self._program = glCreateProgram()
             glAttachShader(self._program, vertex_shader)
             glAttachShader(self._program, fragment_shader)
+            # Generic vertex attributes go to locations 1, 2, ... in GLVBO
+            # attribute_arrays order. Location 0 is gl_Vertex
+            if attributes is not None:
+                for index, name in enumerate(attributes):
+                    glBindAttribLocation(self._program, index + 1, name)
             glLinkProgram(self._program)
             # Validation has to occur *after* linking
             glValidateProgram(self._program)
@@ -93,6 +100,12 @@ class GLShader(GLReferenceCounter):
         if self._program is not None:
             if type(value) is float:
                 glUniform1f(glGetUniformLocation(self._program, name), value)
+            elif type(value) is int:
+                glUniform1i(glGetUniformLocation(self._program, name), value)
+            elif type(value) is numpy.ndarray and value.size == 3:
+                glUniform3fv(
+                    glGetUniformLocation(self._program, name), 1,
+                    value.astype(numpy.float32))
             elif type(value) is numpy.matrix:
                 glUniformMatrix3fv(
                     glGetUniformLocation(self._program, name), 1, False,
@@ -156,10 +169,17 @@ class GLVBO(GLReferenceCounter):
     """
 
     def __init__(self, render_type, vertex_array,
-                 normal_array=None, indices_array=None, color_array=None, point_size=2):
+                 normal_array=None, indices_array=None, color_array=None, point_size=2,
+                 capacity=None, attribute_arrays=None):
         super(GLVBO, self).__init__()
         self._render_type = render_type
         self._point_size = point_size
+        self._capacity = len(vertex_array)
+        # Shader capable drivers draw whole buffer in one call.
+        # Legacy ones get batches of fixed size
+        self._single_draw = has_shader_support()
+        # (location, components, buffer) of generic vertex attributes
+        self._attributes = []
         if not bool(glGenBuffers):  # Fallback if buffers are not supported.
             self._vertex_array = vertex_array
             self._normal_array = normal_array
@@ -183,18 +203,19 @@ class GLVBO(GLReferenceCounter):
                 glBufferData(GL_ARRAY_BUFFER, numpy.concatenate(
                     (vertex_array, normal_array), 1), GL_STATIC_DRAW)
             else:
+                # Point clouds may grow. Keep room for appends
+                if capacity is not None:
+                    self._capacity = max(capacity, self._size)
                 if self._has_color:
                     glPointSize(self._point_size)
                     self._buffer = glGenBuffers(2)
-                    glBindBuffer(GL_ARRAY_BUFFER, self._buffer[0])
-                    glBufferData(GL_ARRAY_BUFFER, vertex_array, GL_STATIC_DRAW)
-                    glBindBuffer(GL_ARRAY_BUFFER, self._buffer[1])
-                    glBufferData(
-                        GL_ARRAY_BUFFER, numpy.array(color_array, numpy.uint8), GL_STATIC_DRAW)
                 else:
                     self._buffer = glGenBuffers(1)
-                    glBindBuffer(GL_ARRAY_BUFFER, self._buffer)
-                    glBufferData(GL_ARRAY_BUFFER, vertex_array, GL_STATIC_DRAW)
+                if attribute_arrays is not None and has_shader_support():
+                    for index, array in enumerate(attribute_arrays):
+                        components = 1 if array.ndim == 1 else array.shape[1]
+                        self._attributes.append((index + 1, components, glGenBuffers(1)))
+                self._allocate(vertex_array, color_array, attribute_arrays)
 
             glBindBuffer(GL_ARRAY_BUFFER, 0)
             if self._has_indices:
@@ -204,7 +225,64 @@ class GLVBO(GLReferenceCounter):
                 glBufferData(GL_ELEMENT_ARRAY_BUFFER, numpy.array(
                     indices_array, numpy.uint32), GL_STATIC_DRAW)
 
-    def render(self):
+    def _vertex_buffers(self):
+        # (buffer, item size in bytes) of vertex, color and attribute data
+        if self._has_color:
+            buffers = [(self._buffer[0], 3 * 4), (self._buffer[1], 3)]
+        else:
+            buffers = [(self._buffer, 3 * 4)]
+        return buffers + [(buffer, components * 4) for index, components, buffer in self._attributes]
+
+    def _arrays(self, vertex_array, color_array, attribute_arrays, start, end):
+        arrays = [numpy.ascontiguousarray(vertex_array[start:end], numpy.float32)]
+        if self._has_color:
+            arrays.append(numpy.ascontiguousarray(color_array[start:end], numpy.uint8))
+        for i in xrange(len(self._attributes)):
+            arrays.append(numpy.ascontiguousarray(attribute_arrays[i][start:end], numpy.float32))
+        return arrays
+
+    def _allocate(self, vertex_array, color_array, attribute_arrays=None):
+        # Buffers of self._capacity items filled with first self._size ones
+        arrays = self._arrays(vertex_array, color_array, attribute_arrays, 0, self._size)
+        for (buffer, item_size), data in zip(self._vertex_buffers(), arrays):
+            glBindBuffer(GL_ARRAY_BUFFER, buffer)
+            if self._capacity == self._size:
+                glBufferData(GL_ARRAY_BUFFER, data, GL_DYNAMIC_DRAW)
+            else:
+                glBufferData(GL_ARRAY_BUFFER, self._capacity * item_size, None, GL_DYNAMIC_DRAW)
+                if self._size > 0:
+                    glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+
+    def append(self, vertex_array, color_array=None, attribute_arrays=None):
+        """
+        Upload items added to the end of vertex_array, color_array and
+        attribute_arrays since the last call. Only the new range is uploaded,
+        unless the buffer has to grow.
+        """
+        size = len(vertex_array)
+        if size <= self._size:
+            return
+        if self._buffer is None:
+            self._vertex_array = vertex_array
+            self._color_array = color_array
+            self._size = size
+            return
+        assert not self._has_normals and not self._has_indices, "Only point VBO can grow"
+
+        if size > self._capacity:
+            # geometric growth keeps amount of reallocations logarithmic
+            self._capacity = max(size, 2 * self._capacity)
+            self._size = size
+            self._allocate(vertex_array, color_array, attribute_arrays)
+        else:
+            arrays = self._arrays(vertex_array, color_array, attribute_arrays, self._size, size)
+            for (buffer, item_size), data in zip(self._vertex_buffers(), arrays):
+                glBindBuffer(GL_ARRAY_BUFFER, buffer)
+                glBufferSubData(GL_ARRAY_BUFFER, self._size * item_size, data.nbytes, data)
+            self._size = size
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _bind(self):
         glEnableClientState(GL_VERTEX_ARRAY)
         if self._buffer is None:
             glVertexPointer(3, GL_FLOAT, 0, self._vertex_array)
@@ -231,14 +309,37 @@ class GLVBO(GLReferenceCounter):
                     glBindBuffer(GL_ARRAY_BUFFER, self._buffer)
                     glVertexPointer(3, GL_FLOAT, 3 * 4, c_void_p(0))
 
+            for index, components, buffer in self._attributes:
+                glBindBuffer(GL_ARRAY_BUFFER, buffer)
+                glEnableVertexAttribArray(index)
+                glVertexAttribPointer(index, components, GL_FLOAT, GL_FALSE, 0, None)
+
             if self._has_indices:
                 glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self._buffer_indices)
 
+    def _unbind(self):
+        for index, components, buffer in self._attributes:
+            glDisableVertexAttribArray(index)
+        if self._buffer is not None:
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        if self._has_indices:
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+        if self._has_normals:
+            glDisableClientState(GL_NORMAL_ARRAY)
+        if self._has_color:
+            glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def render(self):
+        self._bind()
         if self._has_indices:
             if self._buffer is None:
                 glDrawElements(self._render_type, self._size, GL_UNSIGNED_INT, self._indices_array)
             else:
                 glDrawElements(self._render_type, self._size, GL_UNSIGNED_INT, c_void_p(0))
+        elif self._single_draw:
+            glDrawArrays(self._render_type, 0, self._size)
         else:
             # Warning, batch_size needs to be dividable by 4 (quads), 3 (triangles) and
             # 2 (lines). Current value is magic.
@@ -248,20 +349,24 @@ class GLVBO(GLReferenceCounter):
             for i in xrange(0, int(self._size / batch_size)):
                 glDrawArrays(self._render_type, i * batch_size, batch_size)
             glDrawArrays(self._render_type, extra_start_pos, extra_count)
-
-        if self._buffer is not None:
-            glBindBuffer(GL_ARRAY_BUFFER, 0)
-        if self._has_indices:
-            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
-
-        if self._has_normals:
-            glDisableClientState(GL_NORMAL_ARRAY)
-        if self._has_color:
-            glDisableClientState(GL_COLOR_ARRAY)
-        glDisableClientState(GL_VERTEX_ARRAY)
+        self._unbind()
+
+    def render_ranges(self, first, count):
+        """
+        Draw (first, count) ranges of non indexed vertexes in a single call.
+        """
+        if len(first) == 0:
+            return
+        self._bind()
+        glMultiDrawArrays(self._render_type, numpy.asarray(first, numpy.int32),
+                          numpy.asarray(count, numpy.int32), len(first))
+        self._unbind()
 
     def release(self):
         if self._buffer is not None:
+            for index, components, buffer in self._attributes:
+                glDeleteBuffers(1, [buffer])
+            self._attributes = []
             if self._has_color:
                 glBindBuffer(GL_ARRAY_BUFFER, self._buffer[0])
                 glBufferData(GL_ARRAY_BUFFER, None, GL_STATIC_DRAW)
@@ -291,6 +396,33 @@ class GLVBO(GLReferenceCounter):
             logger.warning("VBO was not properly released!")
 
 
+class GLPointCloudLOD(GLVBO):
+    """
+    Point cloud VBO drawn at level of detail selected by octree.
+    Vertexes are uploaded in octree order.
+    """
+
+    def __init__(self, vertex_array, color_array, point_size=2, attribute_arrays=None):
+        self.octree = PointOctree(vertex_array)
+        order = self.octree.order
+        if attribute_arrays is not None:
+            attribute_arrays = [array[order] for array in attribute_arrays]
+        super(GLPointCloudLOD, self).__init__(
+            GL_POINTS, vertex_array[order], color_array=color_array[order], point_size=point_size,
+            attribute_arrays=attribute_arrays)
+
+    def render_lod(self, budget=None):
+        # Draw visible part of cloud for current GL matrices.
+        # budget limits amount of points, None draws visible leaves in full
+        model_matrix = numpy.asarray(glGetDoublev(GL_MODELVIEW_MATRIX)).reshape(4, 4)
+        proj_matrix = numpy.asarray(glGetDoublev(GL_PROJECTION_MATRIX)).reshape(4, 4)
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        # GL matrices are column major
+        mvp = numpy.dot(model_matrix, proj_matrix).T
+        first, count = self.octree.select(mvp, viewport[3], self._point_size, budget)
+        self.render_ranges(first, count)
+
+
 def unproject(winx, winy, winz, model_matrix, proj_matrix, viewport):
     """
     Projects window position to 3D space. (gluUnProject).
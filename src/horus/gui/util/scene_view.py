@@ -9,6 +9,7 @@ __license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.ht
 import os
 import gc
 import wx
+import time
 import math
 import numpy as np
 import traceback
@@ -18,11 +19,16 @@ OpenGL.ERROR_CHECKING = False
 from OpenGL.GLU import *
 from OpenGL.GL import *
 
-from horus.util import profile, mesh_loader, model, system as sys
+from horus.util import profile, mesh_loader, model, point_cloud_filter, system as sys
+from horus.util.point_picker import PointPicker
+from horus.util.gryphon_util import decode_color
 from horus.gui.util import opengl_helpers, opengl_gui
 
 class SceneView(opengl_gui.glGuiPanel):
 
+    # voxel size (mm) of scan preview when points are not stored in scene
+    STORED_PREVIEW_VOXEL = 0.5
+
     def __init__(self, parent):
         super(SceneView, self).__init__(parent)
 
@@ -32,16 +38,20 @@ class SceneView(opengl_gui.glGuiPanel):
         self._object = None
         self._object_shader = None
         self._object_load_shader = None
+        self._point_cloud_shader = None
         self._obj_color = None
         self._mouse_x = -1
         self._mouse_y = -1
         self._mouse_state = None
         self._mouse_3d_pos = np.array([0, 0, 0], np.float32)
+        self._picker = None
+        self._picker_key = None
         self._view_target = np.array([0, 0, 0], np.float32)
         self._anim_view = None
         self._anim_zoom = None
         self._platform_mesh = {}
         self._platform_texture = None
+        self._display_lists = {}
 
         self._viewport = None
         self._model_matrix = None
@@ -59,6 +69,22 @@ class SceneView(opengl_gui.glGuiPanel):
         self._view_roi = False
         self._point_size = 2
 
+        # large point clouds are drawn by octree level of detail while view moves
+        self._point_budget = profile.settings['point_budget']
+        self._scanning = False
+        self._last_interaction = 0
+        self._full_detail_timer = None
+
+        # point cloud position correction and coloring applied by shader
+        self._correction = None
+        self._color_mode = profile.settings['view_color_mode']
+
+        # voxel downsampled copy of scanned point cloud for live preview
+        self._preview_grid = None
+        self._preview_mesh = None
+        self._preview_update = 0
+        self._store_points = True
+
 #        self._object_point_cloud = []
 #        self._object_texture = []
 
@@ -80,6 +106,8 @@ class SceneView(opengl_gui.glGuiPanel):
             self._object_shader_no_light.release()
         if self._object_load_shader is not None:
             self._object_load_shader.release()
+        if self._point_cloud_shader is not None:
+            self._point_cloud_shader.release()
         if self._object is not None:
             if self._object._mesh is not None:
                 if self._object._mesh.vbo is not None and self._object._mesh.vbo.dec_ref():
@@ -89,7 +117,7 @@ class SceneView(opengl_gui.glGuiPanel):
             del self._object
         if self._platform_mesh is not None:
             for _object in self._platform_mesh.values():
-                if _object._mesh is not None:
+                if _object is not None and _object._mesh is not None:
                     if _object._mesh.vbo is not None and _object._mesh.vbo.dec_ref():
                         self.gl_release_list.append(_object._mesh.vbo)
                         _object._mesh.vbo.release()
@@ -97,20 +125,63 @@ class SceneView(opengl_gui.glGuiPanel):
                 del _object
         gc.collect()
 
-    def create_default_object(self):
+    def create_default_object(self, store_points=True):
+        # store_points - keep scanned points in object mesh. Otherwise scan
+        # is stored elsewhere (range image) and scene shows voxel preview only
         self._clear_scene()
         self._object = model.Model(None, is_point_cloud=True)
         self._object._add_mesh()
-        self._object._mesh._prepare_vertex_count(4000000)
+        self._store_points = store_points
+        if store_points:
+            self._object._mesh._prepare_vertex_count(4000000)
+        self._scanning = True
+        voxel_size = profile.settings['preview_voxel_size']
+        if not store_points and voxel_size <= 0:
+            voxel_size = self.STORED_PREVIEW_VOXEL
+        if voxel_size > 0:
+            self._preview_grid = point_cloud_filter.VoxelGrid(voxel_size)
+            self._preview_mesh = model.Mesh(None)
+            self._preview_update = time.time()
         return self._object
 
+    def end_preview(self):
+        # show full point cloud
+        if self._preview_mesh is not None:
+            self._preview_mesh.clear_vbo()
+        self._preview_grid = None
+        self._preview_mesh = None
+        if self._scanning:
+            self._scanning = False
+            # growing VBO is rebuilt with level of detail if cloud is large
+            if self._object is not None and self._object._mesh is not None and \
+               self._object._mesh.vertex_count > self._point_budget > 0:
+                self._object._mesh.clear_vbo()
+        self.queue_refresh()
+
+    def _update_preview(self, point, color):
+        # New voxels are appended to preview VBO. Means of existing voxels
+        # change too: whole preview is uploaded again at most once a second
+        grid = self._preview_grid
+        mesh = self._preview_mesh
+        grid.add(point, color)
+        if time.time() - self._preview_update > 1.0:
+            self._preview_update = time.time()
+            mesh.vertex_count = 0
+            mesh.add_pointcloud(grid.get_vertexes(), grid.get_colors())
+            mesh.clear_vbo()
+        elif len(grid) > mesh.vertex_count:
+            start = mesh.vertex_count
+            mesh.add_pointcloud(grid.get_vertexes(start), grid.get_colors(start))
+
     def append_point_cloud(self, point, color, meta=None):
 #        self._object_point_cloud.append(point)
 #        self._object_texture.append(color)
         # TODO: optimize
         if self._object is not None:
-            if self._object._mesh is not None:
+            if self._object._mesh is not None and self._store_points:
                 self._object._mesh.add_pointcloud(point.T, color.T, meta = meta)
+            if self._preview_grid is not None:
+                self._update_preview(point.T, color.T)
             # Conpute Z center
             if point.shape[1] > 0:
                 zmax = max(point[2])
@@ -151,7 +222,17 @@ class SceneView(opengl_gui.glGuiPanel):
         except:
             traceback.print_exc()
 
+    def set_object(self, obj):
+        self._clear_scene()
+        self._object = obj
+        self.center_object()
+        self.queue_refresh()
+
     def _clear_scene(self):
+        self.end_preview()
+        self._correction = None
+        self._picker = None
+        self._picker_key = None
         if self._object is not None:
             if self._object._mesh is not None:
                 if self._object._mesh.vbo is not None and self._object._mesh.vbo.dec_ref():
@@ -272,6 +353,7 @@ class SceneView(opengl_gui.glGuiPanel):
     def on_mouse_down(self, e):
         self._mouse_x = e.GetX()
         self._mouse_y = e.GetY()
+        self._mouse_3d_pos = self.pick(self._mouse_x, self._mouse_y)
         self._mouse_click_3d_pos = self._mouse_3d_pos
         self._mouse_click_focus = self._object
         if e.ButtonDClick():
@@ -305,6 +387,68 @@ class SceneView(opengl_gui.glGuiPanel):
     def set_point_size(self, value):
         self._point_size = value
 
+    def set_correction(self, value):
+        # Platform offset correction of current point cloud drawn by shader,
+        # rotated by slice angle of each point. None disables.
+        # Returns False if shaders are not available
+        if self._point_cloud_shader is None:
+            self._correction = None
+            return False
+        self._correction = value
+        self.queue_refresh()
+        return True
+
+    def set_color_mode(self, value):
+        self._color_mode = value
+        self.queue_refresh()
+
+    def _bind_point_cloud_shader(self):
+        # returns bound shader
+        if self._point_cloud_shader is None:
+            self._object_shader_no_light.bind()
+            return self._object_shader_no_light
+        shader = self._point_cloud_shader
+        shader.bind()
+        if self._correction is not None:
+            shader.set_uniform('correction', np.asarray(self._correction, np.float32))
+        else:
+            shader.set_uniform('correction', np.zeros(3, np.float32))
+        shader.set_uniform('color_mode', ['Texture', 'Laser', 'Slice', 'Height'].index(self._color_mode))
+        shader.set_uniform('color_l', np.array(decode_color(profile.settings['point_cloud_color_l']), np.float32) / 255)
+        shader.set_uniform('color_r', np.array(decode_color(profile.settings['point_cloud_color_r']), np.float32) / 255)
+        z_min = 0.0
+        if self._object._min is not None:
+            z_min = float(self._object._min[2])
+        shader.set_uniform('z_min', z_min)
+        shader.set_uniform('z_max', z_min + max(float(self._object.get_size()[2]), 1.0))
+        return shader
+
+    def _point_attributes(self, mesh):
+        # slice angle and laser id of points for point cloud shader
+        if self._point_cloud_shader is None or len(mesh.vertexes_meta) < mesh.vertex_count:
+            return None
+        return mesh.get_shader_attributes()
+
+    def set_point_budget(self, value):
+        self._point_budget = value
+        self.queue_refresh()
+
+    def _interacting(self):
+        # view moved recently: draw reduced detail and schedule full detail redraw
+        if self._mouse_state == 'drag' or self._anim_view is not None or self._anim_zoom is not None:
+            self._last_interaction = time.time()
+        if time.time() - self._last_interaction > 0.5:
+            return False
+        if self._full_detail_timer is None:
+            self._full_detail_timer = wx.CallLater(600, self._on_full_detail_timer)
+        else:
+            self._full_detail_timer.Restart(600)
+        return True
+
+    def _on_full_detail_timer(self):
+        self._full_detail_timer = None
+        self.queue_refresh()
+
     def on_delete_object(self, event):
         if self._object is not None:
             dlg = wx.MessageDialog(
@@ -355,6 +499,7 @@ class SceneView(opengl_gui.glGuiPanel):
                 self._zoom = 1.0
             if self._zoom > np.max(self._machine_size) * 3:
                 self._zoom = np.max(self._machine_size) * 3
+        self._last_interaction = time.time()
         self.Refresh()
 
     def on_mouse_leave(self, e):
@@ -377,6 +522,61 @@ class SceneView(opengl_gui.glGuiPanel):
         else:
             return np.array([0, 0, 0], np.float32), np.array([0, 0, 1], np.float32)
 
+    def _object_transform(self, obj):
+        # (row matrix, translations) of _render_object model transform:
+        # world = ((p * M + t2) * T) + t1
+        matrix = obj.get_matrix().getA()
+        temp = np.identity(3)
+        if self.temp_matrix is not None:
+            temp = self.temp_matrix.getA()
+        t1 = np.array([obj.get_position()[0], obj.get_position()[1], obj.get_size()[2] / 2])
+        t2 = -np.asarray(obj.get_draw_offset(), np.float64) - [0, 0, obj.get_size()[2] / 2]
+        return matrix, temp, t1, t2
+
+    def pick(self, x, y):
+        # 3D position of object point under window position. Picked on CPU
+        # by view ray, so rendering never waits for depth buffer readback
+        if self._viewport is None:
+            return np.array([0, 0, 0], np.float32)
+        winy = self._viewport[1] + self._viewport[3] - y
+        p0 = opengl_helpers.unproject(x, winy, 0, self._model_matrix, self._proj_matrix, self._viewport)
+        p1 = opengl_helpers.unproject(x, winy, 1, self._model_matrix, self._proj_matrix, self._viewport)
+        if p0 is None or p1 is None:
+            return np.array([0, 0, 0], np.float32)
+        p0 = np.asarray(p0, np.float64).ravel()[:3]
+        p1 = np.asarray(p1, np.float64).ravel()[:3]
+
+        pos = None
+        obj = self._object
+        if obj is not None and obj._mesh is not None and obj._mesh.vertex_count > 0:
+            mesh = obj._mesh
+            key = (mesh, mesh.vbo, mesh.vertex_count)
+            if self._picker is None or self._picker_key != key:
+                self._picker = PointPicker(mesh.vertexes[:mesh.vertex_count])
+                self._picker_key = key
+
+            # view ray to object coordinates
+            matrix, temp, t1, t2 = self._object_transform(obj)
+            matrix_inv, temp_inv = np.linalg.inv(matrix), np.linalg.inv(temp)
+            origin = np.dot(np.dot(p0 - t1, temp_inv) - t2, matrix_inv)
+            direction = np.dot(np.dot(p1 - p0, temp_inv), matrix_inv)
+            # pick radius of few pixels at view target distance
+            radius = 3 * self._zoom * 2 * math.tan(math.radians(45.0 / 2)) / self._viewport[3]
+            radius *= np.linalg.norm(direction) / np.linalg.norm(p1 - p0)
+            index = self._picker.pick(origin, direction, radius)
+            if index is not None:
+                pos = np.dot(np.dot(mesh.vertexes[index], matrix) + t2, temp) + t1
+
+        if pos is None:
+            # platform plane
+            d = p1 - p0
+            if d[2] == 0:
+                return np.array([0, 0, 0], np.float32)
+            pos = p0 - d * (p0[2] / d[2])
+        pos = np.array(pos, np.float32) - self._view_target
+        pos[2] -= self._z_offset
+        return pos
+
     def _init_3d_view(self):
         # set viewing projection
         size = self.GetSize()
@@ -470,6 +670,53 @@ class SceneView(opengl_gui.glGuiPanel):
                         gl_FragColor = vec4(gl_Color.xyz * light_amount, gl_Color[3]);
                     }
                     """)
+                self._point_cloud_shader = opengl_helpers.GLShader(
+                    """
+                    uniform vec3 correction;
+                    uniform int color_mode;
+                    uniform vec3 color_l;
+                    uniform vec3 color_r;
+                    uniform float z_min;
+                    uniform float z_max;
+                    attribute float slice_l;
+                    attribute float laser_id;
+
+                    vec3 hue(float h)
+                    {
+                        return clamp(abs(mod(h * 6.0 + vec3(0.0, 4.0, 2.0), 6.0) - 3.0) - 1.0, 0.0, 1.0);
+                    }
+
+                    void main(void)
+                    {
+                        vec4 v = gl_Vertex;
+                        // no correction for unknown slice (UNKNOWN_SLICE_L)
+                        float known = step(-7.0, slice_l);
+                        float c = cos(slice_l);
+                        float s = sin(slice_l);
+                        v.x += known * (c * correction.x + s * correction.y);
+                        v.y += known * (c * correction.y - s * correction.x);
+                        v.z += known * correction.z;
+                        gl_Position = gl_ModelViewProjectionMatrix * v;
+
+                        if (color_mode == 1)
+                            gl_FrontColor = vec4(mix(color_l, color_r, step(0.5, laser_id)), 1.0);
+                        else if (color_mode == 2)
+                            gl_FrontColor = vec4(hue(slice_l / 6.2831853), 1.0);
+                        else if (color_mode == 3)
+                            gl_FrontColor = vec4(hue(0.66 * clamp((z_max - v.z) / (z_max - z_min), 0.0, 1.0)), 1.0);
+                        else
+                            gl_FrontColor = gl_Color;
+                    }
+                    """,
+                    """
+                    void main(void)
+                    {
+                        gl_FragColor = gl_Color;
+                    }
+                    """, attributes=['slice_l', 'laser_id'])
+                if not self._point_cloud_shader.is_valid():
+                    self._point_cloud_shader.release()
+                    self._point_cloud_shader = None
                 self._object_load_shader = opengl_helpers.GLShader(
                     """
                     uniform float intensity;
@@ -517,19 +764,6 @@ class SceneView(opengl_gui.glGuiPanel):
         glClearColor(1, 1, 1, 1)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT | GL_STENCIL_BUFFER_BIT)
 
-        if self._mouse_x > -1:  # mouse has not passed over the opengl window.
-            glFlush()
-            # n = glReadPixels(self._mouse_x, self.GetSize().GetHeight() - 1 -
-            #                  self._mouse_y, 1, 1, GL_RGBA, GL_UNSIGNED_INT_8_8_8_8)[0][0] >> 8
-            f = glReadPixels(self._mouse_x, self.GetSize().GetHeight() - 1 -
-                             self._mouse_y, 1, 1, GL_DEPTH_COMPONENT, GL_FLOAT)[0][0]
-            # self.GetTopLevelParent().SetTitle(hex(n) + " " + str(f))
-            self._mouse_3d_pos = opengl_helpers.unproject(
-                self._mouse_x, self._viewport[1] + self._viewport[3] - self._mouse_y,
-                f, self._model_matrix, self._proj_matrix, self._viewport)
-            self._mouse_3d_pos -= self._view_target
-            self._mouse_3d_pos[2] -= self._z_offset
-
         self._init_3d_view()
         glTranslate(0, 0, -self._zoom)
         glRotate(-self._pitch, 1, 0, 0)
@@ -543,9 +777,10 @@ class SceneView(opengl_gui.glGuiPanel):
         if self._object is not None:
 
             if self._object.is_point_cloud() and opengl_helpers.has_shader_support():
-                self._object_shader_no_light.bind()
+                shader = self._bind_point_cloud_shader()
             else:
-                self._object_shader.bind()
+                shader = self._object_shader
+                shader.bind()
 
             brightness = 1.0
             glStencilOp(GL_INCR, GL_INCR, GL_INCR)
@@ -557,10 +792,7 @@ class SceneView(opengl_gui.glGuiPanel):
             glEnable(GL_DEPTH_TEST)
             glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
 
-            if self._object.is_point_cloud() and opengl_helpers.has_shader_support():
-                self._object_shader_no_light.unbind()
-            else:
-                self._object_shader.unbind()
+            shader.unbind()
 
         self._draw_machine()
 
@@ -577,16 +809,36 @@ class SceneView(opengl_gui.glGuiPanel):
         glMultMatrixf(opengl_helpers.convert_3x3_matrix_to_4x4(obj.get_matrix()))
 
         if obj.is_point_cloud():
-            if obj._mesh is not None:
-                if obj._mesh.vbo is None or obj._mesh.vertex_count > obj._mesh.vbo._size:
-                    if obj._mesh.vbo is not None:
-                        obj._mesh.vbo.release()
-                    obj._mesh.vbo = opengl_helpers.GLVBO(
-                        GL_POINTS,
-                        obj._mesh.vertexes[:obj._mesh.vertex_count],
-                        color_array=obj._mesh.colors[:obj._mesh.vertex_count],
-                        point_size=self._point_size)
-                obj._mesh.vbo.render()
+            mesh = obj._mesh
+            if obj is self._object and self._preview_mesh is not None:
+                mesh = self._preview_mesh
+            if mesh is not None:
+                if mesh.vbo is None:
+                    if not self._scanning and mesh.vertex_count > self._point_budget > 0:
+                        mesh.vbo = opengl_helpers.GLPointCloudLOD(
+                            mesh.vertexes[:mesh.vertex_count],
+                            mesh.colors[:mesh.vertex_count],
+                            point_size=self._point_size,
+                            attribute_arrays=self._point_attributes(mesh))
+                    else:
+                        mesh.vbo = opengl_helpers.GLVBO(
+                            GL_POINTS,
+                            mesh.vertexes[:mesh.vertex_count],
+                            color_array=mesh.colors[:mesh.vertex_count],
+                            point_size=self._point_size,
+                            attribute_arrays=self._point_attributes(mesh))
+                elif mesh.vertex_count > mesh.vbo._size:
+                    # scanning: upload new slices only
+                    mesh.vbo.append(mesh.vertexes[:mesh.vertex_count],
+                                    mesh.colors[:mesh.vertex_count],
+                                    self._point_attributes(mesh))
+                if isinstance(mesh.vbo, opengl_helpers.GLPointCloudLOD):
+                    if self._interacting():
+                        mesh.vbo.render_lod(self._point_budget)
+                    else:
+                        mesh.vbo.render_lod()
+                else:
+                    mesh.vbo.render()
         else:
             if obj._mesh is not None:
                 if obj._mesh.vbo is None:
@@ -599,97 +851,76 @@ class SceneView(opengl_gui.glGuiPanel):
                 obj._mesh.vbo.render()
         glPopMatrix()
 
+    def _machine_model(self):
+        # Platform model loaded and scaled once per model path and scale settings
+        key = (profile.settings['machine_model_path'],
+               profile.settings['machine_model_diameter'],
+               profile.settings['machine_diameter'],
+               profile.settings['machine_model_offset_x'],
+               profile.settings['machine_model_offset_y'],
+               profile.settings['machine_model_offset_z'])
+        if key in self._platform_mesh:
+            return self._platform_mesh[key]
+
+        for _object in self._platform_mesh.values():
+            if _object is not None and _object._mesh.vbo is not None and \
+               _object._mesh.vbo.dec_ref():
+                _object._mesh.vbo.release()
+        self._platform_mesh.clear()
+
+        mesh = mesh_loader.load_mesh(key[0])
+        if mesh is not None:
+            machine_scale = 1
+            try:
+                if profile.settings['machine_model_diameter'] > 0:
+                    machine_scale = profile.settings['machine_model_diameter'] / profile.settings['machine_diameter']
+                elif profile.settings['machine_model_diameter'] == 0:
+                    machine_scale = mesh.get_size()[0] / profile.settings['machine_diameter']
+            except:
+                pass
+
+            mesh._matrix /= machine_scale
+            mesh._draw_offset = np.array(
+                [profile.settings['machine_model_offset_x'],
+                 profile.settings['machine_model_offset_y'],
+                 profile.settings['machine_model_offset_z']
+                 ], np.float32) / machine_scale
+        self._platform_mesh[key] = mesh
+        return mesh
+
+    def _call_list(self, name, key, draw):
+        # Immediate mode drawing compiled to display list, rebuilt when key changes
+        cached = self._display_lists.get(name)
+        if cached is not None:
+            if cached[0] == key:
+                glCallList(cached[1])
+                return
+            glDeleteLists(cached[1], 1)
+        list_id = glGenLists(1)
+        glNewList(list_id, GL_COMPILE_AND_EXECUTE)
+        draw()
+        glEndList()
+        self._display_lists[name] = (key, list_id)
+
     def _draw_machine(self):
         glEnable(GL_BLEND)
-        machine_model_path = profile.settings['machine_model_path']
         glEnable(GL_CULL_FACE)
 
         # Draw Platform
-        if machine_model_path in self._platform_mesh:
-            try:  # TODO: Fix this. If not in the Scanning workbench, _draw_machine() fails.
-                self._platform_mesh[machine_model_path]._mesh.vbo.release()
-            except:
-                pass
-
-        mesh = mesh_loader.load_mesh(machine_model_path)
+        mesh = self._machine_model()
         if mesh is not None:
-            self._platform_mesh[machine_model_path] = mesh
-        else:
-            self._platform_mesh[machine_model_path] = None
-
-        machine_scale = 1
-        try:
-             if profile.settings['machine_model_diameter'] > 0:
-                 machine_scale = profile.settings['machine_model_diameter'] / profile.settings['machine_diameter']
-             elif profile.settings['machine_model_diameter'] == 0:
-                 machine_scale = mesh.get_size()[0] / profile.settings['machine_diameter']
-        except:
-            pass
-
-        mesh._matrix /= machine_scale
-        self._platform_mesh[machine_model_path]._draw_offset = np.array(
-            [profile.settings[ 'machine_model_offset_x'],
-            profile.settings[ 'machine_model_offset_y'],
-            profile.settings[ 'machine_model_offset_z'] 
-            ], np.float32) / machine_scale
-        glColor4f(0.6, 0.6, 0.6, 0.5)
-        self._object_shader.bind()
-        self._render_object(self._platform_mesh[machine_model_path])
-        self._object_shader.unbind()
+            glColor4f(0.6, 0.6, 0.6, 0.5)
+            self._object_shader.bind()
+            self._render_object(mesh)
+            self._object_shader.unbind()
         glDisable(GL_CULL_FACE)
 
         glDepthMask(False)
 
-        machine_shape = profile.settings['machine_shape']
-
         if self._view_roi:
-            polys = profile.get_roi_size_polygons()
-            height = profile.settings['roi_height']
-
-            # Draw the sides of the build volume.
-            glBegin(GL_QUADS)
-            for n in xrange(0, len(polys[0])):
-                if machine_shape == 'Rectangular':
-                    if n % 2 == 0:
-                        glColor4ub(5, 171, 231, 96)
-                    else:
-                        glColor4ub(5, 171, 231, 64)
-                elif machine_shape == 'Circular':
-                    glColor4ub(5, 171, 231, 96)
-                    # glColor4ub(200, 200, 200, 150)
-
-                glVertex3f(polys[0][n][0], polys[0][n][1], height)
-                glVertex3f(polys[0][n][0], polys[0][n][1], 0)
-                glVertex3f(polys[0][n - 1][0], polys[0][n - 1][1], 0)
-                glVertex3f(polys[0][n - 1][0], polys[0][n - 1][1], height)
-            glEnd()
-
-            # Draw bottom and top of build volume.
-            glColor4ub(5, 171, 231, 150)  # 128)
-            # glColor4ub(200, 200, 200, 200)
-            glBegin(GL_TRIANGLE_FAN)
-            for p in polys[0][::-1]:
-                glVertex3f(p[0], p[1], 0)
-            glEnd()
-            glBegin(GL_TRIANGLE_FAN)
-            for p in polys[0][::-1]:
-                glVertex3f(p[0], p[1], height)
-            glEnd()
-
-            quadric = gluNewQuadric()
-            gluQuadricNormals(quadric, GLU_SMOOTH)
-            gluQuadricTexture(quadric, GL_TRUE)
-            glColor4ub(0, 100, 200, 150)
-
-            gluCylinder(quadric, 6, 6, 1, 32, 16)
-            gluDisk(quadric, 0.0, 6, 32, 1)
-
-            glTranslate(0, 0, height - 1)
-            gluDisk(quadric, 0.0, 6, 32, 1)
-            gluCylinder(quadric, 6, 6, 1, 32, 16)
-            glTranslate(0, 0, -height + 1)
-
-        polys = profile.get_machine_size_polygons()
+            key = tuple(profile.settings[name] for name in (
+                'machine_shape', 'roi_diameter', 'roi_width', 'roi_depth', 'roi_height'))
+            self._call_list('roi', key, self._draw_roi)
 
         # Draw checkerboard
         if self._platform_texture is None:
@@ -700,15 +931,70 @@ class SceneView(opengl_gui.glGuiPanel):
         glColor4f(1, 1, 1, 0.5)
         glBindTexture(GL_TEXTURE_2D, self._platform_texture)
         glEnable(GL_TEXTURE_2D)
+        key = tuple(profile.settings[name] for name in (
+            'machine_shape', 'machine_diameter', 'machine_width', 'machine_depth', 'machine_height'))
+        self._call_list('platform', key, self._draw_platform)
+        glDisable(GL_TEXTURE_2D)
+
+        glDepthMask(True)
+        glDisable(GL_BLEND)
+
+    def _draw_roi(self):
+        machine_shape = profile.settings['machine_shape']
+        polys = profile.get_roi_size_polygons()
+        height = profile.settings['roi_height']
+
+        # Draw the sides of the build volume.
+        glBegin(GL_QUADS)
+        for n in xrange(0, len(polys[0])):
+            if machine_shape == 'Rectangular':
+                if n % 2 == 0:
+                    glColor4ub(5, 171, 231, 96)
+                else:
+                    glColor4ub(5, 171, 231, 64)
+            elif machine_shape == 'Circular':
+                glColor4ub(5, 171, 231, 96)
+                # glColor4ub(200, 200, 200, 150)
+
+            glVertex3f(polys[0][n][0], polys[0][n][1], height)
+            glVertex3f(polys[0][n][0], polys[0][n][1], 0)
+            glVertex3f(polys[0][n - 1][0], polys[0][n - 1][1], 0)
+            glVertex3f(polys[0][n - 1][0], polys[0][n - 1][1], height)
+        glEnd()
+
+        # Draw bottom and top of build volume.
+        glColor4ub(5, 171, 231, 150)  # 128)
+        # glColor4ub(200, 200, 200, 200)
+        glBegin(GL_TRIANGLE_FAN)
+        for p in polys[0][::-1]:
+            glVertex3f(p[0], p[1], 0)
+        glEnd()
+        glBegin(GL_TRIANGLE_FAN)
+        for p in polys[0][::-1]:
+            glVertex3f(p[0], p[1], height)
+        glEnd()
+
+        quadric = gluNewQuadric()
+        gluQuadricNormals(quadric, GLU_SMOOTH)
+        gluQuadricTexture(quadric, GL_TRUE)
+        glColor4ub(0, 100, 200, 150)
+
+        gluCylinder(quadric, 6, 6, 1, 32, 16)
+        gluDisk(quadric, 0.0, 6, 32, 1)
+
+        glTranslate(0, 0, height - 1)
+        gluDisk(quadric, 0.0, 6, 32, 1)
+        gluCylinder(quadric, 6, 6, 1, 32, 16)
+        glTranslate(0, 0, -height + 1)
+        gluDeleteQuadric(quadric)
+
+    def _draw_platform(self):
+        polys = profile.get_machine_size_polygons()
         glBegin(GL_TRIANGLE_FAN)
         for p in polys[0]:
             glTexCoord2f(p[0] / 20, p[1] / 20)
             glVertex3f(p[0], p[1], 0)
         glEnd()
-        glDisable(GL_TEXTURE_2D)
-
-        glDepthMask(True)
-        glDisable(GL_BLEND)
 
 # TODO: Remove this or put it in a seperate file
 
@@ -5,44 +5,42 @@ __author__ = 'Jesús Arroyo Torrens <jesus.arroyo@bq.com>'
 __copyright__ = 'Copyright (C) 2014-2016 Mundo Reader S.L.'
 __license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
 
+import cv2
+import time
 import wx._core
 
-from threading import Timer
+from threading import Thread, Lock, Event
 from horus.gui.util.image_view import ImageView
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 class VideoView(ImageView):
 
+    # frame period limits in seconds
+    MIN_INTERVAL = 1.0 / 30
+    MAX_INTERVAL = 0.5
+
     def __init__(self, parent, callback=None, size=(-1, -1), wxtimer=True):
         ImageView.__init__(self, parent, size=size, black=True)
 
         self.callback = callback
 
+        # Frames are always captured by worker thread. Kept for compatibility
         self.wxtimer = wxtimer
         self.playing = False
 
-        if self.wxtimer:
-            self.timer = wx.Timer(self)
-            self.Bind(wx.EVT_TIMER, self.on_timer, self.timer)
-
-    def on_timer(self, event):
-        try:
-            if self.wxtimer:
-                self.timer.Stop()
-            else:
-                self.timer.cancel()
-            if self.playing:
-                if self.callback is not None:
-                    frame = self.callback()
-                    if frame is not None:
-                        if self.playing:
-                            if self.wxtimer:
-                                self.set_frame(frame)
-                            else:
-                                wx.CallAfter(self.set_frame, frame)
-                    self._start()
-        except Exception as e:
-            print(e.message)
+        # Worker captures and resizes frames to display size. GUI shows
+        # newest one, frames not shown before next one arrives are dropped
+        self.interval = 0.1
+        self.frame_count = 0
+        self.dropped_count = 0
+        self._worker = None
+        self._stop_event = Event()
+        self._lock = Lock()
+        self._latest = None
+        self._posted = False
 
     def set_callback(self, callback):
         self.callback = callback
@@ -50,30 +48,75 @@ class VideoView(ImageView):
     def play(self, flush=True):
         if not self.playing:
             self.playing = True
+            self._stop_event.clear()
+            self._worker = Thread(target=self._run, args=(flush,))
+            self._worker.daemon = True
+            self._worker.start()
+
+    def _run(self, flush):
+        if flush and self.callback is not None:
+            # Flush video
+            self._capture()
+            self._capture()
+        while self.playing:
+            begin = time.time()
+            frame = self._capture()
+            if frame is not None and self.playing:
+                self._put_frame(self._display_frame(frame))
+            self._stop_event.wait(max(0, self.interval - (time.time() - begin)))
+
+    def _capture(self):
+        try:
             if self.callback is not None:
-                # Flush video
-                if flush:
-                    self.callback()
-                    self.callback()
-                frame = self.callback()
-                self.set_frame(frame)
-            self._start()
-
-    def _start(self):
-        if self.wxtimer:
-            self.timer.Start(milliseconds=100)
+                return self.callback()
+        except Exception as e:
+            logger.error("Video view capture error: {0}".format(e))
+        return None
+
+    def _display_frame(self, frame):
+        # resize off GUI thread, so GUI only converts frame to bitmap
+        height, width = frame.shape[:2]
+        (w, h, x_offset, y_offset) = self.get_best_size((width, height))
+        w, h = int(w), int(h)
+        if w > 0 and h > 0 and (w, h) != (width, height):
+            frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+        return frame
+
+    def _put_frame(self, frame):
+        with self._lock:
+            dropped = self._latest is not None
+            self._latest = frame
+            post = not self._posted
+            self._posted = True
+        # adaptive pacing: slow down while GUI does not keep up
+        if dropped:
+            self.dropped_count += 1
+            self.interval = min(self.interval * 1.5, self.MAX_INTERVAL)
         else:
-            self.timer = Timer(0.1, self.on_timer, (None,))
-            self.timer.start()
+            self.interval = max(self.interval * 0.9, self.MIN_INTERVAL)
+        if post:
+            wx.CallAfter(self._show_latest)
+
+    def _show_latest(self):
+        with self._lock:
+            frame = self._latest
+            self._latest = None
+            self._posted = False
+        if frame is not None and self.playing:
+            self.frame_count += 1
+            self.set_frame(frame)
 
     def stop(self):
         if self.playing:
             self.playing = False
-            if self.wxtimer:
-                self.timer.Stop()
-            else:
-                self.timer.cancel()
-                self.timer.join()
+            self._stop_event.set()
+            if self._worker is not None:
+                self._worker.join()
+                self._worker = None
+            with self._lock:
+                self._latest = None
+            logger.debug("Video view: {0} frames shown, {1} dropped".format(
+                self.frame_count, self.dropped_count))
 
     def reset(self):
         self.hide = True
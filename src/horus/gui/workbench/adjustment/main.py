@@ -52,6 +52,7 @@ class AdjustmentWorkbench(Workbench):
 
     def setup_engine(self):
         driver.camera.read_profile()
+        image_capture.read_flush_profile()
         self.current_video.mode = profile.settings['current_video_mode_adjustment']
         pattern.read_profile()
         calibration_data.read_profile_camera()
@@ -294,6 +294,18 @@ class ScanSegmentationPanel(ExpandablePanel):
             'window_enable_scanning', CheckBox,
             _("Filter pixels out of 2 * window value around the intensity peak"))
         self.add_control('refinement_scanning', ComboBox)
+        self.add_control(
+            'pyramid_scanning', ComboBox,
+            _("Detect the laser line on a downsampled image and refine it "
+              "only around the detected line. Faster for high resolution cameras"))
+        self.add_control(
+            'confidence_value_scanning', Slider,
+            _("Drop rows where the selected intensity peak is not clearly "
+              "better than the other peaks of the row (reflections)"))
+        self.add_control(
+            'multi_peak_enable_scanning', CheckBox,
+            _("Detect several intensity peaks per row and select the one "
+              "consistent with the neighbouring rows"))
 
     def update_callbacks(self):
         # self.update_callback('laser_color_detector_scanning', laser_segmentation.set_laser_color_detector)
@@ -306,6 +318,9 @@ class ScanSegmentationPanel(ExpandablePanel):
         self.update_callback('window_value_scanning', laser_segmentation.set_window_value)
         self.update_callback('window_enable_scanning', laser_segmentation.set_window_enable)
         self.update_callback('refinement_scanning', laser_segmentation.set_refinement_method)
+        self.update_callback('pyramid_scanning', laser_segmentation.set_pyramid)
+        self.update_callback('confidence_value_scanning', laser_segmentation.set_confidence_value)
+        self.update_callback('multi_peak_enable_scanning', laser_segmentation.set_multi_peak_enable)
 
     def on_selected(self):
         current_video.updating = True
@@ -603,6 +618,18 @@ class CalibrationSegmentationPanel(ExpandablePanel):
             'window_enable_calibration', CheckBox,
             _("Filter pixels out of 2 * window value around the intensity peak"))
         self.add_control('refinement_calibration', ComboBox)
+        self.add_control(
+            'pyramid_calibration', ComboBox,
+            _("Detect the laser line on a downsampled image and refine it "
+              "only around the detected line. Faster for high resolution cameras"))
+        self.add_control(
+            'confidence_value_calibration', Slider,
+            _("Drop rows where the selected intensity peak is not clearly "
+              "better than the other peaks of the row (reflections)"))
+        self.add_control(
+            'multi_peak_enable_calibration', CheckBox,
+            _("Detect several intensity peaks per row and select the one "
+              "consistent with the neighbouring rows"))
 
     def update_callbacks(self):
         # self.update_callback('laser_color_detector_calibration', laser_segmentation.set_laser_color_detector)
@@ -616,6 +643,9 @@ class CalibrationSegmentationPanel(ExpandablePanel):
         self.update_callback('window_value_calibration', laser_segmentation.set_window_value)
         self.update_callback('window_enable_calibration', laser_segmentation.set_window_enable)
         self.update_callback('refinement_calibration', laser_segmentation.set_refinement_method)
+        self.update_callback('pyramid_calibration', laser_segmentation.set_pyramid)
+        self.update_callback('confidence_value_calibration', laser_segmentation.set_confidence_value)
+        self.update_callback('multi_peak_enable_calibration', laser_segmentation.set_multi_peak_enable)
 
     def on_selected(self):
         current_video.updating = True
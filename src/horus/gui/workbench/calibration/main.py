@@ -144,6 +144,7 @@ class CalibrationWorkbench(Workbench):
         self.engine_mode = 'calibration'
 
         driver.camera.read_profile()
+        image_capture.read_flush_profile()
         image_capture.pattern_mode.read_profile('pattern_calibration')
         image_capture.texture_mode.read_profile('texture_scanning')
         image_capture.laser_mode.read_profile('laser_calibration')
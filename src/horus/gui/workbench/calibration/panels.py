@@ -9,12 +9,13 @@ import wx._core
 import numpy as np
 
 from horus.gui.engine import driver, pattern, calibration_data, laser_triangulation, \
-    platform_extrinsics, combo_calibration, image_capture
+    platform_extrinsics, combo_calibration, image_capture, flush_calibration
 from horus.util import profile, system as sys
 from horus.gui.util.custom_panels import ExpandablePanel, Slider, CheckBox, \
     FloatTextBox, FloatTextBoxArray, FloatLabel, FloatLabelArray, Button, \
-    IntLabel, IntTextBox, ComboBox
+    IntLabel, IntTextBox, ComboBox, CallbackButton
 from horus.gui.util.gryphon_controls import Header
+from horus.engine.calibration.flush_calibration import ChangeNotDetected
 
 
 class PatternSettings(ExpandablePanel):
@@ -182,6 +183,8 @@ class VideoSettings(ExpandablePanel):
             self.add_control('camera_width', IntTextBox, _("Width"))
             self.add_control('camera_height', IntTextBox, _("Height"))
             self.add_control('set_resolution_button', Button, _("Set resolution"))
+            self.add_control('camera_pixel_format', ComboBox,
+                             _("MJPG gives higher frame rates at high resolutions"))
 
             if self.get_control('camera_width').GetValue()<0 or self.get_control('camera_height').GetValue()<0:
                 self.get_control('auto_resolution').SetValue(True)
@@ -190,6 +193,10 @@ class VideoSettings(ExpandablePanel):
         if driver.camera.focus_supported():
             self.add_control(
                 'camera_focus', Slider, _("Manual focus"))
+        self.add_control('flush_calibration_button', CallbackButton,
+                         _("Measure minimal flush for this camera and resolution"))
+        self.add_control('camera_reprobe_button', Button,
+                         _("Detect camera limits again on next connect"))
 
     def update_callbacks(self):
         self.update_callback('camera_rotate', lambda v: driver.camera.set_rotate(v))
@@ -198,8 +205,48 @@ class VideoSettings(ExpandablePanel):
         if driver.camera.set_resolution_supported():
             self.update_callback('auto_resolution', lambda v: self._auto_resolution(v))
             self.update_callback('set_resolution_button', self._set_resolution)
+            self.update_callback('camera_pixel_format', self._set_pixel_format)
         if driver.camera.focus_supported():
             self.update_callback('camera_focus', lambda v: driver.camera.set_focus(v))
+        self.update_callback('flush_calibration_button', lambda c: self._calibrate_flush(c))
+        self.update_callback('camera_reprobe_button', self._reprobe_camera)
+
+    def _reprobe_camera(self):
+        driver.camera.clear_probe()
+        dlg = wx.MessageDialog(
+            self, _("Camera will be probed on next connect"),
+            _("Re-probe camera"), wx.OK | wx.ICON_INFORMATION)
+        dlg.ShowModal()
+        dlg.Destroy()
+
+    def _calibrate_flush(self, callback):
+        # video view would switch capture mode while measuring
+        video_view = self.GetParent().GetParent().GetParent().pages_collection['video_view']
+        video_view.stop()
+
+        def after(response):
+            callback(response)
+            wx.CallAfter(self._after_flush_calibration, response, video_view)
+        flush_calibration.set_callbacks(None, None, after)
+        flush_calibration.start()
+
+    def _after_flush_calibration(self, response, video_view):
+        video_view.play()
+        ret, result = response
+        if ret:
+            message = _("Flush after scene change: {0}\n"
+                        "Flush after settings change: {1}").format(*result)
+            icon = wx.ICON_INFORMATION
+        elif isinstance(result, ChangeNotDetected):
+            message = _("Laser or camera settings change was not detected. "
+                        "Please, check the lasers connection and capture settings")
+            icon = wx.ICON_ERROR
+        else:
+            message = str(result)
+            icon = wx.ICON_ERROR
+        dlg = wx.MessageDialog(self, message, _("Flush calibration"), wx.OK | icon)
+        dlg.ShowModal()
+        dlg.Destroy()
 
     def _set_resolution(self):
         if not sys.is_darwin():
@@ -229,10 +276,19 @@ class VideoSettings(ExpandablePanel):
                     driver.camera.set_resolution(old_width, old_height)
                     self.get_control('camera_width').SetValue(old_width)
                     self.get_control('camera_height').SetValue(old_height)
+            image_capture.read_flush_profile()
+
+    def _set_pixel_format(self, value):
+        driver.camera.set_pixel_format(value)
+        image_capture.read_flush_profile()
+        if not self.get_control('auto_resolution').GetValue():
+            self.get_control('camera_width').SetValue(driver.camera._width)
+            self.get_control('camera_height').SetValue(driver.camera._height)
 
     def _auto_resolution(self, value):
         if value:
             driver.camera.set_resolution(-1, -1)
+            image_capture.read_flush_profile()
             self.get_control('camera_width').SetValue(-1)
             self.get_control('camera_height').SetValue(-1)
             self.get_control('camera_width').Hide()
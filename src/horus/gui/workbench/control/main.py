@@ -32,7 +32,8 @@ class ControlWorkbench(Workbench):
             profile.settings['current_panel_control']].on_title_clicked(None)
 
     def _video_frame(self):
-        return image_capture.capture_image()
+        # preview only, decode MJPEG at half size
+        return image_capture.capture_image(reduce=2)
 
     def on_open(self):
         self.pages_collection['video_view'].play()
@@ -52,6 +53,7 @@ class ControlWorkbench(Workbench):
 
     def setup_engine(self):
         driver.camera.read_profile()
+        image_capture.read_flush_profile()
 
         image_capture.texture_mode.read_profile('control')
         image_capture.set_mode_texture()
@@ -7,10 +7,11 @@ __license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.ht
 import numpy as np
 
 from horus.util import profile
-from horus.util import model
-from horus.gui.engine import ciclop_scan, calibration_data
+from horus.util import model, point_cloud_filter, point_cloud_mesh, point_cloud_tools
+from horus.gui.engine import ciclop_scan, calibration_data, point_cloud_generation, \
+     point_cloud_roi
 from horus.gui.util.custom_panels import ExpandablePanel, ComboBox, \
-     CheckBox, IntTextBox, Button, FloatTextBoxArray
+     CheckBox, IntTextBox, FloatTextBox, Button, FloatTextBoxArray
 from horus.gui.util.gryphon_controls import DirPicker, ColorPicker
 
 
@@ -26,12 +27,15 @@ class PointCloudColor(ExpandablePanel):
         self.add_control('point_cloud_color', ColorPicker)
         self.add_control('point_cloud_color_l', ColorPicker)
         self.add_control('point_cloud_color_r', ColorPicker)
+        self.add_control('view_color_mode', ComboBox,
+                         _("Scene coloring of points. Does not change scan colors"))
 
     def update_callbacks(self):
         self.update_callback('texture_mode', lambda v: self._set_texture_mode(v) )
         self.update_callback('point_cloud_color', ciclop_scan.set_color )
         self.update_callback('point_cloud_color_l', lambda v: ciclop_scan.set_colors(0,v) )
         self.update_callback('point_cloud_color_r', lambda v: ciclop_scan.set_colors(1,v) )
+        self.update_callback('view_color_mode', self.main.scene_view.set_color_mode)
 
     def on_selected(self):
         self.main.scene_view._view_roi = False
@@ -87,16 +91,21 @@ class MeshCorrection(ExpandablePanel):
         self.main = self.GetParent().GetParent().GetParent()
         self.mesh = None
         self.offset = np.zeros((3), dtype=np.float32)
+        # offset baked into mesh vertexes by last apply
+        self.applied_offset = np.zeros((3), dtype=np.float32)
 
     def add_controls(self):
         self.add_control('mesh_correction_offset', FloatTextBoxArray)
         self.add_control('mesh_correction_apply', Button)
         self.add_control('mesh_correction_reset', Button)
+        self.add_control('mesh_retriangulate', Button,
+                         _("Recompute scan from saved laser detections with current calibration"))
 
     def update_callbacks(self):
         self.update_callback('mesh_correction_offset', lambda v: self.set_offset(v))
         self.update_callback('mesh_correction_apply', self.apply_correction)
         self.update_callback('mesh_correction_reset', self.reset_correction)
+        self.update_callback('mesh_retriangulate', self.retriangulate)
 
     def on_selected(self):
         profile.settings['current_panel_scanning'] = 'mesh_correction'
@@ -104,16 +113,35 @@ class MeshCorrection(ExpandablePanel):
     def set_offset(self, v):
         #print "Set offset {0}".format(self.offset)
         self.offset = v
+        self.preview_correction()
 
-    def apply_correction(self):
+    def _get_mesh(self):
         if self.main.scene_view._object is None or \
            not self.main.scene_view._object._is_point_cloud:
-            return
-
+            return None
         mesh = self.main.scene_view._object._mesh
-
         if mesh.metadata is None or \
            'rotation_matrix' not in mesh.metadata.keys():
+            return None
+        return mesh
+
+    def _correction(self, mesh, offset):
+        # platform offset in model coordinates at slice angle 0
+        R = np.matrix(mesh.metadata['rotation_matrix'])
+        d = R.T * np.matrix(offset, dtype=np.float64).reshape((3, 1))
+        return -np.asarray(d).ravel()
+
+    def preview_correction(self):
+        # offset change not applied yet is drawn by shader without touching vertexes
+        mesh = self._get_mesh()
+        if mesh is None:
+            return
+        offset = np.asarray(self.offset, np.float32) - self.applied_offset
+        self.main.scene_view.set_correction(self._correction(mesh, offset))
+
+    def apply_correction(self):
+        mesh = self._get_mesh()
+        if mesh is None:
             return
 
         if self.mesh is None or \
@@ -125,17 +153,20 @@ class MeshCorrection(ExpandablePanel):
             self.M    = np.array([ c,-s,  s,c]).T.reshape((-1,2,2))
             self.Mrev = np.array([ c, s, -s,c]).T.reshape((-1,2,2))
 
-        R = np.matrix(mesh.metadata['rotation_matrix'])# calibration_data.platform_rotation)
-        d = R.T * (np.matrix([ self.offset[0], self.offset[1], self.offset[2]]).T)
-        delta = np.full( (mesh.vertex_count,3), -d.T) # [ self.offset[2], -self.offset[0], self.offset[1]]
+        delta = np.full( (mesh.vertex_count,3), self._correction(mesh, self.offset))
         delta[:,[0,1]] =  np.einsum('ikj,ij->ik',self.Mrev, delta[:,[0,1]])
         mesh.vertexes[0:self.mesh.vertex_count] = self.mesh.get_vertexes() + delta.astype(np.float32)
         mesh.clear_vbo()
+        self.applied_offset = np.array(self.offset, np.float32)
+        self.main.scene_view.set_correction(None)
         self.main.scene_view.Refresh()
 
 
     def reset_correction(self):
+        self.applied_offset = np.zeros((3), dtype=np.float32)
+        self.main.scene_view.set_correction(None)
         if self.mesh is None:
+            self.main.scene_view.Refresh()
             return
 
         if not hasattr(self.main.scene_view._object._mesh, 'correcting'):
@@ -153,3 +184,137 @@ class MeshCorrection(ExpandablePanel):
         self.mesh = None
         self.main.scene_view.Refresh()
 
+    def retriangulate(self):
+        if self.main.scene_view._object is None or \
+           not self.main.scene_view._object._is_point_cloud:
+            return
+
+        mesh = self.main.scene_view._object._mesh
+        if point_cloud_generation.retriangulate_mesh(mesh, calibration_data, point_cloud_roi):
+            # manual correction is relative to old geometry
+            if hasattr(mesh, 'correcting'):
+                del mesh.correcting
+            self.mesh = None
+            self.applied_offset = np.zeros((3), dtype=np.float32)
+            self.main.scene_view.set_correction(None)
+            self.main.scene_view.Refresh()
+
+
+class PointCloudFilter(ExpandablePanel):
+
+    def __init__(self, parent, on_selected_callback):
+        ExpandablePanel.__init__(
+            self, parent, _("Point cloud filter"), has_undo=False, has_restore=False)
+        self.main = self.GetParent().GetParent().GetParent()
+
+    def add_controls(self):
+        self.add_control('filter_sor_k', IntTextBox,
+                         _("Amount of nearest neighbours used to compute mean distance"))
+        self.add_control('filter_sor_std_ratio', FloatTextBox,
+                         _("Points with mean neighbour distance above average + ratio * std deviation are removed"))
+        self.add_control('filter_sor_apply', Button)
+        self.add_control('filter_radius', FloatTextBox)
+        self.add_control('filter_radius_neighbors', IntTextBox,
+                         _("Points with less neighbours within radius are removed"))
+        self.add_control('filter_radius_apply', Button)
+        self.add_control('filter_voxel_size', FloatTextBox,
+                         _("Points in each voxel are replaced by their average"))
+        self.add_control('filter_voxel_apply', Button)
+
+    def update_callbacks(self):
+        self.update_callback('filter_sor_apply', self.remove_statistical_outliers)
+        self.update_callback('filter_radius_apply', self.remove_radius_outliers)
+        self.update_callback('filter_voxel_apply', self.voxel_downsample)
+
+    def on_selected(self):
+        self.main.scene_view._view_roi = False
+        self.main.scene_view.queue_refresh()
+        profile.settings['current_panel_scanning'] = 'point_cloud_filter'
+
+    def _get_mesh(self):
+        if self.main.scene_view._object is None or \
+           not self.main.scene_view._object._is_point_cloud:
+            return None
+        return self.main.scene_view._object._mesh
+
+    def remove_statistical_outliers(self):
+        mesh = self._get_mesh()
+        if mesh is not None:
+            point_cloud_filter.remove_statistical_outliers(
+                mesh, profile.settings['filter_sor_k'], profile.settings['filter_sor_std_ratio'])
+            self.main.scene_view.Refresh()
+
+    def remove_radius_outliers(self):
+        mesh = self._get_mesh()
+        if mesh is not None:
+            point_cloud_filter.remove_radius_outliers(
+                mesh, profile.settings['filter_radius'], profile.settings['filter_radius_neighbors'])
+            self.main.scene_view.Refresh()
+
+    def voxel_downsample(self):
+        mesh = self._get_mesh()
+        if mesh is not None:
+            point_cloud_filter.voxel_downsample_mesh(mesh, profile.settings['filter_voxel_size'])
+            self.main.scene_view.Refresh()
+
+
+class PointCloudMesh(ExpandablePanel):
+
+    def __init__(self, parent, on_selected_callback):
+        ExpandablePanel.__init__(
+            self, parent, _("Meshing"), has_undo=False, has_restore=False)
+        self.main = self.GetParent().GetParent().GetParent()
+        # point cloud replaced in scene by mesh built from it
+        self._cloud = None
+        self._mesh_object = None
+
+    def add_controls(self):
+        self.add_control('mesh_max_edge', FloatTextBox,
+                         _("Triangles with longer edges are dropped. 0 - no limit"))
+        self.add_control('mesh_min_angle', FloatTextBox,
+                         _("Triangles with smaller angles are dropped"))
+        self.add_control('mesh_close_loop', CheckBox,
+                         _("Connect last scanned slice to the first one"))
+        self.add_control('mesh_build', Button)
+        self.add_control('mesh_show_cloud', Button,
+                         _("Show point cloud the mesh was built from"))
+
+    def update_callbacks(self):
+        self.update_callback('mesh_build', self.build_mesh)
+        self.update_callback('mesh_show_cloud', self.show_cloud)
+
+    def on_selected(self):
+        self.main.scene_view._view_roi = False
+        self.main.scene_view.queue_refresh()
+        profile.settings['current_panel_scanning'] = 'point_cloud_mesh'
+
+    def build_mesh(self):
+        if self.main.scene_view._object is None or \
+           not self.main.scene_view._object._is_point_cloud:
+            return
+
+        mesh = self.main.scene_view._object._mesh
+        if mesh.vertex_count <= 0:
+            return
+        if not point_cloud_tools.have_slices(mesh.get_meta()):
+            point_cloud_tools.reconstruct_slices(mesh.get_vertexes(), mesh.get_meta(), None)
+
+        obj = point_cloud_mesh.mesh_point_cloud(
+            mesh, profile.settings['mesh_max_edge'], profile.settings['mesh_min_angle'],
+            profile.settings['mesh_close_loop'])
+        if obj._mesh.vertex_count > 0:
+            # keep point cloud to show it again. Scene drops object mesh on replace
+            self._cloud = (self.main.scene_view._object, mesh)
+            self._mesh_object = obj
+            self.main.scene_view.set_object(obj)
+
+    def show_cloud(self):
+        if self._cloud is None or self.main.scene_view._object is not self._mesh_object:
+            return
+        cloud, mesh = self._cloud
+        self._cloud = None
+        self._mesh_object = None
+        # VBO was released when mesh replaced the cloud in scene
+        mesh.vbo = None
+        cloud._mesh = mesh
+        self.main.scene_view.set_object(cloud)
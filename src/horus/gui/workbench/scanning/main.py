@@ -19,7 +19,7 @@ from horus.gui.workbench.scanning.view_page import ViewPage
 from horus.gui.workbench.scanning.panels import ScanParameters, RotatingPlatform, \
     PointCloudROI
 from horus.gui.workbench.scanning.gryphon_panels import PointCloudColor, Photogrammetry, \
-    MeshCorrection
+    MeshCorrection, PointCloudFilter, PointCloudMesh
 
 
 class ScanningWorkbench(Workbench):
@@ -61,6 +61,8 @@ class ScanningWorkbench(Workbench):
         self.add_panel('point_cloud_color', PointCloudColor)
         self.add_panel('photogrammetry', Photogrammetry)
         self.add_panel('mesh_correction',MeshCorrection)
+        self.add_panel('point_cloud_filter', PointCloudFilter)
+        self.add_panel('point_cloud_mesh', PointCloudMesh)
 
     def add_pages(self):
         self.add_page('view_page', ViewPage(self, self.get_image))
@@ -99,6 +101,7 @@ class ScanningWorkbench(Workbench):
         self._enable_tool_scan(self.pause_tool, False)
 
         driver.camera.read_profile()
+        image_capture.read_flush_profile()
 
         image_capture.texture_mode.read_profile('texture_scanning')
         image_capture.laser_mode.read_profile('laser_scanning')
@@ -221,7 +224,8 @@ class ScanningWorkbench(Workbench):
         self.GetParent().Layout()
         self.pages_collection['view_page'].combo_video_views.Show()
         self.scene_view.set_show_delete_menu(False)
-        obj = self.scene_view.create_default_object()
+        # range image stores scan, scene point cloud is built from it at scan end
+        obj = self.scene_view.create_default_object(not ciclop_scan.range_image_enable)
         obj._mesh.metadata = {}
         meta_names = ['motor_step_scanning', 'texture_mode', 'use_laser', 'camera_matrix', 'distortion_vector',\
                 'distance_left','normal_left','distance_right','normal_right',\
@@ -294,6 +298,15 @@ class ScanningWorkbench(Workbench):
         self.GetParent().on_scanning_panel_clicked(None)
         self.pages_collection['view_page'].combo_video_views.Hide()
         self.scene_view.set_show_delete_menu(True)
+        self.scene_view.end_preview()
+        if ciclop_scan.range_image is not None and self.scene_view._object is not None:
+            # scan result from range image
+            obj = ciclop_scan.range_image.get_model()
+            obj._mesh.metadata = self.scene_view._object._mesh.metadata
+            self.scene_view.set_object(obj)
+        detections = ciclop_scan.get_detections()
+        if detections is not None and self.scene_view._object is not None:
+            self.scene_view._object._mesh.metadata['detections'] = detections
         if profile.settings['current_panel_scanning'] == 'point_cloud_roi':
             self.scene_view._view_roi = profile.settings['use_roi']
             self.scene_view.queue_refresh()
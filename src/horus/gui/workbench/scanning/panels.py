@@ -12,7 +12,7 @@ import numpy as np
 from horus.util import profile
 from horus.gui.engine import driver, ciclop_scan, point_cloud_roi
 from horus.gui.util.custom_panels import ExpandablePanel, Slider, CheckBox, ComboBox, \
-    Button, FloatTextBox
+    Button, FloatTextBox, IntTextBox
 from horus.util import model
 
 
@@ -25,9 +25,28 @@ class ScanParameters(ExpandablePanel):
 
     def add_controls(self):
         self.add_control('use_laser', ComboBox)
+        self.add_control(
+            'preview_voxel_size', FloatTextBox,
+            _("Scene shows scanned points averaged in voxels of this size. "
+              "Scan result keeps all points. 0 disables"))
+        self.add_control(
+            'point_budget', IntTextBox,
+            _("Larger point clouds are drawn partially while view moves "
+              "and in full detail when it stops. 0 disables"))
+        self.add_control(
+            'scan_range_image', CheckBox,
+            _("Store scan as slice x image row grid for image space processing. "
+              "Uses less memory while scanning: scene shows voxel preview "
+              "and point cloud is built at scan end"))
+        self.add_control(
+            'scan_save_detections', CheckBox,
+            _("Save raw laser line detections with the scan, so it can be recomputed after recalibration"))
 
     def update_callbacks(self):
         self.update_callback('use_laser', self.set_use_laser)
+        self.update_callback('point_budget', self.main.scene_view.set_point_budget)
+        self.update_callback('scan_range_image', ciclop_scan.set_range_image_enable)
+        self.update_callback('scan_save_detections', ciclop_scan.set_detections_enable)
 
     def set_use_laser(self, value):
         ciclop_scan.set_use_left_laser(value == 'Left' or value == 'Both')
@@ -22,7 +22,7 @@ def load_supported_extensions():
 
 def save_supported_extensions():
     """ return a list of supported file extensions for saving. """
-    return ['.ply']
+    return ['.ply', '.stl']
 
 
 def load_mesh(filename):
@@ -54,4 +54,7 @@ def save_mesh(filename, _object):
     if ext == '.ply':
         ply.save_scene(filename, _object)
         return
+    if ext == '.stl':
+        stl.save_scene(filename, _object)
+        return
     logger.error('Error: Unknown model extension: %s' % (ext))
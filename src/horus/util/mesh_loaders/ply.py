@@ -73,6 +73,11 @@ def _load_ascii_vertex(mesh, stream, dtype, count):
             mesh._add_vertex(data[x], data[y], data[z], data[nx], data[ny], data[nz], data[idx], data[sn], data[sa])
 
 
+def _columns(data, names):
+    # N x len(names) array of native byte order fields
+    return np.column_stack([data[n].astype(data[n].dtype.newbyteorder('=')) for n in names])
+
+
 def _load_binary_vertex(mesh, stream, dtype, count):
     data = np.fromfile(stream, dtype=dtype, count=count)
 
@@ -80,34 +85,33 @@ def _load_binary_vertex(mesh, stream, dtype, count):
     mesh.vertex_count = count
 
     if 'x' in fields:
-        mesh.vertexes = np.array(zip(data['x'], data['y'], data['z']))
+        mesh.vertexes = _columns(data, ('x', 'y', 'z'))
     else:
         mesh.vertexes = np.zeros((count, 3))
 
     if 'nx' in fields:
-        mesh.normal = np.array(zip(data['nx'], data['ny'], data['nz']))
+        mesh.normal = _columns(data, ('nx', 'ny', 'nz'))
     else:
         mesh.normal = np.zeros((count, 3))
 
     if 'red' in fields:
-        mesh.colors = np.array(zip(data['red'], data['green'], data['blue']))
+        mesh.colors = _columns(data, ('red', 'green', 'blue'))
     else:
         mesh.colors = 255 * np.ones((count, 3))
 
+    mesh.vertexes_meta = np.empty(count, dtype=mesh.vertexes_meta.dtype)
     if 'slice_index' in fields:
         slice_n = data['slice_index']
-        slice_l = data['slice_angle']
-        slice_n, slice_l = zip(*map(lambda x,y: (-1,np.nan) if x<0 else (x,y), slice_n, slice_l))
+        mesh.vertexes_meta['slice_no'] = np.where(slice_n < 0, -1, slice_n)
+        mesh.vertexes_meta['slice_l'] = np.where(slice_n < 0, np.nan, data['slice_angle'])
     else:
-        slice_n = [-1]*count
-        slice_l = [np.nan]*count
+        mesh.vertexes_meta['slice_no'] = -1
+        mesh.vertexes_meta['slice_l'] = np.nan
 
     if 'scalar_Original_cloud_index' in fields:
-        cloud_index = data['scalar_Original_cloud_index']
+        mesh.vertexes_meta['laser_id'] = data['scalar_Original_cloud_index']
     else:
-        cloud_index = [-1]*count
-
-    mesh.vertexes_meta = np.array(zip(cloud_index, slice_n, slice_l), dtype=mesh.vertexes_meta.dtype)
+        mesh.vertexes_meta['laser_id'] = -1
 
 
 # ------------ Mesh Metadata ---------------
@@ -222,7 +226,9 @@ def load_scene(filename):
                             for i in xrange(count):
                                 f.readline()
                         else:
-                            return obj
+                            # binary lists have no fixed size: keep elements loaded so far
+                            element = None
+                            break
                     else:
                         dtype = dtype + [ (props[-1], df[props[1]]) ]  # (name, format, shape)
 
@@ -280,7 +286,10 @@ def save_scene_stream(stream, _object):
         else:
             print "No metadata to save"
 
-        frame += "element face 0\n"
+        face_count = 0
+        if m._obj is not None and not m._obj.is_point_cloud():
+            face_count = m.vertex_count / 3
+        frame += "element face {0}\n".format(face_count)
         frame += "property list uchar int vertex_indices\n"
 
         frame += "end_header\n"
@@ -296,6 +305,11 @@ def save_scene_stream(stream, _object):
                                              m.vertexes_meta[i][0], m.vertexes_meta[i][1], m.vertexes_meta[i][2]))
                 if m.metadata is not None:
                     stream.write(metadata)
+                if face_count > 0:
+                    faces = np.empty(face_count, dtype=np.dtype([('n', 'B'), ('v', '<i4', (3,))]))
+                    faces['n'] = 3
+                    faces['v'] = np.arange(3 * face_count).reshape(face_count, 3)
+                    stream.write(faces.tobytes())
             else:
                 for i in xrange(m.vertex_count):
                     stream.write("{0} {1} {2} {3} {4} {5} {6} {7} {8}\n".format(
@@ -304,3 +318,5 @@ def save_scene_stream(stream, _object):
                                  m.vertexes_meta[i][0], m.vertexes_meta[i][1], m.vertexes_meta[i][2])
                 if m.metadata is not None:
                     stream.write("{0}\n".format(metadata))
+                for i in xrange(face_count):
+                    stream.write("3 {0} {1} {2}\n".format(3 * i, 3 * i + 1, 3 * i + 2))
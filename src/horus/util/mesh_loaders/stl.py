@@ -78,3 +78,40 @@ def load_scene(filename):
             _load_binary(m, f)
         obj._post_process_after_load()
         return obj
+
+
+def save_scene(filename, _object):
+    with open(filename, 'wb') as f:
+        save_scene_stream(f, _object)
+
+
+def save_scene_stream(stream, _object):
+    # Binary STL of a triangle mesh
+    if isinstance(_object, model.Model):
+        if _object.is_point_cloud():
+            print "Point cloud can not be saved as STL"
+            return
+        m = _object._mesh
+    elif isinstance(_object, model.Mesh):
+        m = _object
+    else:
+        print "Unknown object type '{0}'. Unable to save".format(type(_object))
+        return
+
+    count = m.vertex_count / 3
+    tris = m.vertexes[:3 * count].reshape(count, 3, 3)
+    normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    length = np.linalg.norm(normals, axis=1)
+    length[length == 0] = 1
+    normals /= length[:, np.newaxis]
+
+    data = np.zeros(count, dtype=np.dtype([
+                    ('n', '<f4', (3,)),
+                    ('v', '<f4', (9,)),
+                    ('atttr', '<i2', (1,))]))
+    data['n'] = normals
+    data['v'] = tris.reshape(count, 9)
+
+    stream.write(struct.pack('<80s', 'Horus / Gryphon Scan binary STL'))
+    stream.write(struct.pack('<I', count))
+    stream.write(data.tobytes())
@@ -12,6 +12,11 @@ import os
 import numpy as np
 np.seterr(all='ignore')
 
+from horus.util.point_cloud_tools import cart2cyl
+
+# slice angle of points with unknown slice for shaders
+UNKNOWN_SLICE_L = -10.0
+
 
 class Model(object):
     """
@@ -113,6 +118,8 @@ class Mesh(object):
         self._obj = obj
         self.current_cloud_index = 0
         self.metadata = None
+        self._cylindrical = None
+        self._shader_slice_l = None
 
     def _add_vertex(self, x, y, z, r=255, g=255, b=255, laser_index=None, slice_no = None, slice_l = None):
         if laser_index is None:
@@ -123,6 +130,7 @@ class Mesh(object):
         self.colors[n]   = (r, g, b)
         self.vertexes_meta[n] = (laser_index, slice_no, slice_l)
         self.vertex_count += 1
+        self._cylindrical = None
 
     def add_pointcloud(self, cloud_vertex, cloud_color, meta=None ):
         if cloud_vertex is None or \
@@ -132,33 +140,35 @@ class Mesh(object):
         #if laser_index < 0:
         #    laser_index=self.current_cloud_index
 
-        _meta = np.empty((), dtype=object)
+        # (laser_index, slice_no, slice_l) of all points. Structured array
+        # keeps vertexes_meta dtype on np.append
+        _meta = np.empty(cloud_vertex.shape[0], dtype=self.vertexes_meta.dtype)
         if meta is None:
-            #_meta[()] = (laser_index, slice_no, slice_l)
-            _meta[()] = (-1, -1, np.nan)
+            _meta[:] = (-1, -1, np.nan)
         else:
-            _meta[()] = meta
-        _meta = np.full(cloud_vertex.shape[0], _meta)
+            _meta[:] = tuple(meta)
 
         n = self.vertex_count
         m = n + cloud_vertex.shape[0]
-        if m >= self.vertexes.shape[0]:
-            if self.vertexes.shape[0] > n:
-                # shrink and append
-                self.vertexes.resize((n,3))
-                self.colors.resize((n,3))
-                #self.normal.resize((n,3))
-                self.vertexes_meta.resize(n, refcheck=False) #+self.vertexes_meta.shape[1:])
-
-            self.vertexes      = np.append( self.vertexes,      cloud_vertex, axis=0)
-            self.colors        = np.append( self.colors,        cloud_color,  axis=0)
-            self.vertexes_meta = np.append( self.vertexes_meta, _meta,        axis=0)
-        else:
-            self.vertexes[n:m] = cloud_vertex
-            self.colors[n:m] = cloud_color
-            self.vertexes_meta[n:m] = _meta
+        if m > self.vertexes.shape[0]:
+            # grow geometrically, so appended slices rarely copy whole cloud
+            capacity = max(m, 2 * self.vertexes.shape[0])
+            self.vertexes      = self._grown(self.vertexes,      n, capacity)
+            self.colors        = self._grown(self.colors,        n, capacity)
+            self.vertexes_meta = self._grown(self.vertexes_meta, n, capacity)
+        self.vertexes[n:m] = cloud_vertex
+        self.colors[n:m] = cloud_color
+        self.vertexes_meta[n:m] = _meta
 
         self.vertex_count = m
+        self._cylindrical = None
+
+    @staticmethod
+    def _grown(array, size, capacity):
+        # copy of first size items of array with room for capacity items
+        grown = np.empty((capacity,) + array.shape[1:], array.dtype)
+        grown[:size] = array[:size]
+        return grown
 
     def _add_face(self, x0, y0, z0, x1, y1, z1, x2, y2, z2):
         n = self.vertex_count
@@ -189,7 +199,8 @@ class Mesh(object):
         # Calculate the normals
         tris = self.vertexes.reshape(self.vertex_count / 3, 3, 3)
         normals = np.cross(tris[::, 1] - tris[::, 0], tris[::, 2] - tris[::, 0])
-        normals /= np.linalg.norm(normals)
+        length = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals /= np.where(length > 0, length, 1)
         n = np.concatenate((np.concatenate((normals, normals), axis=1), normals), axis=1)
         self.normal = n.reshape(self.vertex_count, 3)
 
@@ -199,6 +210,31 @@ class Mesh(object):
     def get_meta(self):
         return self.vertexes_meta[0:self.vertex_count]
 
+    def get_shader_attributes(self):
+        # [slice angle, laser id] of vertexes for point cloud shader.
+        # Unknown slice angle (NaN) is passed as UNKNOWN_SLICE_L so shader
+        # skips scan correction instead of producing NaN position.
+        # Converted slice angles are cached like get_cylindrical(); only
+        # vertexes added since last call are converted
+        c = self._shader_slice_l
+        n = self.vertex_count
+        if c is None or c[0] is not self.vertexes_meta or c[2] > n:
+            c = (self.vertexes_meta, np.empty(len(self.vertexes_meta), np.float32), 0)
+        meta, slice_l, count = c
+        if count < n:
+            new = meta['slice_l'][count:n]
+            slice_l[count:n] = np.where(np.isnan(new), UNKNOWN_SLICE_L, new)
+        self._shader_slice_l = (meta, slice_l, n)
+        return [slice_l[:n], meta['laser_id'][:n]]
+
+    def get_cylindrical(self):
+        # [radius, theta, z] of vertexes. Cached until mesh is modified:
+        # vertexes array replaced or clear_vbo() called after in-place changes
+        c = self._cylindrical
+        if c is None or c[0] is not self.vertexes or len(c[1]) != self.vertex_count:
+            self._cylindrical = (self.vertexes, cart2cyl(self.get_vertexes()))
+        return self._cylindrical[1]
+
     def copy(self, mesh):
         self.vertexes      = np.copy(mesh.vertexes)
         self.vertexes_meta = np.copy(mesh.vertexes_meta)
@@ -207,6 +243,8 @@ class Mesh(object):
         self.vertex_count  = mesh.vertex_count
 
         self.vbo = None
+        self._cylindrical = None
+        self._shader_slice_l = None
         self._obj = mesh._obj
         self.current_cloud_index = mesh.current_cloud_index
         if mesh.metadata is not None:
@@ -215,6 +253,8 @@ class Mesh(object):
         return self
 
     def clear_vbo(self):
+        self._cylindrical = None
+        self._shader_slice_l = None
         if self.vbo is not None:
             self.vbo.release()
             self.vbo = None
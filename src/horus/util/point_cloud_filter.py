@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# This file is part of the Gryphon Scan Project
+
+__author__ = 'Mikhail N Klimushin aka Night Gryphon <ngryph@gmail.com>'
+__copyright__ = 'Copyright (C) 2019 Night Gryphon'
+__license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
+
+# Point cloud outlier filters.
+# Masks use a single KD-tree queried in parallel over batches of points,
+# so memory stays bounded on multi million point clouds.
+
+import numpy as np
+from scipy import spatial
+
+import logging
+logger = logging.getLogger(__name__)
+
+# points per KD-tree query batch
+CHUNK_SIZE = 262144
+
+
+def _query(tree, points, k, **kwargs):
+    # parallel query. scipy < 1.6 calls workers n_jobs
+    try:
+        return tree.query(points, k, workers=-1, **kwargs)
+    except TypeError:
+        return tree.query(points, k, n_jobs=-1, **kwargs)
+
+
+def _chunks(count, chunk_size):
+    for i in xrange(0, count, chunk_size):
+        yield slice(i, min(i + chunk_size, count))
+
+
+# ================================================
+# Masks of points to keep
+
+def statistical_outlier_mask(points, k=8, std_ratio=2.0, chunk_size=CHUNK_SIZE):
+    # Mean distance to k nearest neighbours is below mean + std_ratio * std
+    # of mean distances over all points
+    points = np.asarray(points)
+    n = len(points)
+    if k < 1 or n <= k:
+        return np.ones(n, dtype=bool)
+
+    tree = spatial.cKDTree(points)
+    mean_dist = np.empty(n, dtype=np.float32)
+    for s in _chunks(n, chunk_size):
+        d, _ = _query(tree, points[s], k + 1)  # first neighbour is point itself
+        mean_dist[s] = np.mean(d[:, 1:], axis=1)
+
+    return mean_dist <= np.mean(mean_dist) + std_ratio * np.std(mean_dist)
+
+
+def radius_outlier_mask(points, radius=1.0, min_neighbors=3, chunk_size=CHUNK_SIZE):
+    # At least min_neighbors other points within radius
+    points = np.asarray(points)
+    n = len(points)
+    if min_neighbors < 1:
+        return np.ones(n, dtype=bool)
+    if n <= min_neighbors:
+        return np.zeros(n, dtype=bool)
+
+    tree = spatial.cKDTree(points)
+    keep = np.empty(n, dtype=bool)
+    for s in _chunks(n, chunk_size):
+        # missing neighbours beyond radius have infinite distance
+        d, _ = _query(tree, points[s], min_neighbors + 1, distance_upper_bound=radius)
+        keep[s] = np.isfinite(d[:, -1])
+
+    return keep
+
+
+# ================================================
+# Mesh point cloud filters
+
+def filter_mesh(mesh, mask):
+    # Keep mesh points selected by mask. Returns amount of removed points
+    n = mesh.vertex_count
+    mesh.vertexes = mesh.vertexes[:n][mask]
+    mesh.colors = mesh.colors[:n][mask]
+    if len(mesh.normal) >= n:
+        mesh.normal = mesh.normal[:n][mask]
+    mesh.vertexes_meta = mesh.vertexes_meta[:n][mask]
+    mesh.vertex_count = len(mesh.vertexes)
+    mesh.clear_vbo()
+    return n - mesh.vertex_count
+
+
+def remove_statistical_outliers(mesh, k=8, std_ratio=2.0):
+    removed = filter_mesh(mesh, statistical_outlier_mask(mesh.get_vertexes(), k, std_ratio))
+    logger.info("Statistical outlier removal: {0} points removed".format(removed))
+    return removed
+
+
+def remove_radius_outliers(mesh, radius=1.0, min_neighbors=3):
+    removed = filter_mesh(mesh, radius_outlier_mask(mesh.get_vertexes(), radius, min_neighbors))
+    logger.info("Radius outlier removal: {0} points removed".format(removed))
+    return removed
+
+
+# ================================================
+# Voxel grid downsampling
+
+# voxel index bits per axis in hashed key
+VOXEL_BITS = 21
+
+
+def voxel_keys(points, voxel_size):
+    # hashed int64 keys of voxels containing points
+    idx = np.floor(np.asarray(points) / voxel_size).astype(np.int64) + (1 << (VOXEL_BITS - 1))
+    idx &= (1 << VOXEL_BITS) - 1
+    return (idx[:, 0] << (2 * VOXEL_BITS)) | (idx[:, 1] << VOXEL_BITS) | idx[:, 2]
+
+
+class VoxelGrid(object):
+    # Streaming voxel grid. Points are added in chunks, each voxel keeps
+    # sum of positions and colors, points count and meta of first point.
+    # Voxels are stored in order of creation, so new voxels of a chunk are
+    # appended at the end. Buffers grow geometrically. Sorted key index is
+    # kept in two runs: large one and small recent one which is merged
+    # into large one when it grows, so adding a chunk does not rebuild
+    # index of whole grid.
+
+    def __init__(self, voxel_size=1.0):
+        self.voxel_size = voxel_size
+        self._size = 0
+        self.keys = np.empty((0), dtype=np.int64)
+        self.xyz = np.empty((0, 3), dtype=np.float64)
+        self.color = np.empty((0, 3), dtype=np.float64)
+        self.count = np.empty((0), dtype=np.int64)
+        self.meta = None
+        # sorted (keys, voxel index) runs
+        self._index = (np.empty((0), dtype=np.int64), np.empty((0), dtype=np.int64))
+        self._recent = (np.empty((0), dtype=np.int64), np.empty((0), dtype=np.int64))
+
+    def __len__(self):
+        return self._size
+
+    def _find(self, keys):
+        # voxel index of keys, -1 for new ones
+        result = np.full(len(keys), -1, np.int64)
+        for index_keys, index in (self._index, self._recent):
+            pos = np.searchsorted(index_keys, keys)
+            found = pos < len(index_keys)
+            found[found] = index_keys[pos[found]] == keys[found]
+            result[found] = index[pos[found]]
+        return result
+
+    def _reserve(self, size):
+        capacity = len(self.keys)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        for name in ('keys', 'xyz', 'color', 'count', 'meta'):
+            array = getattr(self, name)
+            if array is not None:
+                grown = np.zeros((capacity,) + array.shape[1:], array.dtype)
+                grown[:self._size] = array[:self._size]
+                setattr(self, name, grown)
+
+    def _merge_index(self, keys, index):
+        # add sorted keys to recent run, merge runs when recent one grows
+        recent_keys = np.concatenate((self._recent[0], keys))
+        recent_index = np.concatenate((self._recent[1], index))
+        if len(recent_keys) * 4 > len(self._index[0]):
+            recent_keys = np.concatenate((self._index[0], recent_keys))
+            recent_index = np.concatenate((self._index[1], recent_index))
+            self._index = (np.empty((0), dtype=np.int64), np.empty((0), dtype=np.int64))
+        order = np.argsort(recent_keys, kind='mergesort')
+        recent = (recent_keys[order], recent_index[order])
+        if len(self._index[0]) == 0:
+            self._index = recent
+            recent = (np.empty((0), dtype=np.int64), np.empty((0), dtype=np.int64))
+        self._recent = recent
+
+    def add(self, points, colors, meta=None):
+        if len(points) == 0:
+            return
+        # group chunk points by voxel. Stable sort keeps first point first
+        keys = voxel_keys(points, self.voxel_size)
+        order = np.argsort(keys, kind='mergesort')
+        keys, start = np.unique(keys[order], return_index=True)
+        xyz = np.add.reduceat(np.asarray(points, dtype=np.float64)[order], start, axis=0)
+        color = np.add.reduceat(np.asarray(colors, dtype=np.float64)[order], start, axis=0)
+        count = np.diff(np.r_[start, len(order)])
+        if meta is not None:
+            meta = np.asarray(meta)[order[start]]
+
+        # accumulate into existing voxels
+        index = self._find(keys)
+        found = index >= 0
+        p = index[found]
+        self.xyz[p] += xyz[found]
+        self.color[p] += color[found]
+        self.count[p] += count[found]
+
+        # append new voxels
+        new = ~found
+        n = np.count_nonzero(new)
+        if n == 0:
+            return
+        if meta is not None and self.meta is None:
+            self.meta = np.zeros(len(self.keys), meta.dtype)
+        size = self._size + n
+        self._reserve(size)
+        self.keys[self._size:size] = keys[new]
+        self.xyz[self._size:size] = xyz[new]
+        self.color[self._size:size] = color[new]
+        self.count[self._size:size] = count[new]
+        if meta is not None:
+            self.meta[self._size:size] = meta[new]
+        self._merge_index(keys[new], np.arange(self._size, size))
+        self._size = size
+
+    def get_vertexes(self, start=0):
+        # mean position of voxels from start
+        n = self._size
+        return (self.xyz[start:n] / self.count[start:n, np.newaxis]).astype(np.float32)
+
+    def get_colors(self, start=0):
+        n = self._size
+        return np.around(self.color[start:n] / self.count[start:n, np.newaxis]).astype(np.uint8)
+
+    def get_meta(self):
+        if self.meta is None:
+            return None
+        return self.meta[:self._size]
+
+
+def voxel_downsample(points, colors, meta=None, voxel_size=1.0, chunk_size=CHUNK_SIZE):
+    # Average points and colors of each voxel. Meta of first voxel point is kept
+    grid = VoxelGrid(voxel_size)
+    for s in _chunks(len(points), chunk_size):
+        grid.add(points[s], colors[s], meta[s] if meta is not None else None)
+    return grid.get_vertexes(), grid.get_colors(), grid.get_meta()
+
+
+def voxel_downsample_mesh(mesh, voxel_size=1.0):
+    n = mesh.vertex_count
+    mesh.vertexes, mesh.colors, mesh.vertexes_meta = voxel_downsample(
+        mesh.vertexes[:n], mesh.colors[:n], mesh.vertexes_meta[:n], voxel_size)
+    mesh.normal = np.zeros((0, 3), np.float32)
+    mesh.vertex_count = len(mesh.vertexes)
+    mesh.clear_vbo()
+    removed = n - mesh.vertex_count
+    logger.info("Voxel downsampling: {0} points removed".format(removed))
+    return removed
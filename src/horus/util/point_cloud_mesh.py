@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# This file is part of the Gryphon Scan Project
+
+__author__ = 'Mikhail N Klimushin aka Night Gryphon <ngryph@gmail.com>'
+__copyright__ = 'Copyright (C) 2019 Night Gryphon'
+__license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
+
+# Structured meshing of scanned point clouds.
+# Each laser slice is a line of points ordered by image row. Consecutive
+# slices of the same laser are zipped into a triangle strip by walking both
+# lines together, like the merge step of merge sort. Point height is used
+# as image row because rows are not stored with the points.
+
+import numpy as np
+
+from horus.util import model
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def triangulate(vertexes, meta, max_edge=3.0, min_angle=5.0, close_loop=True):
+    # Triangles between consecutive slices of each laser as (T, 3) vertex indexes.
+    # Triangles with edge longer than max_edge or angle below min_angle (deg)
+    # are dropped. close_loop connects last slice to first one.
+    vertexes = np.asarray(vertexes)
+    ids = np.flatnonzero(meta['slice_no'] >= 0)
+    if len(ids) < 3:
+        return np.zeros((0, 3), np.int64)
+
+    laser = meta['laser_id'][ids].astype(np.int64)
+    slice_no = meta['slice_no'][ids].astype(np.int64)
+    prev_slice = slice_no - 1
+    if close_loop:
+        # first slice of each laser pairs with its last slice
+        last = np.full(laser.max() + 1, -1, np.int64)
+        first = np.full(laser.max() + 1, np.iinfo(np.int64).max, np.int64)
+        np.maximum.at(last, laser, slice_no)
+        np.minimum.at(first, laser, slice_no)
+        wrap = (slice_no == first[laser]) & (last[laser] > first[laser] + 1)
+        prev_slice[wrap] = last[laser[wrap]]
+
+    # every point is on side 0 of strip (laser, slice)
+    # and on side 1 of strip (laser, previous slice)
+    n = len(ids)
+    pid = np.r_[ids, ids]
+    strip_laser = np.r_[laser, laser]
+    strip_slice = np.r_[slice_no, prev_slice]
+    side = np.r_[np.zeros(n, np.int8), np.ones(n, np.int8)]
+    z = vertexes[pid, 2]
+
+    order = np.lexsort((side, z, strip_slice, strip_laser))
+    pid = pid[order]
+    side = side[order]
+    strip_laser = strip_laser[order]
+    strip_slice = strip_slice[order]
+
+    # walk strips: each new point makes triangle with previous point of
+    # its own line and last point of opposite line
+    pos = np.arange(2 * n)
+    new_strip = np.r_[True, (strip_laser[1:] != strip_laser[:-1]) | (strip_slice[1:] != strip_slice[:-1])]
+    strip_start = np.maximum.accumulate(np.where(new_strip, pos, 0))
+    last0 = np.r_[-1, np.maximum.accumulate(np.where(side == 0, pos, -1))[:-1]]
+    last1 = np.r_[-1, np.maximum.accumulate(np.where(side == 1, pos, -1))[:-1]]
+    own = np.where(side == 0, last0, last1)
+    other = np.where(side == 0, last1, last0)
+
+    ok = (own >= strip_start) & (other >= strip_start)
+    a, b, c = pid[own[ok]], pid[other[ok]], pid[pos[ok]]
+    # same winding for triangles of both sides
+    flip = side[ok] == 0
+    b[flip], c[flip] = c[flip], b[flip]
+    triangles = np.column_stack((a, b, c))
+
+    return triangles[_good_triangles(vertexes, triangles, max_edge, min_angle)]
+
+
+def _good_triangles(vertexes, triangles, max_edge, min_angle):
+    tri = vertexes[triangles].astype(np.float64)
+    e = tri[:, [1, 2, 0]] - tri           # edges ab, bc, ca
+    l = np.linalg.norm(e, axis=2)
+    keep = np.all(l > 0, axis=1)
+    if max_edge > 0:
+        keep &= np.all(l <= max_edge, axis=1)
+    if min_angle > 0:
+        # angle at each vertex between outgoing and incoming edges
+        cos = -np.sum(e * e[:, [2, 0, 1]], axis=2) / (l * l[:, [2, 0, 1]])
+        keep &= np.all(cos <= np.cos(np.deg2rad(min_angle)), axis=1)
+    return keep
+
+
+def mesh_point_cloud(cloud, max_edge=3.0, min_angle=5.0, close_loop=True):
+    # Build triangle Model from scanned point cloud Model or Mesh
+    mesh = cloud._mesh if isinstance(cloud, model.Model) else cloud
+    vertexes = mesh.get_vertexes()
+    meta = mesh.get_meta()
+    triangles = triangulate(vertexes, meta, max_edge, min_angle, close_loop)
+
+    # faces point outside
+    tri = vertexes[triangles].astype(np.float64)
+    normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    outside = np.sum(normals[:, :2] * np.mean(tri[:, :, :2], axis=1), axis=1)
+    if np.sum(outside) < 0:
+        triangles = triangles[:, ::-1]
+        normals = -normals
+
+    obj = model.Model(None)
+    m = obj._add_mesh()
+    triangles = triangles.ravel()
+    m.vertexes = vertexes[triangles].astype(np.float32)
+    m.colors = mesh.colors[triangles]
+    m.vertexes_meta = meta[triangles]
+    # unit face normals, same as _post_process_after_load computes
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals /= np.where(length > 0, length, 1)
+    m.normal = np.repeat(normals, 3, axis=0).astype(np.float32)
+    m.vertex_count = len(triangles)
+    if mesh.metadata is not None:
+        m.metadata = mesh.metadata.copy()
+    if m.vertex_count > 0:
+        obj._post_process_after_load()
+    logger.info("Meshing: {0} triangles from {1} points".format(m.vertex_count / 3, len(vertexes)))
+    return obj
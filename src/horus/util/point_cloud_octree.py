@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# This file is part of the Gryphon Scan Project
+
+__author__ = 'Mikhail N Klimushin aka Night Gryphon <ngryph@gmail.com>'
+__copyright__ = 'Copyright (C) 2019 Night Gryphon'
+__license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
+
+# Octree level of detail for point cloud rendering.
+# Points are reordered by Morton code of their octree leaf, so every leaf
+# is a contiguous range of the reordered cloud. Points inside a leaf are
+# shuffled, so any prefix of a leaf range is a uniform subsample of it.
+# Drawing a detail level is then one (first, count) range per visible leaf.
+
+import numpy as np
+
+
+def _morton_codes(cells, depth):
+    # interleave bits of integer cell coords (N x 3)
+    spread = np.zeros(1 << depth, dtype=np.int64)
+    for bit in xrange(depth):
+        spread |= ((np.arange(1 << depth) >> bit) & 1) << (3 * bit)
+    return spread[cells[:, 0]] | (spread[cells[:, 1]] << 1) | (spread[cells[:, 2]] << 2)
+
+
+class PointOctree(object):
+
+    def __init__(self, points, depth=6, seed=0):
+        points = np.asarray(points)
+        self.depth = depth
+        self.point_count = len(points)
+
+        lo = points.min(axis=0).astype(np.float64)
+        size = float(np.max(points.max(axis=0) - lo))
+        if size <= 0:
+            size = 1.0
+        cell_size = size / (1 << depth)
+        cells = np.floor((points - lo) / cell_size).astype(np.int64)
+        np.clip(cells, 0, (1 << depth) - 1, out=cells)
+
+        # leaf code in high bits, random shuffle key in low bits
+        code = _morton_codes(cells, depth)
+        shuffle_bits = 62 - 3 * depth
+        key = code << shuffle_bits
+        key |= np.random.RandomState(seed).randint(0, 1 << min(shuffle_bits, 31), len(points), dtype=np.int64)
+        self.order = np.argsort(key)
+        code = code[self.order]
+        self.leaf_start = np.flatnonzero(np.r_[True, code[1:] != code[:-1]])
+        self.leaf_count = np.diff(np.r_[self.leaf_start, len(code)])
+
+        # leaf bounding spheres
+        leaf_cells = cells[self.order[self.leaf_start]]
+        self.leaf_center = lo + (leaf_cells + 0.5) * cell_size
+        self.leaf_radius = cell_size * np.sqrt(3) / 2
+
+    def __len__(self):
+        return len(self.leaf_start)
+
+    def select(self, mvp, viewport_height, point_size=1, budget=None):
+        # (first, count) ranges of reordered points to draw
+        #   mvp - 4x4 projection * modelview matrix acting on column vectors
+        #   point_size - target on-screen point spacing in pixels
+        #   budget - max amount of points, None draws visible leaves in full
+        mvp = np.asarray(mvp, np.float64)
+        center = np.column_stack((self.leaf_center, np.ones(len(self))))
+
+        # frustum culling of leaf spheres against clip planes
+        planes = np.array([mvp[3] + mvp[0], mvp[3] - mvp[0],
+                           mvp[3] + mvp[1], mvp[3] - mvp[1],
+                           mvp[3] + mvp[2], mvp[3] - mvp[2]])
+        planes /= np.linalg.norm(planes[:, :3], axis=1)[:, np.newaxis]
+        visible = np.all(np.dot(planes, center.T) > -self.leaf_radius, axis=0)
+
+        first = self.leaf_start[visible]
+        count = self.leaf_count[visible]
+        if budget is None or np.sum(count) <= budget:
+            return first, count
+
+        # screen space error: leaf points closer than point size on screen are skipped
+        w = np.dot(center[visible], mvp[3])
+        scale = np.linalg.norm(mvp[1, :3]) * viewport_height / 2
+        near = w <= self.leaf_radius
+        diameter = 2 * self.leaf_radius * scale / np.where(near, 1, w)
+        needed = np.where(near, count, np.ceil(np.square(diameter / point_size)))
+        count = np.minimum(count, needed)
+
+        # point budget shared in proportion to leaf needs
+        total = np.sum(count)
+        if total > budget:
+            count = np.ceil(count * (float(budget) / total))
+        count = count.astype(np.int64)
+        keep = count > 0
+        return first[keep], count[keep]
@@ -125,6 +125,111 @@ class Cloud(object):
         self.Mrev = np.array([c,s,-s,c]).T.reshape((-1,2,2))
 
 
+class ChunkArray(object):
+    # Points grouped to chunks by integer keys. Chunks are kept sorted by key,
+    # last key column is the major one (layer).
+    def __init__(self, keys = None, ids = None):
+        self.keys  = np.empty((0,0), dtype=int) # chunk keys
+        self.order = np.empty((0), dtype=int)   # source point ids grouped by chunk
+        self.start = np.empty((0), dtype=int)   # first point of chunk in order
+        self.count = np.empty((0), dtype=int)   # points in chunk
+        self.data  = {}                         # per chunk arrays
+        if keys is not None:
+            self.group(keys, ids)
+
+    def __len__(self):
+        return len(self.count)
+
+    def group(self, keys, ids = None):
+        # keys - N x K point keys, ids - source point ids of keys
+        keys = np.asarray(keys)
+        order = np.lexsort(keys.T)
+        keys = keys[order]
+        if ids is not None:
+            order = np.asarray(ids)[order]
+        start = np.flatnonzero( np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)] ) if len(keys) > 0 \
+                else np.empty((0), dtype=int)
+
+        self.keys  = keys[start]
+        self.order = order
+        self.start = start
+        self.count = np.diff(np.r_[start, len(order)]).astype(int)
+        self.data  = {}
+
+    def point_ids(self, i):
+        return self.order[self.start[i]:self.start[i]+self.count[i]]
+
+    def layer_point_ids(self, first, last):
+        # source point ids of chunks [first, last)
+        return self.order[self.start[first]:self.start[last-1]+self.count[last-1]]
+
+    # --- per chunk statistics of source point values
+    def sum(self, values):
+        if len(self.count) == 0:
+            return np.zeros( (0,)+np.shape(values)[1:] )
+        return np.add.reduceat(np.asarray(values, dtype=np.float64)[self.order], self.start, axis=0)
+
+    def mean(self, values):
+        return self.sum(values) / self.count.reshape( (-1,)+(1,)*(np.ndim(values)-1) )
+
+    def var(self, values):
+        avg = self.mean(values)
+        d = np.asarray(values, dtype=np.float64)[self.order] - np.repeat(avg, self.count, axis=0)
+        return self.mean_sorted(d*d)
+
+    def circmean(self, values):
+        # same range as stats.circmean: [0 ... 2*PI)
+        return np.arctan2(self.sum(np.sin(values)), self.sum(np.cos(values))) % (2*np.pi)
+
+    def mean_sorted(self, values):
+        # values already in chunk order
+        if len(self.count) == 0:
+            return np.zeros( (0,)+np.shape(values)[1:] )
+        return np.add.reduceat(values, self.start, axis=0) / self.count.reshape( (-1,)+(1,)*(np.ndim(values)-1) )
+
+    # --- chunk selection and joins
+    def select(self, mask):
+        mask = np.asarray(mask, dtype=bool)
+        self.order = self.order[np.repeat(mask, self.count)]
+        self.keys  = self.keys[mask]
+        self.count = self.count[mask]
+        self.start = np.cumsum(self.count) - self.count
+        for k,v in self.data.iteritems():
+            self.data[k] = v[mask]
+
+    def layers(self):
+        # major key values and [first, last) chunk ranges of each layer
+        if len(self.keys) == 0:
+            return np.empty((0), dtype=int), np.empty((0), dtype=int), np.empty((0), dtype=int)
+        z = self.keys[:,-1]
+        first = np.flatnonzero( np.r_[True, z[1:] != z[:-1]] )
+        last  = np.r_[first[1:], len(z)].astype(int)
+        return z[first], first, last
+
+    def layer_count(self):
+        # amount of chunks in layer of each chunk
+        _, first, last = self.layers()
+        return np.repeat(last-first, last-first)
+
+    def match(self, other):
+        # indexes of chunks with same keys in self and other. Ascending, so grouped by layer
+        if len(self) == 0 or len(other) == 0:
+            return np.empty((0), dtype=int), np.empty((0), dtype=int)
+        lo = np.minimum(self.keys.min(axis=0), other.keys.min(axis=0))
+        dims = np.maximum(self.keys.max(axis=0), other.keys.max(axis=0)) - lo + 1
+        a = np.ravel_multi_index( (self.keys  - lo).T[::-1], dims[::-1] )
+        b = np.ravel_multi_index( (other.keys - lo).T[::-1], dims[::-1] )
+        _, ia, ib = np.intersect1d(a, b, assume_unique=True, return_indices=True)
+        return ia, ib
+
+    def match_layers(self, other):
+        # layer ranges present in both self and other
+        zA, firstA, lastA = self.layers()
+        zB, firstB, lastB = other.layers()
+        z, ia, ib = np.intersect1d(zA, zB, assume_unique=True, return_indices=True)
+        return z, zip(firstA[ia], lastA[ia]), zip(firstB[ib], lastB[ib])
+
+
 class ChunksPolar(object):
     def __init__(self, width = 2., height = 2., maxvar=4., min_amount = 3):
         self.width = np.deg2rad(width)
@@ -133,12 +238,12 @@ class ChunksPolar(object):
         self.min_amount = min_amount
         self.cloud = Cloud( points_rt=np.empty((0,2), dtype=np.float32) ) # avg points for chunks
         self.src_cloud = None
-        self.chunks = {}
+        self.chunks = ChunkArray()
         self.chunks_count = 0
 
     def put_points(self, src_cloud):
         self.src_cloud = src_cloud
-        self.chunks = {}
+        self.chunks = ChunkArray()
         self.chunks_count = 0
 
         print "Build polar chunks"
@@ -158,99 +263,65 @@ class ChunksPolar(object):
 
             # group points to chunks
             print "\tGrouping points"
-            for _id,(_t,_z) in enumerate(zip(t, z)):
-                self.chunks.setdefault(_z,{}).setdefault(_t,[]).\
-                       append(_id)
+            chunks = ChunkArray(np.array([t, z]).T)
 
             # calculate chunks parameters
             print "\tCalculating chunks"
-            delete = []
-            for _z,T in self.chunks.iteritems():
-                # T - current horizontal slice (Thetas list)
-                s = {}
-                for _t,D in T.iteritems():
-                    # D - current chunk point ids
-                    _var = np.var(points_rt[D], axis=0)
-                    _cnt = len(D)
-                    if _var[0] <= self.maxvar and \
-                       _cnt >= self.min_amount:
-                        avg_xyz = np.mean(src_cloud.points_xyz[D], axis=0)
-                        avg_c   = np.mean(src_cloud.points_color.astype(np.uint16)[D], axis=0).astype(np.uint8)
-                        avg_rt  = np.array([ np.mean(points_rt[D][:,0], axis=0), stats.circmean(points_rt[D][:,1], axis=0) ])
-                        avg_l   = stats.circmean(src_cloud.points_l[D], axis=0)
-                        # point_xyz, point_l, point_color, point_rt
-                        _id = self.cloud.add(avg_xyz, avg_l, avg_c, points_rt = avg_rt)
-                        s[_t] = [_id,D]
-                        self.chunks_count += 1
-                # replace layer
-                if len(s)>10: # minimum amount of chunks for precise align ( minimum = 2 to solve equations )
-                    self.chunks[_z] = s
-                    print "\tChunk z={0} - {1}".format(_z, len(s))
-                else:
-                    delete.append(_z)
-            for _x in delete:
-                del self.chunks[_x]
+            _var = chunks.var(points_rt[:,0])
+            chunks.select( (_var <= self.maxvar) & (chunks.count >= self.min_amount) )
+            # minimum amount of chunks for precise align ( minimum = 2 to solve equations )
+            chunks.select( chunks.layer_count() > 10 )
+
+            avg_rt = np.array([ chunks.mean(points_rt[:,0]), chunks.circmean(points_rt[:,1]) ]).T
+            self.cloud = Cloud( points_xyz   = chunks.mean(src_cloud.points_xyz), \
+                                points_l     = chunks.circmean(src_cloud.points_l), \
+                                points_color = chunks.mean(src_cloud.points_color), \
+                                points_rt    = avg_rt )
+            self.chunks = chunks
+            self.chunks_count = len(chunks)
+            for _z,first,last in zip(*chunks.layers()):
+                print "\tChunk z={0} - {1}".format(_z, last-first)
         print "[Done] build {0} chunks".format(self.chunks_count)
 
 
     def get_center_vertexes(self):
-        res=np.empty( (self.chunks_count,3), dtype=np.float32)
-        cnt = 0
-        for _z,T in self.chunks.iteritems(): # horizontal slices
-            for _t,D in T.iteritems():
-                #print "{0},{1}: {2}".format(_z, _t, D[0])
-                #print self.cloud.points_rt[D[0]]
-                res[cnt] = [self.cloud.points_rt[D[0]][0], _t*self.width, _z*self.height]
-                cnt += 1
-
+        res = np.array([ self.cloud.points_rt[:,0], \
+                         self.chunks.keys[:,0]*self.width, \
+                         self.chunks.keys[:,1]*self.height ], dtype=np.float32).T.reshape((-1,3))
         res[:,[0,1]] = pol2cart(res[:,[0,1]])
         return res
 
 
     def intersect(self, chunksB):
-        buf=[0,0]*min(self.chunks_count, chunksB.chunks_count)
-        cnt = 0
-        res={}
-        for _z,TA in self.chunks.iteritems(): # horizontal slices
-            TB = chunksB.chunks.get(_z,None)
-            if TB is None:
-                continue # no matching chunk in B
-
-            for _t,DA in TA.iteritems():
-                DB = TB.get(_t,None)
-                if DB is None:
-                    continue
-
-                buf[cnt] = [DA[0], DB[0]]
-                cnt += 1
-
-            if cnt>0:
-                res[_z] = buf[0:cnt]
-                cnt = 0
+        # matching chunk ids per layer: { z: N x [idA, idB] }
+        ia, ib = self.chunks.match(chunksB.chunks)
+        res = {}
+        if len(ia) > 0:
+            z = self.chunks.keys[ia,1]
+            for _z,part in zip( *_split_layers(z, np.array([ia, ib]).T) ):
+                res[_z] = part
         return res
 
-    def fit_chunks(self, chunksB):
-        self.cloud.make_M()
-        chunksB.cloud.make_M()
+    def fit_chunks(self, chunksB, full = False):
+        # full - fit source points of chunk layers instead of chunk centers
+        A = self.src_cloud if full else self.cloud
+        B = chunksB.src_cloud if full else chunksB.cloud
+        A.make_M()
+        B.make_M()
 
         res=[]
         delta = np.array([0.,0.])
-        for _z,TA in self.chunks.iteritems(): # horizontal slices
-            TB = chunksB.chunks.get(_z,None)
-            if TB is None:
-                continue # no matching Z layer in B
-
-            idxA = []
-            for _t,D in TA.iteritems():
-                idxA.append(D[0])
-
-            idxB = []
-            for _t,D in TB.iteritems():
-                idxB.append(D[0])
-
-            print "Layer {0}: {1} vs {2} points".format(_z, len(idxA), len(idxB))
-            delta = fit_clouds( self.cloud.points_xyz[idxA][:,[0,1]], self.cloud.Mrev[idxA], \
-                                chunksB.cloud.points_xyz[idxB][:,[0,1]], chunksB.cloud.Mrev[idxB], delta )
+        # matching Z layers in A and B
+        for _z,(a0,a1),(b0,b1) in zip(*self.chunks.match_layers(chunksB.chunks)):
+            if full:
+                idxA = self.chunks.layer_point_ids(a0, a1)
+                idxB = chunksB.chunks.layer_point_ids(b0, b1)
+            else:
+                idxA = slice(a0, a1)
+                idxB = slice(b0, b1)
+            print "Layer {0}: {1} vs {2} points".format(_z, len(A.points_l[idxA]), len(B.points_l[idxB]))
+            delta = fit_clouds( A.points_xyz[idxA][:,0:2], A.Mrev[idxA], \
+                                B.points_xyz[idxB][:,0:2], B.Mrev[idxB], delta )
             res += [delta.tolist()+[_z*self.height]]
             print ">>>>>>>>> {0} <<<<<<<<<<<".format(delta.tolist()+[_z*self.height])
 
@@ -264,99 +335,48 @@ class ChunksCubic(object):
         self.min_amount = min_amount
         self.cloud = Cloud() # avg points for chunks
         self.src_cloud = None
-        self.chunks = {}
+        self.chunks = ChunkArray()
         self.chunks_count = 0
 
     def put_points(self, src_cloud):
         self.src_cloud = src_cloud
-        self.chunks = {}
+        self.chunks = ChunkArray()
         self.chunks_count = 0
 
         print "Build cubic chunks"
         # make chunks centers
-        print src_cloud.points_xyz.shape
         xyz = np.around(src_cloud.points_xyz/np.array([self.width, self.width, self.height])).astype(int)
-        print xyz.shape
         
         # group points to chunks
         print "\tGrouping points"
-        for _id,(_x,_y,_z) in enumerate(xyz):
-            self.chunks.setdefault(_z,{}).setdefault(_y,{}).setdefault(_x,[]).\
-                   append(_id)
+        chunks = ChunkArray(xyz)
         
         # calculate chunks parameters
         print "\tCalculating chunks"
-        delete = []
-        for _z,Y in self.chunks.iteritems():
-            # T - current horizontal slice (Thetas list)
-            yy = {}
-            for _y,X in Y.iteritems():
-                xx = {}
-                for _x,D in X.iteritems():
-                    # D - current chunk point ids
-                    if len(D) >= self.min_amount:
-                        #print "1 -> {0}".format(len(D))
-                        avg_xyz =        np.mean(src_cloud.points_xyz[D], axis=0)
-                        avg_l   = stats.circmean(src_cloud.points_l[D], axis=0)
-                        avg_c   =        np.mean(src_cloud.points_color.astype(np.uint32)[D], axis=0).astype(np.uint8)
-                        #print "2"
-                        # point_xyz, point_l, point_color, point_rt
-                        _id = self.cloud.add(avg_xyz, avg_l, avg_c)
-                        xx[_x] = [_id,D]
-                        self.chunks_count += 1
-                # replace layer
-                if len(xx)>0:
-                  yy[_y] = xx
-                #print "\t\tChunk y={0} -> {1}".format(_y, len(xx))
-            # replace layer
-            if len(yy)>0:
-                self.chunks[_z] = yy
-                print "\tChunk z={0} -> {1}".format(_z,len(yy))
-            else:
-                delete.append(_z)
-        for _z in delete:
-            del self.chunks[_z]
+        chunks.select( chunks.count >= self.min_amount )
+        self.cloud = Cloud( points_xyz   = chunks.mean(src_cloud.points_xyz), \
+                            points_l     = chunks.circmean(src_cloud.points_l), \
+                            points_color = chunks.mean(src_cloud.points_color) )
+        self.chunks = chunks
+        self.chunks_count = len(chunks)
+        for _z,first,last in zip(*chunks.layers()):
+            print "\tChunk z={0} -> {1}".format(_z, last-first)
         print "[Done] build {0} chunks".format(self.chunks_count)
 
 
     def get_center_vertexes(self):
-        res=np.empty( (self.chunks_count,3), dtype=np.float32)
-        cnt = 0
-        for _z,Y in self.chunks.iteritems(): # horizontal slices
-            for _y,X in Y.iteritems():
-                for _x,D in X.iteritems():
-                    res[cnt] = [_x*self.width, _y*self.width, _z*self.height]
-                    cnt += 1
-
-        return res
+        return (self.chunks.keys * np.array([self.width, self.width, self.height])).astype(np.float32).reshape((-1,3))
 
 
     def intersect(self, chunksB):
         print "Intersect chunks {0} vs {1}".format(self.chunks_count, chunksB.chunks_count)
-        buf=[0,0] * min(self.chunks_count, chunksB.chunks_count)
-        cnt = 0
+        ia, ib = self.chunks.match(chunksB.chunks)
         res = {}
-        for _z,YA in self.chunks.iteritems(): # horizontal slices
-            YB = chunksB.chunks.get(_z,None)
-            if YB is None:
-                continue # no matching chunk in B
-
-            for _y,XA in YA.iteritems():
-                XB = YB.get(_y,None)
-                if XB is None:
-                    continue
-
-                for _x,DA in XA.iteritems():
-                    DB = XB.get(_x,None)
-                    if DB is None:
-                        continue
-
-                    buf[cnt] = [DA[0], DB[0]]
-                    cnt += 1
-            if cnt>0:
-                print "\tChunk z={0} -> {1}".format(_z,cnt)
-                res[_z] = buf[0:cnt]
-                cnt = 0
+        if len(ia) > 0:
+            z = self.chunks.keys[ia,2]
+            for _z,part in zip( *_split_layers(z, np.array([ia, ib]).T) ):
+                print "\tChunk z={0} -> {1}".format(_z,len(part))
+                res[_z] = part
         return res
 
 
@@ -365,72 +385,51 @@ class MeshTools(object):
         self.mesh = mesh
 
     def get_laser_clouds(self):
-        print spatial.KDTree
         print "Splitting mesh by laser id"
+        n = self.mesh.vertex_count
+        lasers = self.mesh.vertexes_meta['laser_id'][:n]
         res = {}
-        for p in zip(self.mesh.vertexes, self.mesh.colors, self.mesh.vertexes_meta)[0:self.mesh.vertex_count]:
-            c = res.setdefault(p[2][0], Cloud())
-            c.add(p[0], p[2][1][1], p[1])
+        for _l in np.unique(lasers):
+            idx = lasers == _l
+            res[_l] = Cloud( self.mesh.vertexes[:n][idx], \
+                             self.mesh.vertexes_meta['slice_l'][:n][idx], \
+                             self.mesh.colors[:n][idx] )
 
         return res
 
 
     def get_laser_clouds2(self):
-        # with preallocate array
+        # one stable sort by laser id, clouds are views of sorted arrays
         print "Splitting mesh by laser id"
-        idx = {}
+        n = self.mesh.vertex_count
+        lasers = self.mesh.vertexes_meta['laser_id'][:n]
+        if n > 0 and np.all(lasers == lasers[0]):
+            order = slice(0, n) # single laser: views of mesh arrays
+        else:
+            order = np.argsort(lasers, kind='mergesort')
+        xyz   = self.mesh.vertexes[order]
+        l     = self.mesh.vertexes_meta['slice_l'][order]
+        color = self.mesh.colors[order]
+
         res = {}
-        for p in zip(self.mesh.vertexes, self.mesh.colors, self.mesh.vertexes_meta)[0:self.mesh.vertex_count]:
-            c = res.setdefault(p[2][0], Cloud(length = self.mesh.vertex_count))
-            i = idx.setdefault(p[2][0], 0)
-            c.points_xyz[i] = p[0]
-            c.points_l[i] = p[2][1][1]
-            c.points_color[i] = p[1]
-            idx[p[2][0]] += 1
-
-        for i,p in idx.iteritems():
-            res[i].resize(p)
+        _lasers, first, count = np.unique(lasers[order], return_index=True, return_counts=True)
+        for _l,a,c in zip(_lasers, first, count):
+            cloud = Cloud()
+            cloud.points_xyz   = xyz[a:a+c]
+            cloud.points_l     = l[a:a+c]
+            cloud.points_color = color[a:a+c]
+            res[_l] = cloud
         return res
 
 
     def have_slices(self):
-        if len(self.mesh.vertexes)<=0:
-            return None
-        return self.mesh.vertexes_meta[0][1] is not None
+        return have_slices(self.mesh.vertexes_meta[:self.mesh.vertex_count])
 
 
     def reconstruct_slices(self, step = None):
         print "Reconstruct slices"
-        # step - scanning step in radians
-        #step = np.deg2rad(0.9)
-        first_laser = np.min(self.mesh.vertexes_meta[:,0])
-        cur_slice = 0
-        prev_laser = first_laser
-        prev_z = 65535
-        for m,v in zip(self.mesh.vertexes_meta,self.mesh.vertexes):
-            if m[0] != prev_laser and m[0] == first_laser:
-                cur_slice += 1
-            elif m[0] == prev_laser and v[2]-5 > prev_z:
-                cur_slice += 1
-
-            if step is None:
-                m[1] = (cur_slice, 0)
-            else:
-                m[1] = (cur_slice, cur_slice*step)
-            prev_laser = m[0]
-            prev_z = v[2]
-
-        if step is None and cur_slice > 0:
-            step = 2*np.pi/(cur_slice)
-            #for m,c in zip(self.vertexes_meta, self.colors):
-            for m in self.mesh.vertexes_meta:
-                m[1] = (m[1][0], m[1][0]*step)
-                #c[0] = int(m[1][0]*255/801)
-                #c[1] = c[0]
-                #c[2] = c[0]
-
-        logger.info("{0} Slices reconstructed. Angle: {1} deg".format(cur_slice, np.rad2deg(step)))
-            
+        n = self.mesh.vertex_count
+        reconstruct_slices(self.mesh.vertexes[:n], self.mesh.vertexes_meta[:n], step)
 
 
 class CloudTools(object):
@@ -472,12 +471,11 @@ class CloudTools(object):
     # Unwrap point cloud to cylindrical coords
     def make_radial(self):
         if self.vertex_count > 0:
-            print "Make polar coords cache"
-            #[x,y,z] = m.vertexes.T
-            r = np.linalg.norm(self.vertexes[:,0:2], axis=1)
-            t = np.arctan2(self.vertexes[:,1],self.vertexes[:,0])
-            #z = self.vertexes[:,2]
-            self.radial = np.array(zip(r,t))
+            if self.mesh is not None and self.mesh.vertexes is self.vertexes:
+                # shared with mesh cache
+                self.radial = self.mesh.get_cylindrical()[:,0:2]
+            else:
+                self.radial = cart2pol(self.vertexes[:self.vertex_count])
     
     def unwrap_mesh(self, width = 360., scale_z=1.):
         if self.mesh is None:
@@ -487,7 +485,11 @@ class CloudTools(object):
             self.make_radial()
 
         if self.radial is not None:
-            vertexes = np.array(zip(self.radial[:,0], (self.radial[:,1])*width/2/np.pi, self.vertexes[:,2]*scale_z))
+            n = len(self.radial)
+            vertexes = np.empty((n,3), dtype=np.float32)
+            vertexes[:,0] = self.radial[:,0]
+            np.multiply(self.radial[:,1], width/2/np.pi, out=vertexes[:,1])
+            np.multiply(self.vertexes[:n,2], scale_z, out=vertexes[:,2])
             self.mesh.vertexes = vertexes
             self.mesh.vertex_count = len(vertexes)
             self.mesh.colors       = self.colors
@@ -508,14 +510,17 @@ class CloudTools(object):
         #ll = self.vertexes_meta[:,0] # laser
         #col = np.array( [ ll*255, ll*255, ll*255 ], dtype=np.uint8).T
 
-        l = np.array(self.vertexes_meta[:,1].tolist(),dtype=np.float32)[:,1] # angle
+        l = self.vertexes_meta['slice_l'][:self.vertex_count] # angle
         #l = l*0xFF/2/np.pi 
         #col = np.array( [ l, l, l ], dtype=np.uint8).T
 
         if self.radial is not None:
-            x = self.radial[:,0]*np.cos(self.radial[:,1]+l)
-            y = self.radial[:,0]*np.sin(self.radial[:,1]+l)
-            vertexes = np.array(zip(x,y,self.vertexes[:,2]))
+            n = len(self.radial)
+            vertexes = np.empty((n,3), dtype=np.float32)
+            vertexes[:,0] = self.radial[:,0]
+            np.add(self.radial[:,1], l, out=vertexes[:,1])
+            vertexes[:,2] = self.vertexes[:n,2]
+            cyl2cart(vertexes, vertexes)
             self.mesh.vertexes = vertexes
             self.mesh.vertex_count = len(vertexes)
             self.mesh.colors       = self.colors
@@ -524,42 +529,13 @@ class CloudTools(object):
 
 
     def have_slices(self):
-        if len(self.vertexes)<=0:
-            return None
-        return self.vertexes_meta[0][1] is not None
+        return have_slices(self.vertexes_meta[:self.vertex_count])
 
     def reconstruct_slices(self, step = None):
         print "Reconstruct slices"
-        # step - scanning step in radians
-        #step = np.deg2rad(0.9)
-        first_laser = np.min(self.vertexes_meta[:,0])
-        cur_slice = 0
-        prev_laser = first_laser
-        prev_z = 65535
-        for m,v in zip(self.vertexes_meta,self.vertexes):
-            if m[0] != prev_laser and m[0] == first_laser:
-                cur_slice += 1
-            elif m[0] == prev_laser and v[2]-5 > prev_z:
-                cur_slice += 1
-
-            if step is None:
-                m[1] = (cur_slice, 0)
-            else:
-                m[1] = (cur_slice, cur_slice*step)
-            prev_laser = m[0]
-            prev_z = v[2]
-
-        if step is None and cur_slice > 0:
-            step = 2*np.pi/(cur_slice)
-            #for m,c in zip(self.vertexes_meta, self.colors):
-            for m in self.vertexes_meta:
-                m[1] = (m[1][0], m[1][0]*step)
-                #c[0] = int(m[1][0]*255/801)
-                #c[1] = c[0]
-                #c[2] = c[0]
-
-        logger.info("{0} Slices reconstructed. Angle: {1} deg".format(cur_slice, np.rad2deg(step)))
-            
+        n = self.vertex_count
+        reconstruct_slices(self.vertexes[:n], self.vertexes_meta[:n], step)
+
     def get_corrected_vertices(self, delta = [0,0]):
         if self.radial is none:
             self.make_radial()
@@ -567,7 +543,7 @@ class CloudTools(object):
         assert self.radial is not None, "No input vertices (self.radial == None)"
         print "Get corrected {0}, {1} points".format(delta, len(vert))
 
-        l = np.array(self.vertexes_meta[:,1].tolist(),dtype=np.float32)[:,1] # angle
+        l = self.vertexes_meta['slice_l'][:self.vertex_count] # angle
         res = np.copy(vert) # keep original data intact
         res[:,1] += l
         res = pol2cart(res)
@@ -589,7 +565,7 @@ class CloudTools(object):
 
         if self.radial is not None:
             t = np.around(self.radial[:,1]/np.deg2rad(width)).astype(int)
-            z = np.around(self.vertexes[:,2]/height).astype(int)
+            z = np.around(self.vertexes[:len(self.radial),2]/height).astype(int)
             
             # glue cylinder seam. theta is in [-PI ... +PI] range. 
             # Glue +180 points to first -180 chunk.
@@ -601,55 +577,36 @@ class CloudTools(object):
             #t[ t >= mx ] = -mx
 
             # group points to chunks
+            # { laser num: ChunkArray by (chunk_theta, chunk_z) }
             self.chunks = {}
             print "Grouping points"
-            #for _id,(_r,_t,_z,_c,_m) in enumerate(zip(self.radial, t, z, \
-            for _id,(_r,_t,_z,_c,_m) in enumerate(zip(rad, t, z, \
-                 self.colors, self.vertexes_meta)): # radial, chunk_theta, chunk_z, color, laser num
-                self.chunks.setdefault(_m[0],{'width': width, 'height': height}).\
-                              setdefault(_z,{}).\
-                                setdefault(_t,[]).\
-                       append([ _id,_r,np.array(_c, np.uint16),_m[1][1] ]) # id, [radial], [color], slice_l
+            lasers = self.vertexes_meta['laser_id'][:len(rad)]
+            keys = np.array([t, z]).T
+            for _l in np.unique(lasers):
+                ids = np.flatnonzero(lasers == _l)
+                self.chunks[_l] = ChunkArray(keys[ids], ids)
         
             # calculate chunks parameters
             print "Calculating chunks"
+            slice_l = self.vertexes_meta['slice_l'][:len(rad)]
             for _l,C in self.chunks.iteritems():
-                # C - chunk for current laser cloud
-                delete = []
-                for _z,T in C.iteritems():
-                    # T - current horizontal slice (Thetas list)
-                    #print "T: {0}:{1}".format(_z,T)
-                    if not isinstance(_z, (int, long)):
-                        continue # metadata
-
-                    s = {}
-                    for _t,D in T.iteritems():
-                        # D - current chunk Data
-                        # id, [radial], [color], slice_l
-                        D = np.array(D)
-                        _var = np.var(D[:,1], axis=0)
-                        _cnt = len(D)
-                        if _var[0] <= maxvar and \
-                           _cnt >= min_amount:
-                            if _var[1]>np.deg2rad(10):
-                                print "Out points {0}".format( np.rad2deg(np.array(D[:,1].tolist())[:,1]) )
-                            avg_r = np.mean(D[:,1], axis=0)
-                            avg_c = np.mean(D[:,2], axis=0).astype(np.uint8)
-                            #avg_l = np.mean(D[:,3], axis=0)
-                            avg_l = stats.circmean(np.array(D[:,3], dtype=np.float32), axis=0)
-                            _id = D[:,0]
-                            # [radial], [color], slice_l, variance, count, [orig index]
-                            s[_t] = np.array([avg_r, avg_c, avg_l, _var, _cnt, _id])
-                            #s[_t] = np.array([avg_r, avg_c, D[0,3], _var, _cnt, _id])
-                            #s[_t] = np.array([D[0,1], avg_c, D[0,3], _var, _cnt, _id])
-                    # replace layer
-                    if len(s)>10: # minimum amount of chunks for precise align ( minimum = 2 to solve equations )
-                        C[_z] = s
-                        print "Chunk z={0} - {1}".format(_z, len(s))
-                    else:
-                        delete.append(_z)
-                for _x in delete:
-                    del C[_x]
+                # C - chunks for current laser cloud
+                C.width = width
+                C.height = height
+                _var = C.var(rad)
+                C.data['var'] = _var
+                C.select( (_var[:,0] <= maxvar) & (C.count >= min_amount) )
+                out = np.count_nonzero(C.data['var'][:,1] > np.deg2rad(10))
+                if out > 0:
+                    print "Out points in {0} chunks".format(out)
+                # minimum amount of chunks for precise align ( minimum = 2 to solve equations )
+                C.select( C.layer_count() > 10 )
+
+                C.data['radial'] = C.mean(rad)
+                C.data['color']  = C.mean(self.colors[:len(rad)]).astype(np.uint8)
+                C.data['l']      = C.circmean(slice_l)
+                for _z,first,last in zip(*C.layers()):
+                    print "Chunk z={0} - {1}".format(_z, last-first)
             print "Done build chunks"
 
 
@@ -658,117 +615,63 @@ class CloudTools(object):
             return np.array([]),np.array([])
 
         print "Retreive chunk vertices"
-        width = np.deg2rad(chunk['width'])
-        height = chunk['height']
-        vertexes = []
-        colors = []
-        for _z,T in chunk.iteritems():
-            # T - current horizontal slice
-            if isinstance(_z, (int, long)):
-                #print "Slice {0}: {1}".format(_z,T)
-                for _t,D in T.iteritems():
-                    # current chunk
-                    # [radial], [color], slice_l, variance, count, [orig index]
-                    #print "D: {0}".format(D)
-                    #vertexes.append( [D[0][0]*np.cos(D[0][1]), D[0][0]*np.sin(D[0][1]), _z*height] ) # points
-                    #vertexes.append( [D[0][0]*np.cos(_t*width), D[0][0]*np.sin(_t*width), _z*height] ) # chunk center
-                    #vertexes.append( [D[0][0]*np.cos(D[0][1]+D[2]), D[0][0]*np.sin(D[0][1]+D[2]), _z*height] ) # point reverted
-                    #vertexes.append( [D[0][0]*np.cos(_t*width+D[2]), D[0][0]*np.sin(_t*width+D[2]), _z*height] ) # chunk center reverted
-
-                    x = D[0][0]*np.cos(D[0][1]+D[2])+delta[0]
-                    y = D[0][0]*np.sin(D[0][1]+D[2])+delta[1]
-                    X = x * np.cos(-D[2]) - y * np.sin(-D[2]);
-                    Y = y * np.cos(-D[2]) + x * np.sin(-D[2]);
-                    vertexes.append( [X, Y, _z*height] ) # points
-
-                    colors.append( D[1] )
-                    #if np.rad2deg(_t*width) < 0:
-                    #    vertexes.append( [D[0][0]*np.cos(D[0][1]+D[2]), D[0][0]*np.sin(D[0][1]+D[2]), _z*height] )
-                    #    colors.append( D[1] )
-
-        return np.array(vertexes, dtype=np.float32), np.array(colors, dtype=np.uint8)
+        # chunk point reverted to capture position, shifted by delta and rotated back
+        r, t = chunk.data['radial'].T
+        l = chunk.data['l']
+        x = r*np.cos(t+l)+delta[0]
+        y = r*np.sin(t+l)+delta[1]
+        X = x * np.cos(-l) - y * np.sin(-l)
+        Y = y * np.cos(-l) + x * np.sin(-l)
+        vertexes = np.array([X, Y, chunk.keys[:,1]*chunk.height]).T.reshape((-1,3))
+
+        return np.array(vertexes, dtype=np.float32), np.array(chunk.data['color'], dtype=np.uint8)
 
 
     def adjust_chunks(self, chunkA, chunkB):
         print "Adjust chunks"
 
-        assert chunkA['width'] == chunkB['width'] and \
-            chunkA['height'] == chunkB['height'], \
+        assert chunkA.width == chunkB.width and \
+            chunkA.height == chunkB.height, \
             "Compared chunks must have same chunk size"
 
-        width  = chunkA['width']
-        height = chunkA['height']
+        width  = chunkA.width
+        height = chunkA.height
         res = [] #{'width': width, 'height': height}
                     
-        # prepare point indexes
-        ls = np.array(self.vertexes_meta[:,1].tolist())[:,1] # turntable L
+        ia, ib = chunkA.match(chunkB)
+        if len(ia) == 0:
+            return np.array(res, dtype=np.float32)
+
+        # matching chunks: point reverted to capture position
+        lA = chunkA.data['l'][ia]
+        lB = chunkB.data['l'][ib]
+        pA = np.column_stack(( chunkA.data['radial'][ia,0], chunkA.data['radial'][ia,1]+lA ))
+        pB = np.column_stack(( chunkB.data['radial'][ib,0], chunkB.data['radial'][ib,1]+lB ))
+        lAB = np.abs(lA-lB)
+
+        # scaling correction 
+        # assume points are at their correct angular places: A to B angle corresponds actual angle
+        A = pol2cart(pA)
+        B = pol2cart(pB)
+        l = 2*np.tan(lAB/2)
+
+        P = (A+B)/2
+        V = np.array([ B[:,1]-A[:,1], A[:,0]-B[:,0] ]).T / l[:,np.newaxis]
+
+        # rotation center candidate nearest to origin
+        C = np.where( (np.linalg.norm(P+V, axis=1) < np.linalg.norm(P-V, axis=1))[:,np.newaxis], P+V, P-V )
+
         delta = [0] # [0,0]
-        for _z,TA in chunkA.iteritems(): # horizontal slices
-            if not isinstance(_z, (int, long)):
-                continue # skip metadata
-
-            TB = chunkB.get(_z,None)
-            if TB is None:
-                continue # no matching chunk in B
-
-            # TA,TB - valid horizontal slices to compare
-            pA = []
-            pB = []
-            lAB = []
-            Cn = []
-            for _t,DA in TA.iteritems():
-                # current chunk
-                DB = TB.get(_t,None)
-                if DB is None:
-                    continue # no matching chunk in B
-
-                # D: [radial], [color], slice_l, variance, count, [orig index]
-                pA.append([ DA[0][0], DA[0][1]+DA[2] ])
-                pB.append([ DB[0][0], DB[0][1]+DB[2] ])
-                lAB.append(np.abs(DA[2]-DB[2]))
-
-                # scaling correction 
-                # assume points are at their correct angular places: A to B angle corresponds actual angle
-                Ax = DA[0][0] * np.cos(DA[0][1]+DA[2])
-                Ay = DA[0][0] * np.sin(DA[0][1]+DA[2])
-
-                Bx = DB[0][0] * np.cos(DB[0][1]+DB[2])
-                By = DB[0][0] * np.sin(DB[0][1]+DB[2])
-
-                l = 2*np.tan(np.abs(DA[2]-DB[2])/2)
-
-                Px = (Ax+Bx)/2
-                Py = (Ay+By)/2
-
-                Vx = (By-Ay)/l
-                Vy = (Ax-Bx)/l
-
-                C = np.array([[Px+Vx,Py+Vy],[Px-Vx,Py-Vy]], dtype=np.float32)
-
-                L = np.linalg.norm(C, axis=1)
-                if (L[0]<L[1]):
-                    Cn.append(C[0])
-                    #print "{0}: {1}".format(_z, C[0])
-                else:
-                    Cn.append(C[1])
-                    #print "{0}: {1}".format(_z, C[1])
-            if len(pA) > 10: # amount of corresponding chunks
+        z = chunkA.keys[ia,1]
+        for _z,idx in zip( *_split_layers(z, np.arange(len(ia))) ):
+            if len(idx) > 10: # amount of corresponding chunks
                 # minimum 2 required to solve. but for better precision use 10+. Also look at "build_chunks"
-                C = np.mean(Cn, axis=0)
-                #print "C: {0} => {1}".format(Cn, C)
-                pA = pol2cart(pA)+C
-                pB = pol2cart(pB)+C
-
-                #v = np.append(pA,pB,axis=0)
-                #v = np.array(pA,dtype=np.float32)
-                #v = np.insert(v, 2, _z*height, axis=1)
-                #res += v.tolist()
+                Cn = np.mean(C[idx], axis=0)
 
                 #delta = fit_correction(pA, pB, [0,0])
-                delta = fit_correction(pA, pB, lAB, delta)
+                delta = fit_correction(A[idx]+Cn, B[idx]+Cn, lAB[idx], delta)
                 #res[_z] = [delta[0],delta[1], _z]
-                res.append([C[0]+delta[0], C[1], _z*height] )
-            #res.append(np.append(np.mean(Cn, axis=0), [_z*height]) )
+                res.append([Cn[0]+delta[0], Cn[1], _z*height] )
         return np.array(res, dtype=np.float32)
 
 
@@ -793,19 +696,50 @@ class CloudTools(object):
 
 
 # =======================
-def cart2pol(points):
-    # [ x, y ]
-    points = np.array(points)
-    r = np.linalg.norm(points, axis=1)
+# Polar / cylindrical coords. Results are float32 Nx2 / Nx3 arrays,
+# written to out if given. out may be the input array itself.
+
+def cart2pol(points, out=None):
+    # [ x, y ] -> [ radius, theta ]
+    points = np.asarray(points)
+    if out is None:
+        out = np.empty((len(points), 2), dtype=np.float32)
     t = np.arctan2(points[:,1], points[:,0])
-    return np.array(zip(r, t), dtype=np.float32)
-
-def pol2cart(radial):
-    # [ radius, theta ]
-    radial = np.array(radial)
-    x = radial[:,0] * np.cos(radial[:,1])
-    y = radial[:,0] * np.sin(radial[:,1])
-    return np.array(zip(x, y), dtype=np.float32)
+    np.hypot(points[:,0], points[:,1], out=out[:,0])
+    out[:,1] = t
+    return out
+
+def pol2cart(radial, out=None):
+    # [ radius, theta ] -> [ x, y ]
+    radial = np.asarray(radial)
+    if out is None:
+        out = np.empty((len(radial), 2), dtype=np.float32)
+    c = np.cos(radial[:,1])
+    s = np.sin(radial[:,1])
+    np.multiply(radial[:,0], s, out=s)
+    np.multiply(radial[:,0], c, out=out[:,0])
+    out[:,1] = s
+    return out
+
+def cart2cyl(points, out=None):
+    # [ x, y, z ] -> [ radius, theta, z ]
+    points = np.asarray(points)
+    if out is None:
+        out = np.empty((len(points), 3), dtype=np.float32)
+    cart2pol(points, out[:,0:2])
+    if out is not points:
+        out[:,2] = points[:,2]
+    return out
+
+def cyl2cart(radial, out=None):
+    # [ radius, theta, z ] -> [ x, y, z ]
+    radial = np.asarray(radial)
+    if out is None:
+        out = np.empty((len(radial), 3), dtype=np.float32)
+    pol2cart(radial, out[:,0:2])
+    if out is not radial:
+        out[:,2] = radial[:,2]
+    return out
 
 # ----------------------------------
 def mean_n(arr, cnt):
@@ -814,6 +748,43 @@ def mean_n(arr, cnt):
 def cicrcmean_n(arr, cnt):
     return stats.circmean( arr.reshape((-1,cnt)+arr.shape[1:]), axis=1)
 
+# ----------------- Slices -------------
+def have_slices(meta):
+    # meta - vertexes meta of mesh points
+    if len(meta)<=0:
+        return None
+    return bool(np.all(meta['slice_no'] >= 0))
+
+def reconstruct_slices(vertexes, meta, step = None):
+    # Restore slice numbers from point order. New slice starts when first laser
+    # comes again or same laser line jumps back to bottom.
+    # step - scanning step in radians, estimated from slice count if None.
+    # meta fields are updated in place.
+    if len(meta) <= 0:
+        return step
+    laser = meta['laser_id']
+    z = vertexes[:,2]
+    first_laser = np.min(laser)
+    prev_laser = np.r_[first_laser, laser[:-1]]
+    prev_z = np.r_[65535, z[:-1]]
+    new_slice = ( (laser != prev_laser) & (laser == first_laser) ) | \
+                ( (laser == prev_laser) & (z-5 > prev_z) )
+    slice_no = np.cumsum(new_slice)
+    cur_slice = slice_no[-1]
+
+    if step is None and cur_slice > 0:
+        step = 2*np.pi/(cur_slice)
+    meta['slice_no'] = slice_no
+    meta['slice_l'] = slice_no*step if step is not None else 0
+
+    logger.info("{0} Slices reconstructed. Angle: {1} deg".format(cur_slice, np.rad2deg(step) if step is not None else None))
+    return step
+
+def _split_layers(z, arr):
+    # split arr by runs of equal z: ([z values], [arr parts])
+    first = np.flatnonzero( np.r_[True, z[1:] != z[:-1]] )
+    return z[first].tolist(), np.split(arr, first[1:])
+
 # ----------------- R Mat -------------
 def rmat2d_arr(l):
     # l - array of radians
@@ -941,30 +912,68 @@ def fit_correction(data):
 
     return offset
 '''
-def risiduals_fit_clouds(V, PA, MAneg, PB, MBneg):
-    A = PA+ apply_mat_arr(MAneg, np.full((PA.shape[0],2), V))
-    B = PB+ apply_mat_arr(MBneg, np.full((PB.shape[0],2), V))
-    #print "A: {0}\nB:{1} {2}".format(A.shape, B.shape, B[20]-PB[20])
-    print "\n\tA: {0}\tB:{1}".format(A[10]-PA[10], B[10]-PB[10])
-    tA = spatial.KDTree(A)
-    tB = spatial.KDTree(B)
-    #print len(tA.query_pairs(10))
-    diff = tA.sparse_distance_matrix(tB, 99999999)
-    res = diff.mean() # TODO mean of minimums
-    print "\t{0} -> {1}".format(V, res)
-    #return [res,res]
-    return diff.toarray().sum(axis=0)
-
-
-def fit_clouds(PA, MAneg, PB, MBneg, prev = np.array([0.,0.])):
-
-    V = prev
-    offset, ier = optimize.leastsq(risiduals_fit_clouds, V, args=( (PA, MAneg, PB, MBneg) ))
-    print "Fit result: {0}  ier={1}".format(offset, ier)
-    #res = optimize.least_squares(risiduals_fit_clouds, V, args=( (PA, MAneg, PB, MBneg) ), bounds = [(-15,-15),(15,15)] )
-    #offset = res.x
-    #print "-----------------------------\nFit result: {0}\n===============================\n".format(res)
-
-    return offset
+def risiduals_fit_clouds(V, dAB, MAB, nB):
+    # point to line distances of matched points
+    # dAB - A-B point vectors, MAB - MAneg-MBneg matrices, nB - B normals
+    return np.einsum('ij,ij->i', dAB + apply_mat_arr(MAB, np.full((dAB.shape[0],2), V)), nB)
+
+
+def _query_nearest(tree, points, k = 1):
+    # parallel query. scipy < 1.6 calls workers n_jobs
+    try:
+        return tree.query(points, k, workers=-1)
+    except TypeError:
+        return tree.query(points, k, n_jobs=-1)
+
+
+def cloud_normals_2d(tree, k = 16):
+    # normals of 2D cloud from k nearest neighbours covariance
+    _, nb = _query_nearest(tree, tree.data, k)
+    p = tree.data[nb] - np.mean(tree.data[nb], axis=1)[:,np.newaxis]
+    cxx = np.sum(p[:,:,0]**2, axis=1)
+    cyy = np.sum(p[:,:,1]**2, axis=1)
+    cxy = np.sum(p[:,:,0]*p[:,:,1], axis=1)
+    # direction of smallest eigenvalue
+    a = 0.5*np.arctan2(2*cxy, cxx-cyy) + np.pi/2
+    return np.array([np.cos(a), np.sin(a)]).T
+
+
+def fit_clouds(PA, MAneg, PB, MBneg, prev = np.array([0.,0.]), max_iter = 30, tol = 1e-3, f_scale = 1.):
+    # nearest neighbour ICP for platform center offset V:
+    #     A = PA + MAneg*V,  B = PB + MBneg*V
+    # KD-tree and normals are built once for PB. Offset of previously matched B point
+    # is moved to A side, so at convergence queries against fixed PB match queries against B.
+    # Each iteration is one reweighted point to line least squares step with
+    # soft L1 loss, so unmatched parts of clouds do not pull offset.
+    V = np.array(prev, dtype=np.float64)
+    if len(PA) == 0 or len(PB) < 3:
+        return V
+
+    tree = spatial.cKDTree(PB)
+    nB = cloud_normals_2d(tree, min(16, len(PB)))
+    idx = None
+    for it in xrange(max_iter):
+        MAB = MAneg if idx is None else MAneg - MBneg[idx]
+        dist, idx = _query_nearest(tree, PA + apply_mat_arr(MAB, np.full((PA.shape[0],2), V)))
+
+        dAB = PA - PB[idx]
+        MAB = MAneg - MBneg[idx]
+        n = nB[idx]
+        r = risiduals_fit_clouds(V, dAB, MAB, n)
+        w = 1. / np.sqrt(1. + (r/f_scale)**2)
+
+        # minimize sum w*(n.(dAB + MAB*V))^2 by step from V. Least squares keeps V
+        # along directions matched points do not constrain (same slice angles)
+        J = np.einsum('ik,ika->ia', n, MAB)
+        sw = np.sqrt(w)
+        step = np.linalg.lstsq(J * sw[:, np.newaxis], -r * sw, rcond=1e-6)[0]
+        _V = V + step
+        done = np.linalg.norm(_V-V) < tol
+        V = _V
+        if done:
+            break
+
+    print "Fit result: {0}  iterations={1}  mean distance={2}".format(V, it+1, np.mean(dist))
+    return V
 
 
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# This file is part of the Gryphon Scan Project
+
+__author__ = 'Mikhail N Klimushin aka Night Gryphon <ngryph@gmail.com>'
+__copyright__ = 'Copyright (C) 2019 Night Gryphon'
+__license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
+
+# Picking of point cloud points by view ray on CPU.
+# Ray is clipped to cloud bounding box and sampled with step equal to pick
+# radius. KD-tree ball queries around samples collect candidates, exact
+# distance to ray selects points within radius, the nearest to ray origin wins.
+
+import numpy as np
+from scipy import spatial
+
+
+class PointPicker(object):
+
+    def __init__(self, points):
+        self.points = np.asarray(points)
+        self.tree = None
+        if len(self.points) > 0:
+            self.tree = spatial.cKDTree(self.points)
+            self.lo = self.points.min(axis=0)
+            self.hi = self.points.max(axis=0)
+
+    def _clip(self, origin, direction, radius):
+        # ray parameter range inside bounding box grown by radius
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t0 = (self.lo - radius - origin) / direction
+            t1 = (self.hi + radius - origin) / direction
+        inside = (origin >= self.lo - radius) & (origin <= self.hi + radius)
+        # ray parallel to slab: fully inside or fully outside
+        parallel = direction == 0
+        t0 = np.where(parallel, np.where(inside, -np.inf, np.inf), t0)
+        t1 = np.where(parallel, np.where(inside, np.inf, -np.inf), t1)
+        t_min = max(np.max(np.minimum(t0, t1)), 0.0)
+        t_max = np.min(np.maximum(t0, t1))
+        return t_min, t_max
+
+    def pick(self, origin, direction, radius):
+        # index of point within radius from ray closest to ray origin or None
+        if self.tree is None:
+            return None
+        origin = np.asarray(origin, np.float64)
+        direction = np.asarray(direction, np.float64)
+        direction = direction / np.linalg.norm(direction)
+        t_min, t_max = self._clip(origin, direction, radius)
+        if t_min > t_max:
+            return None
+
+        steps = int(np.ceil((t_max - t_min) / radius)) + 1
+        samples = origin + np.linspace(t_min, t_max, steps)[:, np.newaxis] * direction
+        # any point within radius from ray is within this distance from a sample
+        reach = radius * np.sqrt(1.25)
+        candidates = self.tree.query_ball_point(samples, reach)
+        candidates = np.unique(np.concatenate([np.asarray(c, np.int64) for c in candidates]))
+        if len(candidates) == 0:
+            return None
+
+        v = self.points[candidates] - origin
+        t = np.dot(v, direction)
+        d = np.linalg.norm(v - t[:, np.newaxis] * direction, axis=1)
+        hit = (d <= radius) & (t >= 0)
+        if not np.any(hit):
+            return None
+        return candidates[hit][np.argmin(t[hit])]
@@ -358,6 +358,12 @@ class Settings(collections.MutableMapping):
         self._add_setting(
             Setting('flush_stream_windows', 'Flush stream Windows', 'preferences',
                     np.ndarray, np.ndarray(shape=(4,), dtype=int, buffer=np.array([0, 3, 3, 0]))))
+        # - Measured by flush calibration
+        # { 'camera_id WxH': [ scene change, settings change ] }
+        self._add_setting(
+            Setting('flush_calibrated', 'Flush calibrated', 'preferences', dict, {}))
+        self._add_setting(
+            Setting('flush_calibration_button', _('Calibrate flush'), 'no_settings', unicode, u''))
 
 
         # ========== Segmentation profiles ===========
@@ -389,6 +395,16 @@ class Settings(collections.MutableMapping):
             Setting('refinement_calibration', _('Refinement'), 'profile_settings',
                     unicode, u'RANSAC',
                     possible_values=(u'None', u'SGF', u'RANSAC')))
+        self._add_setting(
+            Setting('pyramid_calibration', _('Coarse-to-fine'), 'profile_settings',
+                    unicode, u'None',
+                    possible_values=(u'None', u'2x', u'4x')))
+        self._add_setting(
+            Setting('multi_peak_enable_calibration', _('Enable multi peak'),
+                    'profile_settings', bool, False))
+        self._add_setting(
+            Setting('confidence_value_calibration', _('Min confidence (%)'), 'profile_settings',
+                    int, 0, min_value=0, max_value=100))
 
         # -------- Scanning --------
         self._add_setting(
@@ -417,6 +433,16 @@ class Settings(collections.MutableMapping):
             Setting('refinement_scanning', _('Refinement'), 'profile_settings',
                     unicode, u'SGF',
                     possible_values=(u'None', u'SGF')))
+        self._add_setting(
+            Setting('pyramid_scanning', _('Coarse-to-fine'), 'profile_settings',
+                    unicode, u'None',
+                    possible_values=(u'None', u'2x', u'4x')))
+        self._add_setting(
+            Setting('multi_peak_enable_scanning', _('Enable multi peak'),
+                    'profile_settings', bool, False))
+        self._add_setting(
+            Setting('confidence_value_scanning', _('Min confidence (%)'), 'profile_settings',
+                    int, 0, min_value=0, max_value=100))
 
 
         # ==================== CONTROL workbench ================
@@ -583,6 +609,13 @@ class Settings(collections.MutableMapping):
         self._add_setting(
             Setting('camera_capture_before_set', _('Capture a frame right after connect before setting camera'), 'profile_settings', bool, False))
 
+        # Camera limits probed at first connect
+        # { device identity: { 'backend', 'max_brightness', ... } }
+        self._add_setting(
+            Setting('camera_probe_cache', 'Camera probe cache', 'preferences', dict, {}))
+        self._add_setting(
+            Setting('camera_reprobe_button', _('Re-probe camera'), 'no_settings', unicode, u''))
+
         self._add_setting(
             Setting('camera_width', _('Width'), 'calibration_settings',
                     int, -1, min_value=-1, max_value=10000))
@@ -590,6 +623,11 @@ class Settings(collections.MutableMapping):
             Setting('camera_height', _('Height'), 'calibration_settings',
                     int, -1, min_value=-1, max_value=10000))
 
+        # MJPG reaches high frame rates at high resolutions on most UVC cameras
+        self._add_setting(
+            Setting('camera_pixel_format', _('Pixel format'), 'calibration_settings',
+                    unicode, u'Default', possible_values=(u'Default', u'MJPG', u'YUYV')))
+
         self._add_setting(
             Setting('camera_focus', _('Manual focus'), 'calibration_settings',
                     int, 0, min_value=0, max_value=255))
@@ -639,7 +677,8 @@ class Settings(collections.MutableMapping):
                     unicode, u'scan_parameters',
                     possible_values=(u'scan_parameters', u'rotating_platform',
                                      u'point_cloud_roi', u'point_cloud_color', 
-                                     u'photogrammetry', u'mesh_correction')))
+                                     u'photogrammetry', u'mesh_correction',
+                                     u'point_cloud_filter', u'point_cloud_mesh')))
 
         self._add_setting(
             Setting('view_scanning_panel', _('View scanning panel'), 'preferences', bool, False))
@@ -669,6 +708,12 @@ class Settings(collections.MutableMapping):
         self._add_setting(
             Setting('use_laser', _('Use laser'), 'profile_settings',
                     unicode, u'Both', possible_values=(u'Left', u'Right', u'Both')))
+        self._add_setting(
+            Setting('preview_voxel_size', _('Preview voxel (mm)'), 'profile_settings',
+                    float, 0.0, min_value=0.0, max_value=10.0))
+        self._add_setting(
+            Setting('point_budget', _('Point budget while moving view'), 'profile_settings',
+                    int, 2000000, min_value=0, max_value=100000000))
 
         # ----------- Rotating platform ----------
         self._add_setting(
@@ -708,6 +753,10 @@ class Settings(collections.MutableMapping):
         self._add_setting(
             Setting('point_cloud_color_r', _('Right color'), 'profile_settings',
                     list, [0,255,255]))
+        self._add_setting(
+            Setting('view_color_mode', _('View color'), 'profile_settings',
+                    unicode, u'Texture',
+                    possible_values=(u'Texture', u'Laser', u'Slice', u'Height')))
 
         # ------------- Photogrammetry ---------------
         self._add_setting(
@@ -727,6 +776,45 @@ class Settings(collections.MutableMapping):
             Setting('mesh_correction_apply', _('Apply'), 'no_settings', unicode, u''))
         self._add_setting(
             Setting('mesh_correction_reset', _('Reset'), 'no_settings', unicode, u''))
+        self._add_setting(
+            Setting('mesh_retriangulate', _('Apply current calibration'), 'no_settings', unicode, u''))
+
+        # ------------- Point cloud filter ---------------
+        self._add_setting(
+            Setting('filter_sor_k', _('Neighbours'), 'profile_settings',
+                    int, 8, min_value=1, max_value=100))
+        self._add_setting(
+            Setting('filter_sor_std_ratio', _('Std deviation ratio'), 'profile_settings',
+                    float, 2.0, min_value=0.0, max_value=10.0))
+        self._add_setting(
+            Setting('filter_sor_apply', _('Remove statistical outliers'), 'no_settings', unicode, u''))
+        self._add_setting(
+            Setting('filter_radius', _('Radius (mm)'), 'profile_settings',
+                    float, 1.0, min_value=0.01, max_value=50.0))
+        self._add_setting(
+            Setting('filter_radius_neighbors', _('Min neighbours'), 'profile_settings',
+                    int, 3, min_value=1, max_value=100))
+        self._add_setting(
+            Setting('filter_radius_apply', _('Remove radius outliers'), 'no_settings', unicode, u''))
+        self._add_setting(
+            Setting('filter_voxel_size', _('Voxel size (mm)'), 'profile_settings',
+                    float, 0.5, min_value=0.01, max_value=50.0))
+        self._add_setting(
+            Setting('filter_voxel_apply', _('Voxel downsample'), 'no_settings', unicode, u''))
+
+        # ------------- Point cloud meshing ---------------
+        self._add_setting(
+            Setting('mesh_max_edge', _('Max edge length (mm)'), 'profile_settings',
+                    float, 3.0, min_value=0.0, max_value=100.0))
+        self._add_setting(
+            Setting('mesh_min_angle', _('Min triangle angle (deg)'), 'profile_settings',
+                    float, 5.0, min_value=0.0, max_value=60.0))
+        self._add_setting(
+            Setting('mesh_close_loop', _('Close last slice to first'), 'profile_settings', bool, True))
+        self._add_setting(
+            Setting('mesh_build', _('Build mesh'), 'no_settings', unicode, u''))
+        self._add_setting(
+            Setting('mesh_show_cloud', _('Show point cloud'), 'no_settings', unicode, u''))
 
         # ----------- Engine ----------
         self._add_setting(
@@ -737,6 +825,14 @@ class Settings(collections.MutableMapping):
             Setting('scan_sync_threads', _('Synchronize capture and process threads'),
                     'profile_settings', bool, False))
 
+        self._add_setting(
+            Setting('scan_range_image', _('Keep range image'),
+                    'profile_settings', bool, False))
+
+        self._add_setting(
+            Setting('scan_save_detections', _('Keep laser detections'),
+                    'profile_settings', bool, False))
+
 
 
         # ========== MACHINE Profile ==============
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# This file is part of the Gryphon Scan Project
+
+__author__ = 'Mikhail N Klimushin aka Night Gryphon <ngryph@gmail.com>'
+__copyright__ = 'Copyright (C) 2019 Night Gryphon'
+__license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
+
+# Cylindrical range image of a scan.
+# Each laser keeps 2D planes indexed by [slice, image row]:
+#   radius - signed distance along the laser line at point height, measured
+#            from the line point closest to the rotation axis. It is plain
+#            radius for laser planes through the axis, signed by axis side
+#   z      - height in platform coordinates
+#   color  - point color
+#   mask   - valid cells
+# Laser plane in platform coordinates restores xyz from (radius, z).
+
+import numpy as np
+
+from horus.util import model
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RangeImage(object):
+
+    def __init__(self, rows, lasers=2, slices=0):
+        self.rows = rows
+        self.lasers = lasers
+        self.slice_count = 0
+        self.theta = np.zeros(slices, np.float32)
+        self.radius = [np.zeros((slices, rows), np.float32) for i in xrange(lasers)]
+        self.z = [np.zeros((slices, rows), np.float32) for i in xrange(lasers)]
+        self.color = [np.zeros((slices, rows, 3), np.uint8) for i in xrange(lasers)]
+        self.mask = [np.zeros((slices, rows), np.bool_) for i in xrange(lasers)]
+        self.planes = [None] * lasers  # (normal, distance) in platform coordinates
+        self._cloud = None
+
+    def set_laser_plane(self, index, normal, distance, rotation=None, translation=None):
+        # Laser plane in camera coordinates moved to platform ones by extrinsics
+        n = np.asarray(normal, np.float64).ravel()
+        d = float(distance)
+        if rotation is not None:
+            R = np.asarray(rotation, np.float64)
+            t = np.asarray(translation, np.float64).ravel()
+            d -= n.dot(t)
+            n = R.T.dot(n)
+        self.planes[index] = (n, d)
+        self._cloud = None
+
+    def _line(self, index):
+        # horizontal unit direction of laser line and line offset per unit of height
+        n, d = self.planes[index]
+        a2 = n[0] ** 2 + n[1] ** 2
+        h = np.array([-n[1], n[0]]) / np.sqrt(a2)
+        return n, d, a2, h
+
+    def _reserve(self, slices):
+        capacity = len(self.theta)
+        if slices <= capacity:
+            return
+        capacity = max(slices, 2 * capacity, 64)
+        self.theta = np.resize(self.theta, capacity)
+        for i in xrange(self.lasers):
+            for planes in (self.radius, self.z, self.color, self.mask):
+                grown = np.zeros((capacity,) + planes[i].shape[1:], planes[i].dtype)
+                grown[:self.slice_count] = planes[i][:self.slice_count]
+                planes[i] = grown
+
+    def add_slice(self, index, slice_no, theta, v, point_cloud, color):
+        # point_cloud - 3xN model coordinates of points detected at image rows v
+        # color - 3xN uint8
+        if self.planes[index] is None:
+            logger.error("Range image: laser {0} plane is not set".format(index))
+            return
+        self._reserve(slice_no + 1)
+        self.theta[slice_no] = theta
+        self.slice_count = max(self.slice_count, slice_no + 1)
+        self._cloud = None
+        if point_cloud is None or len(v) == 0:
+            return
+
+        # back to platform coordinates. Model = Rz(-theta) * platform
+        c, s = np.cos(theta), np.sin(theta)
+        x = c * point_cloud[0] - s * point_cloud[1]
+        y = s * point_cloud[0] + c * point_cloud[1]
+        n, d, a2, h = self._line(index)
+
+        rows = np.asarray(v).astype(np.int64)
+        self.radius[index][slice_no, rows] = x * h[0] + y * h[1]
+        self.z[index][slice_no, rows] = point_cloud[2]
+        self.color[index][slice_no, rows] = np.asarray(color).T
+        self.mask[index][slice_no, rows] = True
+
+    def point_count(self):
+        return sum(int(np.count_nonzero(m[:self.slice_count])) for m in self.mask)
+
+    # ================================================
+    # Lazy conversion to points
+
+    def get_laser_point_cloud(self, index):
+        # (vertexes Nx3 float32, colors Nx3 uint8, meta) of single laser in model coordinates
+        slice_no, row = np.nonzero(self.mask[index][:self.slice_count])
+        radius = self.radius[index][slice_no, row]
+        z = self.z[index][slice_no, row]
+
+        n, d, a2, h = self._line(index)
+        offset = (d - n[2] * z) / a2
+        x = offset * n[0] + radius * h[0]
+        y = offset * n[1] + radius * h[1]
+
+        theta = self.theta[slice_no]
+        c, s = np.cos(theta), np.sin(theta)
+        vertexes = np.empty((len(z), 3), np.float32)
+        vertexes[:, 0] = c * x + s * y
+        vertexes[:, 1] = c * y - s * x
+        vertexes[:, 2] = z
+
+        meta = np.empty(len(z), dtype=model.Mesh().vertexes_meta.dtype)
+        meta['laser_id'] = index
+        meta['slice_no'] = slice_no
+        meta['slice_l'] = theta
+        return vertexes, self.color[index][slice_no, row], meta
+
+    def get_point_cloud(self):
+        # all lasers point cloud. Cached until range image changes
+        if self._cloud is None:
+            clouds = [self.get_laser_point_cloud(i)
+                      for i in xrange(self.lasers) if self.planes[i] is not None]
+            if len(clouds) == 0:
+                return None
+            self._cloud = tuple(np.concatenate(c) for c in zip(*clouds))
+        return self._cloud
+
+    def get_model(self):
+        # point cloud Model for viewer, export and meshing
+        obj = model.Model(None, is_point_cloud=True)
+        m = obj._add_mesh()
+        cloud = self.get_point_cloud()
+        if cloud is not None:
+            m.vertexes, m.colors, m.vertexes_meta = [np.copy(a) for a in cloud]
+            m.vertex_count = len(m.vertexes)
+            obj._post_process_after_load()
+        return obj
+
+    # ================================================
+    # Image space operations
+
+    def median_filter(self, size=3):
+        # Median of valid radius values in size x size window (slices x rows)
+        r = size // 2
+        for i in xrange(self.lasers):
+            mask = self.mask[i][:self.slice_count]
+            if not np.any(mask):
+                continue
+            radius = np.where(mask, self.radius[i][:self.slice_count], np.nan)
+            padded = np.pad(radius, r, 'constant', constant_values=np.nan)
+            slices, rows = radius.shape
+            window = np.array([padded[ds:ds + slices, dr:dr + rows]
+                               for ds in xrange(size) for dr in xrange(size)])
+            self.radius[i][:self.slice_count][mask] = np.nanmedian(window[:, mask], axis=0)
+        self._cloud = None
+
+    def fill_holes(self, max_gap=2):
+        # Fill up to max_gap invalid rows between valid rows of same slice
+        rows = np.arange(self.rows)
+        for i in xrange(self.lasers):
+            mask = self.mask[i][:self.slice_count]
+            prev = np.maximum.accumulate(np.where(mask, rows, -1), axis=1)
+            next = np.minimum.accumulate(np.where(mask, rows, self.rows)[:, ::-1], axis=1)[:, ::-1]
+            fill = ~mask & (prev >= 0) & (next < self.rows) & (next - prev <= max_gap + 1)
+            if not np.any(fill):
+                continue
+            slice_no, row = np.nonzero(fill)
+            p, q = prev[fill], next[fill]
+            w = ((row - p).astype(np.float32) / (q - p))
+            for plane in (self.radius[i], self.z[i]):
+                plane[slice_no, row] = plane[slice_no, p] * (1 - w) + plane[slice_no, q] * w
+            color = self.color[i]
+            color[slice_no, row] = np.around(color[slice_no, p] * (1 - w[:, np.newaxis]) +
+                                             color[slice_no, q] * w[:, np.newaxis])
+            self.mask[i][slice_no, row] = True
+        self._cloud = None
+
+    def downsample(self, rows=2, slices=1):
+        # New range image averaging valid cells of rows x slices blocks
+        count = self.slice_count // slices
+        result = RangeImage(self.rows // rows, self.lasers, count)
+        result.slice_count = count
+        result.planes = list(self.planes)
+        result.theta = self.theta[:count * slices].reshape(count, slices).mean(axis=1)
+        shape = (count, slices, result.rows, rows)
+
+        for i in xrange(self.lasers):
+            area = (slice(0, count * slices), slice(0, result.rows * rows))
+            mask = self.mask[i][area].reshape(shape)
+            n = mask.sum(axis=(1, 3))
+            valid = n > 0
+            n = np.maximum(n, 1)
+            for src, dst in ((self.radius, result.radius), (self.z, result.z)):
+                dst[i][:] = np.where(mask, src[i][area].reshape(shape), 0).sum(axis=(1, 3)) / n
+            color = np.where(mask[..., np.newaxis], self.color[i][area].reshape(shape + (3,)), 0)
+            result.color[i][:] = np.around(color.sum(axis=(1, 3)) / n[..., np.newaxis])
+            result.mask[i][:] = valid
+        return result
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# This file is part of the Gryphon Scan Project
+
+__author__ = 'Mikhail N Klimushin aka Night Gryphon <ngryph@gmail.com>'
+__copyright__ = 'Copyright (C) 2019 Night Gryphon'
+__license__ = 'GNU General Public License v2 http://www.gnu.org/licenses/gpl2.html'
+
+# Frame time of point cloud VBO rendering: single draw call vs legacy batches.
+# Runs on offscreen OSMesa context, software rendering is fine:
+#   python test/benchmark_vbo_render.py [points] [frames]
+
+import os
+import sys
+import time
+
+os.environ['PYOPENGL_PLATFORM'] = 'osmesa'
+
+import numpy as np
+
+from OpenGL import GL, arrays, osmesa
+
+WIDTH, HEIGHT = 640, 480
+
+
+def make_context():
+    ctx = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 8, 0, None)
+    buf = arrays.GLubyteArray.zeros((HEIGHT, WIDTH, 4))
+    if not osmesa.OSMesaMakeCurrent(ctx, buf, GL.GL_UNSIGNED_BYTE, WIDTH, HEIGHT):
+        raise RuntimeError("Can not make OSMesa context current")
+    return ctx, buf
+
+
+def frame_time(vbo, shader, frames):
+    shader.bind()
+    vbo.render()
+    GL.glFinish()
+    begin = time.time()
+    for i in xrange(frames):
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+        vbo.render()
+        GL.glFinish()
+    shader.unbind()
+    return (time.time() - begin) / frames
+
+
+def main(points=4000000, frames=20):
+    ctx, buf = make_context()
+    from horus.gui.util import opengl_helpers
+
+    shader = opengl_helpers.GLShader(
+        """
+        void main(void)
+        {
+            gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
+            gl_FrontColor = gl_Color;
+        }
+        """,
+        """
+        void main(void)
+        {
+            gl_FragColor = gl_Color;
+        }
+        """)
+    if not shader.is_valid():
+        shader = opengl_helpers.GLFakeShader()
+
+    GL.glViewport(0, 0, WIDTH, HEIGHT)
+    GL.glEnable(GL.GL_DEPTH_TEST)
+    vertexes = (np.random.rand(points, 3) * 2 - 1).astype(np.float32)
+    colors = np.random.randint(0, 256, (points, 3)).astype(np.uint8)
+    vbo = opengl_helpers.GLVBO(GL.GL_POINTS, vertexes, color_array=colors, point_size=1)
+
+    print "{0} points, {1} frames".format(points, frames)
+    for single_draw in (False, True):
+        vbo._single_draw = single_draw
+        t = frame_time(vbo, shader, frames)
+        print "{0:>12}: {1:8.2f} ms/frame".format(
+            'single draw' if single_draw else 'batches', t * 1000)
+
+    vbo.release()
+    shader.release()
+    osmesa.OSMesaDestroyContext(ctx)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,43 @@
+import time
+import unittest
+from horus.engine.driver.frame_grabber import FrameGrabber
+
+
+class FakeCapture(object):
+
+    def __init__(self, period=0.01):
+        self.period = period
+        self.count = 0
+
+    def read(self):
+        time.sleep(self.period)
+        self.count += 1
+        return True, self.count
+
+
+class FrameGrabberTest(unittest.TestCase):
+
+    def setUp(self):
+        self.capture = FakeCapture()
+        self.grabber = FrameGrabber(self.capture.read)
+        self.grabber.start()
+
+    def tearDown(self):
+        self.grabber.stop()
+
+    def test_frame_after_time(self):
+        time.sleep(0.1)
+        after = time.time()
+        sequence, timestamp, frame = self.grabber.get_frame(after)
+        self.assertGreaterEqual(timestamp - self.grabber.period, after)
+        self.assertEqual(sequence, frame)
+
+    def test_skip_frames(self):
+        after = time.time()
+        first = self.grabber.get_frame(after)
+        skipped = self.grabber.get_frame(after, skip=2)
+        self.assertEqual(skipped[0], first[0] + 2)
+
+    def test_timeout(self):
+        self.grabber.stop()
+        self.assertIsNone(self.grabber.get_frame(time.time(), timeout=0.05))
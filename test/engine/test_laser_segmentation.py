@@ -0,0 +1,163 @@
+import unittest
+import numpy as np
+from horus.engine.algorithms.laser_segmentation import LaserSegmentation
+
+
+class LaserSegmentationPyramidTest(unittest.TestCase):
+
+    width = 1280
+    height = 960
+
+    def setUp(self):
+        self.laser_segmentation = LaserSegmentation()
+        calibration_data = self.laser_segmentation.calibration_data
+        self.addCleanup(calibration_data.set_resolution, calibration_data.width, calibration_data.height)
+        calibration_data.set_resolution(self.width, self.height)
+        self.laser_segmentation.point_cloud_roi.set_use_roi(False)
+        self.laser_segmentation.set_laser_color_detector('R (RGB)')
+        self.laser_segmentation.set_threshold_enable(True)
+        self.laser_segmentation.set_threshold_value(50)
+        self.laser_segmentation.set_blur_enable(True)
+        self.laser_segmentation.set_blur_value(2)
+        self.laser_segmentation.set_window_enable(True)
+        self.laser_segmentation.set_window_value(8)
+        self.laser_segmentation.set_refinement_method('None')
+        self.image = self._stripe_image()
+
+    def tearDown(self):
+        self.laser_segmentation.set_pyramid('None')
+
+    def _stripe_image(self):
+        # Slanted gaussian stripe with a gap in the middle
+        v = np.arange(self.height)
+        center = 500.0 + 0.15 * v + 20 * np.sin(v / 80.0)
+        u = np.arange(self.width)
+        stripe = 230 * np.exp(-0.5 * ((u[np.newaxis, :] - center[:, np.newaxis]) / 1.5) ** 2)
+        stripe[400:450] = 0
+        image = np.zeros((self.height, self.width, 3), np.uint8)
+        image[:, :, 0] = stripe.astype(np.uint8)
+        image[:, :, 1] = 10
+        return image
+
+    def _compare(self, pyramid, scale):
+        self.laser_segmentation.set_pyramid('None')
+        (u0, v0), _ = self.laser_segmentation.compute_2d_points(self.image)
+        self.laser_segmentation.set_pyramid(pyramid)
+        (u1, v1), image = self.laser_segmentation.compute_2d_points(self.image)
+
+        self.assertEqual(image.shape, (self.height, self.width))
+        # Only rows extended by the blur at the stripe gap may differ
+        v, i0, i1 = np.intersect1d(v0, v1, return_indices=True)
+        self.assertLessEqual(len(v0) - len(v), scale)
+        self.assertLessEqual(len(v1) - len(v), scale)
+        self.assertLess(np.max(np.abs(u0[i0] - u1[i1])), 0.1)
+
+    def test_pyramid_2x(self):
+        self._compare('2x', 2)
+
+    def test_pyramid_4x(self):
+        self._compare('4x', 4)
+
+    def test_pyramid_hsv(self):
+        self.laser_segmentation.set_laser_color_detector('R (HSV)')
+        self._compare('4x', 4)
+
+    def test_pyramid_empty_image(self):
+        self.laser_segmentation.set_pyramid('4x')
+        image = np.zeros((self.height, self.width, 3), np.uint8)
+        (u, v), _ = self.laser_segmentation.compute_2d_points(image)
+        self.assertEqual(len(u), 0)
+        self.assertEqual(len(v), 0)
+
+
+class LaserSegmentationMultiPeakTest(unittest.TestCase):
+
+    width = 640
+    height = 480
+
+    def setUp(self):
+        self.laser_segmentation = LaserSegmentation()
+        calibration_data = self.laser_segmentation.calibration_data
+        self.addCleanup(calibration_data.set_resolution, calibration_data.width, calibration_data.height)
+        calibration_data.set_resolution(self.width, self.height)
+        self.laser_segmentation.point_cloud_roi.set_use_roi(False)
+        self.laser_segmentation.set_laser_color_detector('R (RGB)')
+        self.laser_segmentation.set_threshold_enable(True)
+        self.laser_segmentation.set_threshold_value(50)
+        self.laser_segmentation.set_blur_enable(False)
+        self.laser_segmentation.set_window_enable(True)
+        self.laser_segmentation.set_window_value(5)
+        self.laser_segmentation.set_refinement_method('None')
+        self.laser_segmentation.set_pyramid('None')
+        self.center = 300.0 + 0.1 * np.arange(self.height)
+        self.image = self._reflection_image()
+
+    def tearDown(self):
+        self.laser_segmentation.set_multi_peak_enable(False)
+        self.laser_segmentation.set_confidence_value(0)
+
+    def _stripe(self, center, intensity):
+        u = np.arange(self.width)
+        return intensity * np.exp(-0.5 * ((u[np.newaxis, :] - center[:, np.newaxis]) / 1.5) ** 2)
+
+    def _reflection_image(self):
+        # Laser line plus a brighter reflection in a few rows
+        stripe = self._stripe(self.center, 200)
+        reflection = self._stripe(self.center + 120, 240)
+        reflection[:200] = 0
+        reflection[220:] = 0
+        image = np.zeros((self.height, self.width, 3), np.uint8)
+        image[:, :, 0] = np.maximum(stripe, reflection).astype(np.uint8)
+        return image
+
+    def test_window_follows_reflection(self):
+        (u, v), _ = self.laser_segmentation.compute_2d_points(self.image)
+        self.assertGreater(np.max(np.abs(u - self.center[v])), 100)
+
+    def test_multi_peak_selects_line(self):
+        self.laser_segmentation.set_multi_peak_enable(True)
+        (u, v, confidence), _ = self.laser_segmentation.compute_2d_points_confidence(self.image)
+        self.assertEqual(len(v), self.height)
+        self.assertLess(np.max(np.abs(u - self.center[v])), 0.25)
+        self.assertEqual(confidence.shape, u.shape)
+        # Rows with a reflection are less confident
+        self.assertLess(np.max(confidence[200:220]), np.min(confidence[:200]))
+
+    def test_multi_peak_pyramid(self):
+        self.laser_segmentation.set_multi_peak_enable(True)
+        self.laser_segmentation.set_pyramid('2x')
+        (u, v), _ = self.laser_segmentation.compute_2d_points(self.image)
+        self.laser_segmentation.set_pyramid('None')
+        self.assertLess(np.max(np.abs(u - self.center[v])), 0.25)
+
+    def test_confidence_filter(self):
+        self.laser_segmentation.set_multi_peak_enable(True)
+        self.laser_segmentation.set_confidence_value(50)
+        (u, v), _ = self.laser_segmentation.compute_2d_points(self.image)
+        self.assertEqual(len(np.intersect1d(v, np.arange(200, 220))), 0)
+        self.assertEqual(len(v), self.height - 20)
+
+    def test_dim_stripe_confident(self):
+        # Single clean stripe: confidence does not depend on its brightness
+        self.laser_segmentation.set_multi_peak_enable(True)
+        self.laser_segmentation.set_threshold_value(30)
+        self.laser_segmentation.set_confidence_value(50)
+        image = np.zeros((self.height, self.width, 3), np.uint8)
+        image[:, :, 0] = self._stripe(self.center, 90).astype(np.uint8)
+        (u, v, confidence), _ = self.laser_segmentation.compute_2d_points_confidence(image)
+        self.assertEqual(len(v), self.height)
+        self.assertGreater(np.min(confidence), 0.95)
+
+    def test_pyramid_confidence_at_gap(self):
+        # Rows next to coarse rows without stripe keep confidence of found row
+        self.laser_segmentation.set_multi_peak_enable(True)
+        self.laser_segmentation.set_pyramid('4x')
+        stripe = self._stripe(self.center, 150)
+        stripe[101:150] = 0
+        image = np.zeros((self.height, self.width, 3), np.uint8)
+        image[:, :, 0] = stripe.astype(np.uint8)
+        (u, v, confidence), _ = self.laser_segmentation.compute_2d_points_confidence(image)
+        self.laser_segmentation.set_pyramid('None')
+        _, edge, _ = np.intersect1d(v, [96, 97, 98, 99, 100, 150, 151, 152], return_indices=True)
+        self.assertEqual(len(edge), 8)
+        self.assertGreater(np.min(confidence[edge]), 0.95)
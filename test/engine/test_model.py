@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from horus.util.model import Mesh, UNKNOWN_SLICE_L
+from horus.util.mesh_loaders import ply
+
+
+def shader_positions(mesh, correction):
+    # vertex positions as computed by scene view point cloud shader
+    slice_l, laser_id = mesh.get_shader_attributes()
+    known = (slice_l >= -7.0)[:, np.newaxis]
+    c = np.cos(slice_l)[:, np.newaxis]
+    s = np.sin(slice_l)[:, np.newaxis]
+    offset = np.hstack((c * correction[0] + s * correction[1],
+                        c * correction[1] - s * correction[0],
+                        np.ones_like(c) * correction[2]))
+    return mesh.get_vertexes() + known * offset
+
+
+class MeshShaderAttributesTest(unittest.TestCase):
+
+    def test_cloud_without_meta(self):
+        mesh = Mesh()
+        points = np.random.uniform(-50, 50, (100, 3)).astype(np.float32)
+        mesh.add_pointcloud(points, np.zeros((100, 3), np.uint8))
+        slice_l, laser_id = mesh.get_shader_attributes()
+        self.assertTrue(np.all(slice_l == UNKNOWN_SLICE_L))
+        positions = shader_positions(mesh, [1.0, 2.0, 3.0])
+        self.assertTrue(np.allclose(positions, points))
+
+    def test_ply_without_slice_data(self):
+        points = np.random.uniform(-50, 50, (100, 3))
+        data = np.empty(100, dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4')])
+        data['x'], data['y'], data['z'] = points.T
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            data.tofile(filename)
+            mesh = Mesh()
+            with open(filename, 'rb') as f:
+                ply._load_binary_vertex(mesh, f, data.dtype, 100)
+        finally:
+            os.remove(filename)
+        positions = shader_positions(mesh, [0.0, 0.0, 0.0])
+        self.assertTrue(np.all(np.isfinite(positions)))
+        self.assertTrue(np.allclose(positions, points, atol=1e-4))
+
+    def test_known_slice_corrected(self):
+        mesh = Mesh()
+        points = np.zeros((2, 3), np.float32)
+        mesh.add_pointcloud(points[:1], np.zeros((1, 3), np.uint8), (0, 0, 0.0))
+        mesh.add_pointcloud(points[1:], np.zeros((1, 3), np.uint8), (1, 1, np.pi / 2))
+        positions = shader_positions(mesh, [1.0, 0.0, 0.5])
+        self.assertTrue(np.allclose(positions, [[1, 0, 0.5], [0, -1, 0.5]], atol=1e-6))
+
+    def test_appended_slices_converted(self):
+        mesh = Mesh()
+        points = np.zeros((10, 3), np.float32)
+        mesh.add_pointcloud(points, np.zeros((10, 3), np.uint8))
+        mesh.get_shader_attributes()
+        mesh.add_pointcloud(points, np.zeros((10, 3), np.uint8), (1, 0, 0.5))
+        slice_l, laser_id = mesh.get_shader_attributes()
+        self.assertTrue(np.all(slice_l == [UNKNOWN_SLICE_L] * 10 + [0.5] * 10))
+        self.assertTrue(np.all(laser_id == [-1] * 10 + [1] * 10))
+        # in-place changes are seen after clear_vbo()
+        mesh.vertexes_meta['slice_l'][:5] = 1.0
+        mesh.clear_vbo()
+        slice_l, laser_id = mesh.get_shader_attributes()
+        self.assertTrue(np.all(slice_l[:5] == 1.0))
+        self.assertTrue(np.all(slice_l[5:10] == UNKNOWN_SLICE_L))
+
+
+class MeshAddPointCloudTest(unittest.TestCase):
+
+    def test_append_slices(self):
+        mesh = Mesh()
+        points = np.random.uniform(-50, 50, (100, 30, 3)).astype(np.float32)
+        for i in xrange(100):
+            mesh.add_pointcloud(points[i], np.full((30, 3), i, np.uint8), (0, i, i * 0.1))
+        self.assertEqual(mesh.vertex_count, 3000)
+        self.assertTrue(np.all(mesh.get_vertexes() == points.reshape(-1, 3)))
+        self.assertTrue(np.all(mesh.colors[:3000, 0] == np.repeat(np.arange(100), 30)))
+        self.assertTrue(np.all(mesh.get_meta()['slice_no'] == np.repeat(np.arange(100), 30)))
@@ -0,0 +1,101 @@
+import unittest
+import numpy as np
+from horus.util import model
+from horus.util import point_cloud_filter
+
+
+class OutlierRemovalTest(unittest.TestCase):
+
+    def setUp(self):
+        # Dense cylinder surface and a few isolated points around it
+        theta, z = np.meshgrid(np.linspace(0, 2 * np.pi, 200, endpoint=False),
+                               np.arange(0, 50, 2.0))
+        theta, z = theta.ravel(), z.ravel()
+        self.inliers = np.column_stack((30 * np.cos(theta), 30 * np.sin(theta), z))
+        self.outliers = np.array([[0, 0, 25], [60, 0, 10], [-45, 45, 40],
+                                  [0, -70, 5], [10, 10, 90], [-80, -5, 30]], np.float64)
+        points = np.vstack((self.inliers, self.outliers)).astype(np.float32)
+        self.mesh = model.Mesh()
+        self.mesh.add_pointcloud(points, np.zeros((len(points), 3), np.uint8),
+                                 (0, 1, 0.0))
+        self.mesh.colors[len(self.inliers):] = 255
+
+    def _check(self, removed):
+        self.assertEqual(removed, len(self.outliers))
+        self.assertEqual(self.mesh.vertex_count, len(self.inliers))
+        self.assertTrue(np.allclose(self.mesh.get_vertexes(), self.inliers, atol=1e-4))
+        self.assertTrue(np.all(self.mesh.colors == 0))
+        self.assertEqual(len(self.mesh.get_meta()), len(self.inliers))
+
+    def test_statistical_outliers(self):
+        self._check(point_cloud_filter.remove_statistical_outliers(self.mesh, k=8, std_ratio=2.0))
+
+    def test_radius_outliers(self):
+        self._check(point_cloud_filter.remove_radius_outliers(self.mesh, radius=3.0, min_neighbors=3))
+
+    def test_chunked_masks(self):
+        points = self.mesh.get_vertexes()
+        self.assertTrue(np.all(
+            point_cloud_filter.statistical_outlier_mask(points, chunk_size=1000) ==
+            point_cloud_filter.statistical_outlier_mask(points)))
+        self.assertTrue(np.all(
+            point_cloud_filter.radius_outlier_mask(points, 3.0, chunk_size=1000) ==
+            point_cloud_filter.radius_outlier_mask(points, 3.0)))
+
+
+class VoxelGridTest(unittest.TestCase):
+
+    def _reference(self, points, colors, voxel_size):
+        # single pass mean of each voxel, voxels sorted by key
+        keys = point_cloud_filter.voxel_keys(points, voxel_size)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        count = np.bincount(inverse)
+        xyz = np.column_stack([np.bincount(inverse, points[:, i]) for i in xrange(3)])
+        rgb = np.column_stack([np.bincount(inverse, colors[:, i]) for i in xrange(3)])
+        return xyz / count[:, np.newaxis], np.around(rgb / count[:, np.newaxis]), inverse
+
+    def test_chunks_match_single_pass(self):
+        np.random.seed(1)
+        # few voxels, so each voxel gets points from many chunks
+        points = np.random.uniform(-10, 10, (20000, 3))
+        colors = np.random.randint(0, 256, (20000, 3)).astype(np.uint8)
+        meta = np.arange(20000)
+        xyz, rgb, inverse = self._reference(points, colors, 4.0)
+
+        vertexes, vcolors, vmeta = point_cloud_filter.voxel_downsample(
+            points, colors, meta, voxel_size=4.0, chunk_size=777)
+        self.assertEqual(len(vertexes), len(xyz))
+        # voxels are in order of creation
+        order = np.argsort(point_cloud_filter.voxel_keys(vertexes, 4.0))
+        vertexes, vcolors, vmeta = vertexes[order], vcolors[order], vmeta[order]
+        self.assertLess(np.max(np.abs(vertexes - xyz)), 1e-5)
+        self.assertTrue(np.all(vcolors == rgb))
+        # meta of first point of each voxel
+        first = np.full(len(xyz), len(points))
+        np.minimum.at(first, inverse, meta)
+        self.assertTrue(np.all(vmeta == first))
+
+    def test_grid_add(self):
+        points = np.array([[0.1, 0.1, 0.1], [5.5, 0, 0], [0.9, 0.9, 0.9], [5.1, 0.2, 0.4]])
+        colors = np.array([[0, 0, 0], [100, 0, 0], [10, 20, 30], [200, 0, 0]], np.uint8)
+        grid = point_cloud_filter.VoxelGrid(1.0)
+        for i in xrange(len(points)):
+            grid.add(points[i:i + 1], colors[i:i + 1])
+        self.assertEqual(len(grid), 2)
+        self.assertTrue(np.allclose(grid.get_vertexes(), [[0.5, 0.5, 0.5], [5.3, 0.1, 0.2]]))
+        self.assertTrue(np.all(grid.get_colors() == [[5, 10, 15], [150, 0, 0]]))
+
+    def test_new_voxels_appended(self):
+        # voxels of earlier chunks keep their place, new ones go to the end
+        np.random.seed(2)
+        grid = point_cloud_filter.VoxelGrid(1.0)
+        points = np.random.uniform(-20, 20, (5000, 3))
+        colors = np.zeros((5000, 3), np.uint8)
+        keys = point_cloud_filter.voxel_keys(points, 1.0)
+        expected = np.empty(0, np.int64)
+        for i in xrange(0, 5000, 50):
+            grid.add(points[i:i + 50], colors[i:i + 50])
+            # new voxels of chunk in key order
+            new = np.setdiff1d(keys[i:i + 50], expected)
+            expected = np.concatenate((expected, new))
+            self.assertTrue(np.all(grid.keys[:len(grid)] == expected))
@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from horus.engine.algorithms.point_cloud_generation import PointCloudGeneration, \
+    make_detections
+
+
+class PointCloudGenerationDetectionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.point_cloud_generation = PointCloudGeneration()
+        calibration_data = self.point_cloud_generation.calibration_data
+        self._save_calibration(calibration_data)
+        calibration_data.set_resolution(1280, 960)
+        calibration_data.camera_matrix = np.array([[1430., 0, 640], [0, 1430, 480], [0, 0, 1]])
+        calibration_data.distortion_vector = np.array([0.1, -0.2, 0.001, 0.002, 0.05])
+        for plane, normal, distance in zip(calibration_data.laser_planes,
+                                           ([0.6, 0.02, 0.8], [-0.6, 0.01, 0.8]),
+                                           (150.0, 148.0)):
+            plane.normal = np.array(normal) / np.linalg.norm(normal)
+            plane.distance = distance
+        calibration_data.platform_rotation = np.array([[0, 1, 0], [0.1, 0, -1], [-1, 0, -0.1]])
+        calibration_data.platform_translation = np.array([5.0, 80.0, 320.0])
+
+    def _save_calibration(self, calibration_data):
+        # CalibrationData is a singleton shared with other tests: restore it
+        state = dict(vars(calibration_data))
+        planes = [(plane.normal, plane.distance) for plane in calibration_data.laser_planes]
+        self.addCleanup(self._restore_calibration, calibration_data, state, planes)
+
+    @staticmethod
+    def _restore_calibration(calibration_data, state, planes):
+        vars(calibration_data).update(state)
+        for plane, (normal, distance) in zip(calibration_data.laser_planes, planes):
+            plane.normal = normal
+            plane.distance = distance
+
+    def test_detections_match_slices(self):
+        v = np.arange(0, 960, 4).astype(np.float32)
+        detections = []
+        expected = []
+        for slice_no in xrange(20):
+            theta = slice_no * 2 * np.pi / 20
+            for index in xrange(2):
+                u = 600 + 30 * np.sin(v / 100.0 + slice_no)
+                texture = np.zeros((3, len(v)), np.uint8)
+                detections.append(make_detections((u, v), theta, index, slice_no, texture))
+                expected.append(self.point_cloud_generation.compute_point_cloud(
+                    theta, np.array([u, v]), index).T)
+
+        points = self.point_cloud_generation.compute_detections_point_cloud(
+            np.concatenate(detections))
+        self.assertLess(np.max(np.abs(points - np.concatenate(expected))), 1e-3)
+
+    def test_empty_detections(self):
+        points = self.point_cloud_generation.compute_detections_point_cloud(
+            np.concatenate([make_detections(([], []), 0, 0, 0, np.zeros((3, 0), np.uint8))]))
+        self.assertEqual(points.shape, (0, 3))
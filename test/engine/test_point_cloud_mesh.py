@@ -0,0 +1,75 @@
+import unittest
+import numpy as np
+from horus.util import model
+from horus.util.point_cloud_mesh import triangulate, mesh_point_cloud
+
+
+class PointCloudMeshTest(unittest.TestCase):
+
+    slices = 100
+    rows = 100
+
+    def _cylinder(self, radius=30.0, dz=0.5):
+        # single laser scan of a cylinder: slices x rows points
+        mesh = model.Mesh()
+        for slice_no in xrange(self.slices):
+            theta = slice_no * 2 * np.pi / self.slices
+            r = radius(slice_no) if callable(radius) else radius
+            z = np.arange(self.rows) * dz
+            points = np.column_stack((r * np.cos(theta) * np.ones(self.rows),
+                                      r * np.sin(theta) * np.ones(self.rows), z))
+            mesh.add_pointcloud(points.astype(np.float32), np.zeros((self.rows, 3), np.uint8),
+                                (0, slice_no, theta))
+        return mesh
+
+    def _edges(self, triangles):
+        # directed edges of all triangles
+        return np.vstack((triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]))
+
+    def test_cylinder(self):
+        mesh = self._cylinder()
+        triangles = triangulate(mesh.get_vertexes(), mesh.get_meta())
+        # each strip between neighbour slices has 2 * (rows - 1) triangles
+        self.assertEqual(len(triangles), self.slices * 2 * (self.rows - 1))
+        self.assertEqual(len(triangles), 19800)
+
+        # manifold: inner edges are shared by two triangles, rim edges by one.
+        # Consistent winding: no directed edge is repeated
+        directed = self._edges(triangles)
+        self.assertEqual(len(np.unique(directed, axis=0)), len(directed))
+        edges, count = np.unique(np.sort(directed, axis=1), axis=0, return_counts=True)
+        self.assertTrue(np.all(count <= 2))
+        self.assertEqual(np.count_nonzero(count == 1), 2 * self.slices)
+
+    def test_open_loop(self):
+        mesh = self._cylinder()
+        triangles = triangulate(mesh.get_vertexes(), mesh.get_meta(), close_loop=False)
+        self.assertEqual(len(triangles), (self.slices - 1) * 2 * (self.rows - 1))
+
+    def test_max_edge(self):
+        # slice far from the others: its strips have long edges
+        mesh = self._cylinder(lambda slice_no: 40.0 if slice_no == 50 else 30.0)
+        triangles = triangulate(mesh.get_vertexes(), mesh.get_meta(), max_edge=3.0)
+        self.assertEqual(len(triangles), (self.slices - 2) * 2 * (self.rows - 1))
+        slice_no = mesh.get_meta()['slice_no'][triangles]
+        self.assertFalse(np.any(slice_no == 50))
+        triangles = triangulate(mesh.get_vertexes(), mesh.get_meta(), max_edge=0, min_angle=0)
+        self.assertEqual(len(triangles), self.slices * 2 * (self.rows - 1))
+
+    def test_min_angle(self):
+        # rows much closer than slices: thin triangles
+        mesh = self._cylinder(dz=0.05)
+        triangles = triangulate(mesh.get_vertexes(), mesh.get_meta(), min_angle=5.0)
+        self.assertEqual(len(triangles), 0)
+        triangles = triangulate(mesh.get_vertexes(), mesh.get_meta(), min_angle=1.0)
+        self.assertEqual(len(triangles), self.slices * 2 * (self.rows - 1))
+
+    def test_mesh_faces_outside(self):
+        obj = mesh_point_cloud(self._cylinder())
+        self.assertFalse(obj.is_point_cloud())
+        mesh = obj._mesh
+        self.assertEqual(mesh.vertex_count, 3 * 19800)
+        center = mesh.get_vertexes().reshape(-1, 3, 3).mean(axis=1)
+        normal = mesh.normal.reshape(-1, 3, 3)[:, 0]
+        self.assertTrue(np.all(np.sum(normal[:, :2] * center[:, :2], axis=1) > 0))
+        self.assertLess(np.max(np.abs(np.linalg.norm(mesh.normal, axis=1) - 1)), 1e-5)
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from horus.util.point_cloud_tools import fit_clouds
+
+
+def rotations(l):
+    # Mrev of Cloud.make_M
+    c, s = np.cos(l), np.sin(l)
+    return np.array([c, s, -s, c]).T.reshape((-1, 2, 2))
+
+
+class FitCloudsTest(unittest.TestCase):
+
+    def _section(self, t):
+        # object section: rounded non symmetric contour
+        r = 40 + 8 * np.cos(3 * t) + 4 * np.sin(2 * t)
+        return np.column_stack((r * np.cos(t), r * np.sin(t)))
+
+    def _scan(self, t, l, offset):
+        # points of contour seen at slice angles l with platform center offset
+        M = rotations(l)
+        return self._section(t) - np.einsum('ikj,j->ik', M, offset), M
+
+    def test_known_offset(self):
+        offset = np.array([1.5, -0.8])
+        t = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+        # two lasers see each surface point at slice angles 60 deg apart
+        PA, MA = self._scan(t, t, offset)
+        PB, MB = self._scan(t[::2] + 0.001, t[::2] + np.pi / 3, offset)
+        V = fit_clouds(PA, MA, PB, MB)
+        self.assertLess(np.linalg.norm(V - offset), 0.05)
+
+    def test_same_slice_angles(self):
+        # offset is not observable: keep previous estimate
+        t = np.linspace(0, 2 * np.pi, 500, endpoint=False)
+        l = np.full(len(t), 0.3)
+        PA, MA = self._scan(t, l, np.zeros(2))
+        PB, MB = self._scan(t + 0.002, l, np.zeros(2))
+        prev = np.array([0.2, 0.1])
+        V = fit_clouds(PA, MA, PB, MB, prev)
+        self.assertTrue(np.allclose(V, prev))
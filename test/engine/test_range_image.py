@@ -0,0 +1,77 @@
+import unittest
+import numpy as np
+from horus.engine.algorithms.point_cloud_generation import PointCloudGeneration
+from horus.util.range_image import RangeImage
+
+
+class RangeImageRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.point_cloud_generation = PointCloudGeneration()
+        calibration_data = self.point_cloud_generation.calibration_data
+        self._save_calibration(calibration_data)
+        calibration_data.set_resolution(1280, 960)
+        calibration_data.camera_matrix = np.array([[1430., 0, 640], [0, 1430, 480], [0, 0, 1]])
+        calibration_data.distortion_vector = np.array([0.1, -0.2, 0.001, 0.002, 0.05])
+        for plane, normal, distance in zip(calibration_data.laser_planes,
+                                           ([0.6, 0.02, 0.8], [-0.6, 0.01, 0.8]),
+                                           (150.0, 148.0)):
+            plane.normal = np.array(normal) / np.linalg.norm(normal)
+            plane.distance = distance
+        c, s = np.cos(0.1), np.sin(0.1)
+        calibration_data.platform_rotation = np.array([[0, 1, 0], [s, 0, -c], [-c, 0, -s]])
+        calibration_data.platform_translation = np.array([5.0, 80.0, 320.0])
+
+        self.range_image = RangeImage(960, 2)
+        for i, plane in enumerate(calibration_data.laser_planes):
+            self.range_image.set_laser_plane(i, plane.normal, plane.distance,
+                                             calibration_data.platform_rotation,
+                                             calibration_data.platform_translation)
+
+    def _save_calibration(self, calibration_data):
+        # CalibrationData is a singleton shared with other tests: restore it
+        state = dict(vars(calibration_data))
+        planes = [(plane.normal, plane.distance) for plane in calibration_data.laser_planes]
+        self.addCleanup(self._restore_calibration, calibration_data, state, planes)
+
+    @staticmethod
+    def _restore_calibration(calibration_data, state, planes):
+        vars(calibration_data).update(state)
+        for plane, (normal, distance) in zip(calibration_data.laser_planes, planes):
+            plane.normal = normal
+            plane.distance = distance
+
+    def test_round_trip(self):
+        v = np.arange(0, 960, 3)
+        expected = [[], []]
+        for slice_no in xrange(30):
+            theta = slice_no * 2 * np.pi / 30
+            for index in xrange(2):
+                u = 640 + (index * 2 - 1) * (100 + 30 * np.sin(v / 100.0 + slice_no))
+                point_cloud = self.point_cloud_generation.compute_point_cloud(
+                    theta, np.array([u, v]), index)
+                color = np.zeros((3, len(v)), np.uint8)
+                color[index] = slice_no
+                self.range_image.add_slice(index, slice_no, theta, v, point_cloud, color)
+                expected[index].append((point_cloud.T, color.T))
+
+        self.assertEqual(self.range_image.point_count(), 2 * 30 * len(v))
+        for index in xrange(2):
+            # cells are in slice, row order: same as the points were added
+            points = np.concatenate([p for p, c in expected[index]])
+            colors = np.concatenate([c for p, c in expected[index]])
+            vertexes, color, meta = self.range_image.get_laser_point_cloud(index)
+            self.assertLess(np.max(np.abs(vertexes - points)), 4e-5)
+            self.assertTrue(np.all(color == colors))
+            self.assertTrue(np.all(meta['laser_id'] == index))
+            self.assertTrue(np.all(meta['slice_no'] == np.repeat(np.arange(30), len(v))))
+
+    def test_get_model(self):
+        v = np.arange(0, 960, 5)
+        u = 540 + 20 * np.sin(v / 50.0)
+        point_cloud = self.point_cloud_generation.compute_point_cloud(0.5, np.array([u, v]), 0)
+        self.range_image.add_slice(0, 3, 0.5, v, point_cloud, np.zeros((3, len(v)), np.uint8))
+        obj = self.range_image.get_model()
+        self.assertTrue(obj.is_point_cloud())
+        self.assertEqual(obj._mesh.vertex_count, len(v))
+        self.assertLess(np.max(np.abs(obj._mesh.get_vertexes() - point_cloud.T)), 4e-5)